@@ -1,12 +1,13 @@
 """
 Модель для работы с достижениями
 """
-import aiosqlite
 import config
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Set
+from bot.database.db import get_connection
 from bot.utils.logger import logger
+from bot.utils.send_queue import send_queue, PRIORITY_INTERACTIVE
 
-achievements_db = f"{config.DB_PATH}/achievements.db"
+achievements_db = config.ACHIEVEMENTS_DB
 
 
 async def add_achievement(user_id: int, achievement_type: str, achievement_data: str = "") -> int:
@@ -22,7 +23,7 @@ async def add_achievement(user_id: int, achievement_type: str, achievement_data:
         int: ID достижения
     """
     try:
-        async with aiosqlite.connect(achievements_db) as db:
+        async with get_connection(achievements_db) as db:
             cursor = await db.execute("""
                 INSERT INTO achievements (user_id, achievement_type, achievement_data)
                 VALUES (?, ?, ?)
@@ -45,8 +46,7 @@ async def get_user_achievements(user_id: int) -> List[Dict[str, Any]]:
         List[Dict]: Список достижений
     """
     try:
-        async with aiosqlite.connect(achievements_db) as db:
-            db.row_factory = aiosqlite.Row
+        async with get_connection(achievements_db) as db:
             async with db.execute("""
                 SELECT * FROM achievements
                 WHERE user_id = ?
@@ -71,7 +71,7 @@ async def has_achievement(user_id: int, achievement_type: str) -> bool:
         bool: True если достижение есть
     """
     try:
-        async with aiosqlite.connect(achievements_db) as db:
+        async with get_connection(achievements_db) as db:
             async with db.execute("""
                 SELECT COUNT(*) FROM achievements
                 WHERE user_id = ? AND achievement_type = ?
@@ -83,62 +83,151 @@ async def has_achievement(user_id: int, achievement_type: str) -> bool:
         return False
 
 
-async def check_achievements(user_id: int, bot):
+async def get_unlocked_achievements(user_id: int) -> Set[str]:
     """
-    Проверка и выдача достижений
+    Получение набора типов уже полученных достижений (одним запросом)
     
     Args:
         user_id: ID пользователя
-        bot: Экземпляр бота
+        
+    Returns:
+        Set[str]: Типы достижений
     """
     try:
-        from bot.database.homework_model import get_homework_statistics, get_all_homework
-        
-        # Проверка достижения "5 ДЗ подряд"
-        homework = await get_all_homework(user_id)
-        completed_count = 0
-        max_streak = 0
-        
-        for item in sorted(homework, key=lambda x: x.get('created_at', ''), reverse=True):
-            if item.get('is_completed', False):
-                completed_count += 1
-                max_streak = max(max_streak, completed_count)
-            else:
-                completed_count = 0
-        
-        if max_streak >= 5 and not await has_achievement(user_id, "homework_streak_5"):
-            await add_achievement(user_id, "homework_streak_5", f"Выполнено {max_streak} ДЗ подряд")
-            await bot.send_message(
-                user_id,
-                "🎉 <b>Достижение разблокировано!</b>\n\n"
-                "🏆 Сделал 5 ДЗ подряд\n\n"
-                "Отличная работа! Продолжайте в том же духе!",
-                parse_mode="HTML"
-            )
+        async with get_connection(achievements_db) as db:
+            async with db.execute("""
+                SELECT achievement_type FROM achievements
+                WHERE user_id = ?
+            """, (user_id,)) as cursor:
+                return {row[0] for row in await cursor.fetchall()}
+    except Exception as e:
+        logger.error(f"Ошибка при получении достижений: {e}")
+        return set()
+
+
+async def get_achievement_counters(user_id: int) -> Dict[str, int]:
+    """
+    Получение счетчиков пользователя для проверки достижений
+    
+    Args:
+        user_id: ID пользователя
         
-        # Проверка достижения "10 выполненных ДЗ"
-        stats = await get_homework_statistics(user_id)
-        if stats.get('completed', 0) >= 10 and not await has_achievement(user_id, "homework_10"):
-            await add_achievement(user_id, "homework_10", f"Выполнено {stats.get('completed', 0)} ДЗ")
-            await bot.send_message(
-                user_id,
-                "🎉 <b>Достижение разблокировано!</b>\n\n"
-                "🏆 Выполнено 10 домашних заданий\n\n"
-                "Вы на правильном пути!",
-                parse_mode="HTML"
-            )
+    Returns:
+        Dict: completed_count, current_streak, best_streak
+    """
+    try:
+        async with get_connection(achievements_db) as db:
+            async with db.execute("""
+                SELECT completed_count, current_streak, best_streak
+                FROM achievement_counters WHERE user_id = ?
+            """, (user_id,)) as cursor:
+                row = await cursor.fetchone()
+                if row:
+                    return dict(row)
+    except Exception as e:
+        logger.error(f"Ошибка при получении счетчиков достижений: {e}")
+    return {"completed_count": 0, "current_streak": 0, "best_streak": 0}
+
+
+async def record_homework_completed(user_id: int, notify: bool = True):
+    """
+    Событие: пользователь выполнил ДЗ
+    
+    Увеличивает счетчик выполненных и текущую серию, затем проверяет
+    достижения. Стоимость не зависит от истории пользователя.
+    
+    Args:
+        user_id: ID пользователя
+        notify: Сообщить пользователю о новых достижениях
+    """
+    try:
+        async with get_connection(achievements_db) as db:
+            await db.execute("""
+                INSERT INTO achievement_counters (user_id, completed_count, current_streak, best_streak)
+                VALUES (?, 1, 1, 1)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    completed_count = completed_count + 1,
+                    current_streak = current_streak + 1,
+                    best_streak = MAX(best_streak, current_streak + 1),
+                    updated_at = CURRENT_TIMESTAMP
+            """, (user_id,))
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении счетчиков достижений: {e}")
+        return
+    
+    await check_achievements(user_id, notify)
+
+
+async def record_homework_deleted(user_id: int):
+    """
+    Событие: пользователь удалил невыполненное ДЗ (серия прерывается)
+    
+    Args:
+        user_id: ID пользователя
+    """
+    try:
+        async with get_connection(achievements_db) as db:
+            await db.execute("""
+                UPDATE achievement_counters
+                SET current_streak = 0, updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = ?
+            """, (user_id,))
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении счетчиков достижений: {e}")
+
+
+# Достижения: тип, условие по счетчикам, описание для базы, текст уведомления
+ACHIEVEMENTS = [
+    (
+        "homework_streak_5",
+        lambda c: c["best_streak"] >= 5,
+        "Выполнено {best_streak} ДЗ подряд",
+        "🏆 Сделал 5 ДЗ подряд\n\n"
+        "Отличная работа! Продолжайте в том же духе!"
+    ),
+    (
+        "homework_10",
+        lambda c: c["completed_count"] >= 10,
+        "Выполнено {completed_count} ДЗ",
+        "🏆 Выполнено 10 домашних заданий\n\n"
+        "Вы на правильном пути!"
+    ),
+    (
+        "homework_50",
+        lambda c: c["completed_count"] >= 50,
+        "Выполнено {completed_count} ДЗ",
+        "🏆 Выполнено 50 домашних заданий\n\n"
+        "Невероятный результат!"
+    ),
+]
+
+
+async def check_achievements(user_id: int, notify: bool = True):
+    """
+    Проверка и выдача достижений по текущим счетчикам
+    
+    Args:
+        user_id: ID пользователя
+        notify: Сообщить пользователю о новых достижениях (через очередь отправки)
+    """
+    try:
+        counters = await get_achievement_counters(user_id)
+        unlocked = await get_unlocked_achievements(user_id)
         
-        # Проверка достижения "50 выполненных ДЗ"
-        if stats.get('completed', 0) >= 50 and not await has_achievement(user_id, "homework_50"):
-            await add_achievement(user_id, "homework_50", f"Выполнено {stats.get('completed', 0)} ДЗ")
-            await bot.send_message(
-                user_id,
-                "🎉 <b>Достижение разблокировано!</b>\n\n"
-                "🏆 Выполнено 50 домашних заданий\n\n"
-                "Невероятный результат!",
-                parse_mode="HTML"
-            )
+        for achievement_type, condition, data_template, message in ACHIEVEMENTS:
+            if achievement_type in unlocked or not condition(counters):
+                continue
+            
+            await add_achievement(user_id, achievement_type, data_template.format(**counters))
+            if notify:
+                await send_queue.send(
+                    user_id,
+                    "🎉 <b>Достижение разблокировано!</b>\n\n" + message,
+                    priority=PRIORITY_INTERACTIVE,
+                    parse_mode="HTML"
+                )
         
     except Exception as e:
         logger.error(f"Ошибка при проверке достижений: {e}")
-
@@ -0,0 +1,201 @@
+"""
+Кэш результатов запросов к Supabase
+"""
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Условие фильтра: ("eq", значение) или ("range", (начало, конец))
+Filter = Tuple[str, Any]
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "size", "table", "filters", "aggregate")
+
+    def __init__(self, value: Any, expires_at: float, size: int, table: str, filters: Dict[str, Filter],
+                 aggregate: bool):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+        self.table = table
+        self.filters = filters
+        self.aggregate = aggregate
+
+
+def row_matches(filters: Dict[str, Filter], row: Dict[str, Any]) -> bool:
+    """
+    Может ли строка попасть в результат запроса с такими фильтрами
+
+    Поля, которых нет в строке (частичное обновление), считаются подходящими.
+    """
+    for field, (op, expected) in filters.items():
+        if field not in row:
+            continue
+        value = row[field]
+        if value is None:
+            return False
+        value = value if isinstance(value, str) else str(value)
+        if op == "eq" and value != expected:
+            return False
+        if op == "range" and not (expected[0] <= value[:len(expected[0])] <= expected[1]):
+            return False
+    return True
+
+
+def query_owner(filters: Dict[str, Filter]) -> Optional[str]:
+    """Пользователь, строками которого ограничен запрос (фильтр user_id = ...), или None"""
+    op, value = filters.get("user_id", (None, None))
+    return value if op == "eq" else None
+
+
+class QueryCache:
+    """
+    Read-through кэш с TTL, ограниченный по числу записей и объёму
+
+    Каждая запись помнит таблицу и фильтры запроса, поэтому запись в таблицу
+    сбрасывает только те результаты, в которые могла попасть изменённая строка.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._generations: Dict[str, int] = {}
+        # Версии данных пользователя: записи одного пользователя и записи без известного владельца.
+        # Владелец хранится строкой: в фильтрах запросов user_id - строка, в строках - число
+        self._user_versions: Dict[Tuple[str, str], int] = {}
+        self._shared_versions: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def generation(self, table: str, user_id: Any = None) -> Hashable:
+        """
+        Поколение данных, которые может вернуть запрос
+
+        Для запроса строк одного пользователя это его версия (см. version):
+        записи других пользователей ее не меняют. Для запроса без user_id -
+        номер поколения таблицы, который растет при каждой записи.
+        """
+        if user_id is None:
+            return self._generations.get(table, 0)
+        return self.version(table, user_id)
+
+    def version(self, table: str, user_id: Any) -> Tuple[int, int]:
+        """
+        Версия данных пользователя в таблице
+
+        Меняется при записи строк этого пользователя (или строк, владелец
+        которых неизвестен), записи других пользователей ее не трогают.
+        """
+        return self._shared_versions.get(table, 0), self._user_versions.get((table, str(user_id)), 0)
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Получение значения из кэша
+
+        Returns:
+            tuple: (найдено ли значение, значение)
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        if entry.expires_at <= time.monotonic():
+            self._drop(key)
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, list(entry.value) if isinstance(entry.value, list) else entry.value
+
+    def set(self, key: Hashable, value: Any, table: str, filters: Dict[str, Filter],
+            generation: Optional[Hashable] = None, aggregate: bool = False):
+        """
+        Сохранение результата запроса
+
+        Args:
+            key: Ключ запроса
+            value: Результат
+            table: Таблица, из которой читали
+            filters: Фильтры запроса
+            generation: Поколение данных запроса (generation) на момент его начала;
+                если с тех пор была запись, результат не сохраняется
+            aggregate: Результат зависит от всех строк запроса (счётчики и т.п.)
+                и сбрасывается при любой записи в них
+        """
+        if generation is not None and generation != self.generation(table, query_owner(filters)):
+            return
+        size = len(json.dumps(value, default=str, ensure_ascii=False))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = _Entry(value, time.monotonic() + self.ttl, size, table, filters, aggregate)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def invalidate(self, table: str, row: Optional[Dict[str, Any]] = None, row_id: Any = None,
+                   user_id: Any = None):
+        """
+        Сброс результатов, затронутых записью в таблицу
+
+        Args:
+            table: Таблица
+            row: Новые значения строки (после вставки или обновления)
+            row_id: ID изменённой или удалённой строки
+            user_id: Владелец строки (по умолчанию берется из row)
+        """
+        self._generations[table] = self.generation(table) + 1
+        if user_id is None and row is not None:
+            user_id = row.get("user_id")
+        if user_id is None:
+            self._shared_versions[table] = self._shared_versions.get(table, 0) + 1
+        else:
+            owner = (table, str(user_id))
+            self._user_versions[owner] = self._user_versions.get(owner, 0) + 1
+        stale = []
+        for key, entry in self._entries.items():
+            if entry.table != table:
+                continue
+            if entry.aggregate and (user_id is None or query_owner(entry.filters) in (None, str(user_id))):
+                # Агрегат по строкам пользователя сбрасывается только его записями
+                stale.append(key)
+            elif row is not None and row_matches(entry.filters, row):
+                stale.append(key)
+            elif row_id is not None and any(
+                item.get("id") == row_id for item in entry.value if isinstance(item, dict)
+            ):
+                stale.append(key)
+        for key in stale:
+            self._drop(key)
+        self.invalidations += len(stale)
+
+    def clear(self):
+        """Полная очистка кэша"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики для настройки кэша"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _drop(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
@@ -1,11 +1,131 @@
 """
 Модуль для работы с базой данных
 """
+import asyncio
 import aiosqlite
 import os
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import AsyncIterator, Dict, List
 import config
 from bot.utils.logger import logger
+from bot.utils.metrics import db_errors, db_latency
+
+
+class ConnectionPool:
+    """
+    Пул долгоживущих соединений с одним файлом SQLite
+    
+    Соединения открываются один раз и переиспользуются, поэтому на каждый
+    запрос не создается новый поток aiosqlite и не открывается файл.
+    """
+    
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.size = size
+        self._connections: List[aiosqlite.Connection] = []
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._open_lock = asyncio.Lock()
+    
+    async def open(self):
+        """Открытие соединений пула"""
+        async with self._open_lock:
+            if self._connections:
+                return
+            for _ in range(self.size):
+                db = await aiosqlite.connect(self.path)
+                db.row_factory = aiosqlite.Row
+                await _apply_pragmas(db)
+                self._connections.append(db)
+                self._idle.put_nowait(db)
+    
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Получение соединения из пула на время работы с ним"""
+        if not self._connections:
+            await self.open()
+        started = time.perf_counter()
+        db = await self._idle.get()
+        acquired = time.perf_counter()
+        db_latency.observe(acquired - started, backend="sqlite", target=self.name, operation="wait")
+        try:
+            yield db
+        except BaseException:
+            db_errors.inc(backend="sqlite", target=self.name, operation="use")
+            # Незавершенная транзакция не должна достаться следующему запросу
+            await db.rollback()
+            raise
+        finally:
+            self._idle.put_nowait(db)
+            db_latency.observe(time.perf_counter() - acquired, backend="sqlite", target=self.name, operation="use")
+    
+    async def close(self):
+        """Закрытие всех соединений пула"""
+        for db in self._connections:
+            await db.close()
+        self._connections.clear()
+        self._idle = asyncio.Queue()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+
+# Таблицы и файлы, в которых они хранились до объединения баз
+LEGACY_DATABASES = [
+    ("schedule", config.SCHEDULE_DB),
+    ("homework", config.HOMEWORK_DB),
+    ("notes", config.NOTES_DB),
+    ("user_settings", config.SETTINGS_DB),
+    ("achievements", config.ACHIEVEMENTS_DB),
+    ("achievement_counters", config.ACHIEVEMENTS_DB),
+    ("reminder_queue", config.REMINDERS_DB),
+]
+
+
+async def _apply_pragmas(db: aiosqlite.Connection):
+    """Настройка соединения: WAL, размер кэша, mmap"""
+    await db.execute("PRAGMA journal_mode = WAL")
+    await db.execute("PRAGMA synchronous = NORMAL")
+    await db.execute(f"PRAGMA cache_size = -{config.DB_CACHE_SIZE_KB}")
+    await db.execute(f"PRAGMA mmap_size = {config.DB_MMAP_SIZE}")
+    await db.execute("PRAGMA temp_store = MEMORY")
+    await db.execute("PRAGMA busy_timeout = 5000")
+
+
+def resolve_db_path(path: str) -> str:
+    """
+    Фактический файл базы данных
+    
+    При объединенной схеме все таблицы живут в config.MAIN_DB.
+    """
+    return config.MAIN_DB if config.DB_UNIFIED else path
+
+
+@asynccontextmanager
+async def get_connection(path: str) -> AsyncIterator[aiosqlite.Connection]:
+    """
+    Соединение с базой данных из общего пула
+    
+    Args:
+        path: Путь к файлу базы данных
+    """
+    path = resolve_db_path(path)
+    pool = _pools.get(path)
+    if pool is None:
+        pool = _pools[path] = ConnectionPool(path, config.DB_POOL_SIZE)
+    async with pool.acquire() as db:
+        yield db
+
+
+async def close_databases():
+    """
+    Закрытие всех открытых соединений с базами данных
+    """
+    for pool in _pools.values():
+        await pool.close()
+    _pools.clear()
+    logger.info("Соединения с базами данных закрыты")
 
 
 async def init_databases():
@@ -16,7 +136,7 @@ async def init_databases():
     os.makedirs(config.DB_PATH, exist_ok=True)
     
     # Инициализация базы расписания
-    async with aiosqlite.connect(config.SCHEDULE_DB) as db:
+    async with get_connection(config.SCHEDULE_DB) as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS schedule (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -28,10 +148,14 @@ async def init_databases():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_schedule_user_day_time
+            ON schedule (user_id, day_of_week, time)
+        """)
         await db.commit()
     
     # Инициализация базы домашних заданий
-    async with aiosqlite.connect(config.HOMEWORK_DB) as db:
+    async with get_connection(config.HOMEWORK_DB) as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS homework (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -43,10 +167,18 @@ async def init_databases():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_homework_user_completed_deadline
+            ON homework (user_id, is_completed, deadline)
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_homework_user_subject
+            ON homework (user_id, subject, is_completed, deadline)
+        """)
         await db.commit()
     
     # Инициализация базы заметок
-    async with aiosqlite.connect(config.NOTES_DB) as db:
+    async with get_connection(config.NOTES_DB) as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS notes (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -57,11 +189,15 @@ async def init_databases():
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_notes_user_updated
+            ON notes (user_id, updated_at)
+        """)
         await db.commit()
+        await init_notes_search(db)
     
     # Инициализация базы настроек пользователей
-    settings_db = f"{config.DB_PATH}/settings.db"
-    async with aiosqlite.connect(settings_db) as db:
+    async with get_connection(config.SETTINGS_DB) as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS user_settings (
                 user_id INTEGER PRIMARY KEY,
@@ -74,8 +210,7 @@ async def init_databases():
         await db.commit()
     
     # Инициализация базы достижений
-    achievements_db = f"{config.DB_PATH}/achievements.db"
-    async with aiosqlite.connect(achievements_db) as db:
+    async with get_connection(config.ACHIEVEMENTS_DB) as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS achievements (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -85,7 +220,222 @@ async def init_databases():
                 unlocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_achievements_user_type
+            ON achievements (user_id, achievement_type)
+        """)
+        async with db.execute("""
+            SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'achievement_counters'
+        """) as cursor:
+            counters_exist = await cursor.fetchone() is not None
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS achievement_counters (
+                user_id INTEGER PRIMARY KEY,
+                completed_count INTEGER NOT NULL DEFAULT 0,
+                current_streak INTEGER NOT NULL DEFAULT 0,
+                best_streak INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
         await db.commit()
     
+    # Инициализация очереди напоминаний (режим диспетчера по минутам)
+    async with get_connection(config.REMINDERS_DB) as db:
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS reminder_queue (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                user_id INTEGER NOT NULL,
+                due_minute INTEGER NOT NULL,
+                repeat_minutes INTEGER NOT NULL DEFAULT 0,
+                daily_at TEXT,
+                callback TEXT NOT NULL,
+                args TEXT NOT NULL,
+                leased_until INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_reminder_queue_due
+            ON reminder_queue (due_minute)
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_reminder_queue_user
+            ON reminder_queue (user_id)
+        """)
+        await db.commit()
+    
+    # Инициализация хранилища состояний FSM
+    async with get_connection(config.FSM_DB) as db:
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_storage (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT,
+                updated_at INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated
+            ON fsm_storage (updated_at)
+        """)
+        await db.commit()
+    
+    # Инициализация outbox отложенных записей в Supabase
+    async with get_connection(config.OUTBOX_DB) as db:
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS supabase_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                target TEXT NOT NULL,
+                row TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                failed INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await db.commit()
+    
+    if config.DB_UNIFIED:
+        await migrate_legacy_databases()
+    
+    if not counters_exist:
+        # После переноса старых баз: счетчики считаются по всем ДЗ пользователей
+        await backfill_achievement_counters()
+    
     logger.info("Базы данных инициализированы")
 
+
+async def init_notes_search(db: aiosqlite.Connection):
+    """
+    Полнотекстовый индекс FTS5 для заметок
+    
+    Индекс хранит только токены (content='notes') и синхронизируется
+    с таблицей notes триггерами. user_id тоже индексируется: поиск
+    пересекает слова запроса со списком заметок пользователя внутри
+    MATCH, а не фильтрует совпадения всех пользователей после него.
+    Если SQLite собран без FTS5, поиск продолжит работать через LIKE.
+    """
+    async with db.execute("""
+        SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'notes_fts'
+    """) as cursor:
+        exists = await cursor.fetchone() is not None
+    
+    try:
+        await db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+                title, content, user_id,
+                content = 'notes', content_rowid = 'id',
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        """)
+    except aiosqlite.OperationalError as e:
+        logger.warning(f"FTS5 недоступен, поиск заметок будет работать через LIKE: {e}")
+        return
+    
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts (rowid, title, content, user_id)
+            VALUES (new.id, new.title, new.content, new.user_id);
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, title, content, user_id)
+            VALUES ('delete', old.id, old.title, old.content, old.user_id);
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, title, content, user_id)
+            VALUES ('delete', old.id, old.title, old.content, old.user_id);
+            INSERT INTO notes_fts (rowid, title, content, user_id)
+            VALUES (new.id, new.title, new.content, new.user_id);
+        END
+    """)
+    if not exists:
+        # Индексируем заметки, созданные до появления полнотекстового поиска
+        await db.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+    await db.commit()
+
+
+async def backfill_achievement_counters():
+    """
+    Начальные счетчики достижений по уже выполненным ДЗ
+    
+    Выполняется один раз, когда таблица achievement_counters только создана,
+    чтобы пользователи не начинали с нуля. Серии считаются как раньше:
+    по ДЗ от новых к старым, невыполненное задание прерывает серию.
+    """
+    # user_id -> [выполнено, текущая серия, лучшая серия, длина серии, прервана ли текущая]
+    counters: Dict[int, list] = {}
+    async with get_connection(config.HOMEWORK_DB) as db:
+        async with db.execute("""
+            SELECT user_id, is_completed FROM homework
+            ORDER BY user_id, created_at DESC, id DESC
+        """) as cursor:
+            async for user_id, is_completed in cursor:
+                entry = counters.setdefault(user_id, [0, 0, 0, 0, False])
+                if not is_completed:
+                    entry[3] = 0
+                    entry[4] = True
+                    continue
+                entry[0] += 1
+                entry[3] += 1
+                entry[2] = max(entry[2], entry[3])
+                if not entry[4]:
+                    # Текущая серия - выполненные ДЗ от самого нового до первого невыполненного
+                    entry[1] = entry[3]
+    
+    rows = [
+        (user_id, completed, current, best)
+        for user_id, (completed, current, best, _, _) in counters.items()
+        if completed
+    ]
+    if not rows:
+        return
+    async with get_connection(config.ACHIEVEMENTS_DB) as db:
+        await db.executemany("""
+            INSERT OR IGNORE INTO achievement_counters (user_id, completed_count, current_streak, best_streak)
+            VALUES (?, ?, ?, ?)
+        """, rows)
+        await db.commit()
+    logger.info(f"Счетчики достижений заполнены по истории ДЗ: {len(rows)} пользователей")
+
+
+async def migrate_legacy_databases():
+    """
+    Перенос данных из отдельных файлов баз в общий файл
+    
+    Перенесенный файл переименовывается в *.migrated, поэтому миграция
+    выполняется один раз.
+    """
+    migrated_paths = set()
+    async with get_connection(config.MAIN_DB) as db:
+        for table, legacy_path in LEGACY_DATABASES:
+            if not os.path.exists(legacy_path) or os.path.abspath(legacy_path) == os.path.abspath(config.MAIN_DB):
+                continue
+            
+            await db.execute("ATTACH DATABASE ? AS legacy", (legacy_path,))
+            try:
+                async with db.execute(f"PRAGMA legacy.table_info({table})") as cursor:
+                    legacy_columns = {row[1] for row in await cursor.fetchall()}
+                async with db.execute(f"PRAGMA main.table_info({table})") as cursor:
+                    columns = [row[1] for row in await cursor.fetchall() if row[1] in legacy_columns]
+                
+                if columns:
+                    column_list = ", ".join(columns)
+                    cursor = await db.execute(f"""
+                        INSERT OR IGNORE INTO main.{table} ({column_list})
+                        SELECT {column_list} FROM legacy.{table}
+                    """)
+                    await db.commit()
+                    logger.info(f"Перенесено записей {table} из {legacy_path}: {cursor.rowcount}")
+            finally:
+                await db.execute("DETACH DATABASE legacy")
+            
+            migrated_paths.add(legacy_path)
+    
+    for legacy_path in migrated_paths:
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+
@@ -0,0 +1,412 @@
+"""
+Хранилище состояний FSM в SQLite
+
+Состояния и данные незавершенных диалогов переживают перезапуск бота.
+Перед базой стоит ограниченный LRU-кэш, поэтому активные пользователи
+читают состояние из памяти, а изменения накапливаются и записываются
+в базу одной транзакцией раз в config.FSM_FLUSH_INTERVAL секунд.
+
+Брошенные диалоги истекают через config.FSM_STATE_TTL секунд после
+последнего изменения, а общее число и объем записей ограничены.
+Истекшие ключи запоминаются, чтобы бот мог сказать пользователю,
+что ввод прерван (см. bot.middlewares.fsm_expiry).
+"""
+import asyncio
+import json
+import time
+from abc import abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+import config
+from bot.database.db import get_connection
+from bot.utils.logger import logger
+
+
+class _Record:
+    __slots__ = ("state", "data", "updated_at", "size")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None,
+                 updated_at: float = 0.0, size: int = 0):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.updated_at = updated_at
+        self.size = size
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+def _make_key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+
+def _dump(data: Dict[str, Any]) -> Optional[str]:
+    if not data:
+        return None
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _touch(key: str, record: _Record):
+    """Отметка времени изменения и пересчет размера записи"""
+    record.updated_at = time.time()
+    record.size = len(key) + len(record.state or "") + len(_dump(record.data) or "")
+
+
+class _ExpiringStorage(BaseStorage):
+    """
+    Общая часть хранилищ: TTL, фоновая очистка, счетчики и отметки об истекших ключах
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int, sweep_interval: float):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        # Ключ -> (истекшее состояние, когда истекло)
+        self._tombstones: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+        self.expired = 0
+        self.evicted = 0
+
+    def pop_expired(self, key: StorageKey) -> Optional[str]:
+        """
+        Было ли у ключа недавно истекшее состояние (отметка удаляется)
+
+        Returns:
+            str: Имя истекшего состояния или None
+        """
+        tombstone = self._tombstones.pop(_make_key(key), None)
+        if tombstone is None:
+            return None
+        state, expired_at = tombstone
+        if self.ttl > 0 and time.time() - expired_at > self.ttl:
+            return None
+        return state
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики истечения и вытеснения"""
+        return {
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "tombstones": len(self._tombstones),
+        }
+
+    @abstractmethod
+    async def sweep(self):
+        """Удаление истекших записей и записей сверх лимитов"""
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    def _is_expired(self, record: _Record, now: Optional[float] = None) -> bool:
+        if self.ttl <= 0 or not record.updated_at:
+            return False
+        return (now or time.time()) - record.updated_at > self.ttl
+
+    def _forget(self, key: str, state: Optional[str], evicted: bool = False):
+        """Учет удаленной записи и отметка для пользователя"""
+        if evicted:
+            self.evicted += 1
+        else:
+            self.expired += 1
+        if state is None:
+            return
+        self._tombstones[key] = (state, time.time())
+        self._tombstones.move_to_end(key)
+        while len(self._tombstones) > self.max_entries:
+            self._tombstones.popitem(last=False)
+
+    def _on_write(self, key: str, record: _Record):
+        # Пользователь начал новый диалог - старая отметка не нужна
+        if record.state is not None:
+            self._tombstones.pop(key, None)
+        if self._sweeper is None and self.sweep_interval > 0:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Ошибка при очистке состояний FSM: {e}")
+
+
+class BoundedMemoryStorage(_ExpiringStorage):
+    """
+    Хранилище FSM в памяти с TTL и ограничением по числу записей и объему
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int, sweep_interval: float):
+        super().__init__(ttl, max_entries, max_bytes, sweep_interval)
+        # Порядок - по времени последнего изменения, старые в начале
+        self._records: "OrderedDict[str, _Record]" = OrderedDict()
+        self._bytes = 0
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = self._get(_make_key(key)) or _Record()
+        record.state = state.state if isinstance(state, State) else state
+        self._put(_make_key(key), record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._get(_make_key(key))
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = self._get(_make_key(key)) or _Record()
+        record.data = data.copy()
+        self._put(_make_key(key), record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._get(_make_key(key))
+        return record.data.copy() if record else {}
+
+    async def sweep(self):
+        now = time.time()
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if not self._is_expired(record, now):
+                break
+            self._drop(key)
+            self._forget(key, record.state)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update(entries=len(self._records), bytes=self._bytes)
+        return stats
+
+    def _get(self, key: str) -> Optional[_Record]:
+        record = self._records.get(key)
+        if record is not None and self._is_expired(record):
+            self._drop(key)
+            self._forget(key, record.state)
+            return None
+        return record
+
+    def _put(self, key: str, record: _Record):
+        if key in self._records:
+            self._drop(key)
+        self._on_write(key, record)
+        if record.empty:
+            return
+        _touch(key, record)
+        self._records[key] = record
+        self._bytes += record.size
+        while len(self._records) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._records))
+            self._forget(oldest, self._drop(oldest).state, evicted=True)
+
+    def _drop(self, key: str) -> _Record:
+        record = self._records.pop(key)
+        self._bytes -= record.size
+        return record
+
+
+class SQLiteStorage(_ExpiringStorage):
+    """
+    Хранилище FSM: LRU-кэш в памяти и таблица fsm_storage в SQLite
+    """
+
+    def __init__(self, cache_size: int, flush_interval: float, ttl: float,
+                 max_entries: int, max_bytes: int, sweep_interval: float):
+        """
+        Args:
+            cache_size: Сколько записей держать в памяти (0 - без кэша)
+            flush_interval: Период записи изменений в секундах
+                (0 - писать в базу сразу при каждом изменении)
+            ttl: Время жизни записи после последнего изменения (0 - без ограничения)
+            max_entries, max_bytes: Лимиты на число записей и объем в базе
+            sweep_interval: Период фоновой очистки в секундах
+        """
+        super().__init__(ttl, max_entries, max_bytes, sweep_interval)
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self._cache: "OrderedDict[str, _Record]" = OrderedDict()
+        # Измененные, но еще не записанные в базу записи
+        self._dirty: Dict[str, _Record] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._load(_make_key(key))
+        record.state = state.state if isinstance(state, State) else state
+        await self._mark_dirty(_make_key(key), record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(_make_key(key))).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._load(_make_key(key))
+        record.data = data.copy()
+        await self._mark_dirty(_make_key(key), record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._load(_make_key(key))).data.copy()
+
+    async def close(self) -> None:
+        """Остановка фоновых задач и сохранение всех изменений"""
+        await super().close()
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self):
+        """Запись накопленных изменений в базу одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            upserts = [
+                (key, record.state, _dump(record.data), int(record.updated_at))
+                for key, record in dirty.items() if not record.empty
+            ]
+            deletes = [(key,) for key, record in dirty.items() if record.empty]
+            try:
+                async with get_connection(config.FSM_DB) as db:
+                    if upserts:
+                        await db.executemany("""
+                            INSERT INTO fsm_storage (key, state, data, updated_at)
+                            VALUES (?, ?, ?, ?)
+                            ON CONFLICT (key) DO UPDATE SET
+                                state = excluded.state,
+                                data = excluded.data,
+                                updated_at = excluded.updated_at
+                        """, upserts)
+                    if deletes:
+                        await db.executemany("DELETE FROM fsm_storage WHERE key = ?", deletes)
+                    await db.commit()
+            except Exception as e:
+                # Более новые изменения за время записи не затираем
+                for key, record in dirty.items():
+                    self._dirty.setdefault(key, record)
+                logger.error(f"Ошибка при сохранении состояний FSM: {e}")
+
+    async def sweep(self):
+        """
+        Удаление из базы истекших записей и самых старых записей сверх лимитов
+        """
+        await self.flush()
+        cutoff = int(time.time() - self.ttl) if self.ttl > 0 else 0
+        async with get_connection(config.FSM_DB) as db:
+            async with db.execute(
+                "SELECT key, state FROM fsm_storage WHERE updated_at < ?", (cutoff,)
+            ) as cursor:
+                expired = [(row["key"], row["state"]) for row in await cursor.fetchall()]
+
+            # Самые старые из оставшихся записей, не поместившиеся в лимиты
+            async with db.execute("""
+                SELECT key, state FROM (
+                    SELECT key, state,
+                           ROW_NUMBER() OVER recent AS position,
+                           SUM(length(key) + length(coalesce(state, '')) + length(coalesce(data, '')))
+                               OVER recent AS running_bytes
+                    FROM fsm_storage
+                    WHERE updated_at >= ?
+                    WINDOW recent AS (ORDER BY updated_at DESC, key)
+                )
+                WHERE position > ? OR running_bytes > ?
+            """, (cutoff, self.max_entries, self.max_bytes)) as cursor:
+                evicted = [(row["key"], row["state"]) for row in await cursor.fetchall()]
+
+            # Записи, измененные во время очистки, не трогаем
+            expired = [item for item in expired if item[0] not in self._dirty]
+            evicted = [item for item in evicted if item[0] not in self._dirty]
+            if not expired and not evicted:
+                return
+            await db.executemany(
+                "DELETE FROM fsm_storage WHERE key = ?", [(key,) for key, _ in expired + evicted]
+            )
+            await db.commit()
+
+        for key, state in expired:
+            self._cache.pop(key, None)
+            self._forget(key, state)
+        for key, state in evicted:
+            self._cache.pop(key, None)
+            self._forget(key, state, evicted=True)
+        logger.info(f"Очистка FSM: истекло {len(expired)}, вытеснено {len(evicted)}")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update(cached=len(self._cache), dirty=len(self._dirty))
+        return stats
+
+    async def _load(self, key: str) -> _Record:
+        record = self._cache.get(key)
+        if record is not None:
+            self._cache.move_to_end(key)
+        else:
+            record = self._dirty.get(key)
+            if record is None:
+                async with get_connection(config.FSM_DB) as db:
+                    async with db.execute(
+                        "SELECT state, data, updated_at FROM fsm_storage WHERE key = ?", (key,)
+                    ) as cursor:
+                        row = await cursor.fetchone()
+                # Пока шел запрос, запись могла появиться в кэше
+                record = self._cache.get(key) or self._dirty.get(key)
+                if record is None:
+                    if row is None:
+                        record = _Record()
+                    else:
+                        record = _Record(
+                            row["state"],
+                            json.loads(row["data"]) if row["data"] else None,
+                            row["updated_at"]
+                        )
+            self._remember(key, record)
+
+        if self._is_expired(record):
+            # Пустая запись удалит строку из базы при следующей записи изменений
+            self._forget(key, record.state)
+            record = _Record()
+            self._remember(key, record)
+            self._dirty[key] = record
+        return record
+
+    def _remember(self, key: str, record: _Record):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        # Вытесненные записи с несохраненными изменениями остаются в _dirty
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _mark_dirty(self, key: str, record: _Record):
+        _touch(key, record)
+        self._on_write(key, record)
+        self._remember(key, record)
+        self._dirty[key] = record
+        if self.flush_interval <= 0:
+            await self.flush()
+        elif self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Хранилище FSM по настройке config.FSM_STORAGE"""
+    limits = dict(
+        ttl=config.FSM_STATE_TTL,
+        max_entries=config.FSM_MAX_ENTRIES,
+        max_bytes=config.FSM_MAX_BYTES,
+        sweep_interval=config.FSM_SWEEP_INTERVAL
+    )
+    if config.FSM_STORAGE == "memory":
+        return BoundedMemoryStorage(**limits)
+    return SQLiteStorage(
+        cache_size=config.FSM_CACHE_SIZE,
+        flush_interval=config.FSM_FLUSH_INTERVAL,
+        **limits
+    )
@@ -1,10 +1,10 @@
 """
 Модель для работы с домашними заданиями
 """
-import aiosqlite
 import config
 from typing import List, Dict, Any, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
+from bot.database.db import get_connection
 from bot.utils.logger import logger
 
 
@@ -23,7 +23,7 @@ async def add_homework(user_id: int, subject: str, task: str, deadline: Optional
     """
     try:
         deadline_str = deadline.isoformat() if deadline else None
-        async with aiosqlite.connect(config.HOMEWORK_DB) as db:
+        async with get_connection(config.HOMEWORK_DB) as db:
             cursor = await db.execute("""
                 INSERT INTO homework (user_id, subject, task, deadline, is_completed)
                 VALUES (?, ?, ?, ?, 0)
@@ -47,14 +47,15 @@ async def get_homework_by_date(user_id: int, date: datetime) -> List[Dict[str, A
         List[Dict]: Список ДЗ
     """
     try:
+        # Диапазон вместо date(deadline), чтобы работал индекс по deadline
         date_str = date.date().isoformat()
-        async with aiosqlite.connect(config.HOMEWORK_DB) as db:
-            db.row_factory = aiosqlite.Row
+        next_date_str = (date.date() + timedelta(days=1)).isoformat()
+        async with get_connection(config.HOMEWORK_DB) as db:
             async with db.execute("""
                 SELECT * FROM homework
-                WHERE user_id = ? AND date(deadline) = ?
+                WHERE user_id = ? AND deadline >= ? AND deadline < ?
                 ORDER BY deadline
-            """, (user_id, date_str)) as cursor:
+            """, (user_id, date_str, next_date_str)) as cursor:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
     except Exception as e:
@@ -74,8 +75,7 @@ async def get_homework_by_subject(user_id: int, subject: str) -> List[Dict[str,
         List[Dict]: Список ДЗ
     """
     try:
-        async with aiosqlite.connect(config.HOMEWORK_DB) as db:
-            db.row_factory = aiosqlite.Row
+        async with get_connection(config.HOMEWORK_DB) as db:
             async with db.execute("""
                 SELECT * FROM homework
                 WHERE user_id = ? AND subject = ? AND is_completed = 0
@@ -111,8 +111,7 @@ async def get_all_homework(user_id: int, include_completed: bool = False) -> Lis
         
         query += " ORDER BY deadline"
         
-        async with aiosqlite.connect(config.HOMEWORK_DB) as db:
-            db.row_factory = aiosqlite.Row
+        async with get_connection(config.HOMEWORK_DB) as db:
             async with db.execute(query, params) as cursor:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
@@ -133,7 +132,7 @@ async def mark_homework_completed(user_id: int, homework_id: int) -> bool:
         bool: True если успешно
     """
     try:
-        async with aiosqlite.connect(config.HOMEWORK_DB) as db:
+        async with get_connection(config.HOMEWORK_DB) as db:
             cursor = await db.execute("""
                 UPDATE homework
                 SET is_completed = 1
@@ -158,7 +157,7 @@ async def delete_homework(user_id: int, homework_id: int) -> bool:
         bool: True если успешно удалено
     """
     try:
-        async with aiosqlite.connect(config.HOMEWORK_DB) as db:
+        async with get_connection(config.HOMEWORK_DB) as db:
             cursor = await db.execute("""
                 DELETE FROM homework
                 WHERE id = ? AND user_id = ?
@@ -204,7 +203,7 @@ async def update_homework(user_id: int, homework_id: int, subject: str = None,
         
         params.extend([homework_id, user_id])
         
-        async with aiosqlite.connect(config.HOMEWORK_DB) as db:
+        async with get_connection(config.HOMEWORK_DB) as db:
             await db.execute(f"""
                 UPDATE homework
                 SET {', '.join(updates)}
@@ -228,7 +227,7 @@ async def get_homework_statistics(user_id: int) -> Dict[str, Any]:
         Dict: Статистика (total, completed, percentage)
     """
     try:
-        async with aiosqlite.connect(config.HOMEWORK_DB) as db:
+        async with get_connection(config.HOMEWORK_DB) as db:
             # Всего ДЗ
             async with db.execute("""
                 SELECT COUNT(*) as total FROM homework WHERE user_id = ?
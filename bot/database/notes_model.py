@@ -1,9 +1,12 @@
 """
 Модель для работы с заметками
 """
+import html
+import re
 import aiosqlite
 import config
 from typing import List, Dict, Any, Optional
+from bot.database.db import get_connection
 from bot.utils.logger import logger
 
 
@@ -20,7 +23,7 @@ async def add_note(user_id: int, title: str, content: str = "") -> int:
         int: ID добавленной заметки
     """
     try:
-        async with aiosqlite.connect(config.NOTES_DB) as db:
+        async with get_connection(config.NOTES_DB) as db:
             cursor = await db.execute("""
                 INSERT INTO notes (user_id, title, content)
                 VALUES (?, ?, ?)
@@ -44,8 +47,7 @@ async def get_note(user_id: int, note_id: int) -> Optional[Dict[str, Any]]:
         Dict: Заметка или None
     """
     try:
-        async with aiosqlite.connect(config.NOTES_DB) as db:
-            db.row_factory = aiosqlite.Row
+        async with get_connection(config.NOTES_DB) as db:
             async with db.execute("""
                 SELECT * FROM notes
                 WHERE id = ? AND user_id = ?
@@ -68,8 +70,7 @@ async def get_all_notes(user_id: int) -> List[Dict[str, Any]]:
         List[Dict]: Список заметок
     """
     try:
-        async with aiosqlite.connect(config.NOTES_DB) as db:
-            db.row_factory = aiosqlite.Row
+        async with get_connection(config.NOTES_DB) as db:
             async with db.execute("""
                 SELECT * FROM notes
                 WHERE user_id = ?
@@ -82,28 +83,90 @@ async def get_all_notes(user_id: int) -> List[Dict[str, Any]]:
         return []
 
 
-async def search_notes(user_id: int, query: str) -> List[Dict[str, Any]]:
+async def search_notes(user_id: int, query: str, limit: int = 20) -> List[Dict[str, Any]]:
     """
     Поиск заметок по запросу
     
+    Используется полнотекстовый индекс notes_fts: слова запроса ищутся
+    по префиксу, результаты ранжируются по bm25 (совпадения в заголовке
+    весят больше), для каждой заметки возвращается фрагмент с подсветкой.
+    
     Args:
         user_id: ID пользователя
         query: Поисковый запрос
+        limit: Максимальное количество результатов
         
     Returns:
-        List[Dict]: Список найденных заметок
+        List[Dict]: Список найденных заметок (с HTML-фрагментом в поле snippet)
+    """
+    match = _build_match_query(user_id, query)
+    if not match:
+        return []
+    
+    try:
+        async with get_connection(config.NOTES_DB) as db:
+            async with db.execute("""
+                SELECT notes.*,
+                       snippet(notes_fts, -1, ?, ?, '…', 12) AS snippet
+                FROM notes_fts
+                JOIN notes ON notes.id = notes_fts.rowid
+                WHERE notes_fts MATCH ?
+                ORDER BY bm25(notes_fts, 5.0, 1.0, 0.0)
+                LIMIT ?
+            """, (_HIGHLIGHT_START, _HIGHLIGHT_END, match, limit)) as cursor:
+                rows = await cursor.fetchall()
+                return [_with_html_snippet(dict(row)) for row in rows]
+    except aiosqlite.OperationalError as e:
+        logger.warning(f"Полнотекстовый поиск недоступен, используется LIKE: {e}")
+        return await _search_notes_like(user_id, query, limit)
+    except Exception as e:
+        logger.error(f"Ошибка при поиске заметок: {e}")
+        return []
+
+
+# Служебные маркеры подсветки: заменяются на теги после экранирования HTML
+_HIGHLIGHT_START = "\x02"
+_HIGHLIGHT_END = "\x03"
+
+
+def _build_match_query(user_id: int, query: str) -> str:
+    """
+    Запрос FTS5: заметки пользователя, в заголовке или тексте которых
+    есть все слова запроса (каждое ищется по префиксу)
     """
+    words = re.findall(r"\w+", query.lower())
+    if not words:
+        return ""
+    terms = " ".join(f'"{word}"*' for word in words)
+    return f'user_id : "{int(user_id)}" AND {{title content}} : ({terms})'
+
+
+def _with_html_snippet(note: Dict[str, Any]) -> Dict[str, Any]:
+    note["snippet"] = (
+        html.escape(note.get("snippet") or "")
+        .replace(_HIGHLIGHT_START, "<b>")
+        .replace(_HIGHLIGHT_END, "</b>")
+    )
+    return note
+
+
+async def _search_notes_like(user_id: int, query: str, limit: int) -> List[Dict[str, Any]]:
+    """Поиск без полнотекстового индекса (если SQLite собран без FTS5)"""
     try:
         search_pattern = f"%{query}%"
-        async with aiosqlite.connect(config.NOTES_DB) as db:
-            db.row_factory = aiosqlite.Row
+        async with get_connection(config.NOTES_DB) as db:
             async with db.execute("""
                 SELECT * FROM notes
                 WHERE user_id = ? AND (title LIKE ? OR content LIKE ?)
                 ORDER BY updated_at DESC
-            """, (user_id, search_pattern, search_pattern)) as cursor:
+                LIMIT ?
+            """, (user_id, search_pattern, search_pattern, limit)) as cursor:
                 rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+                notes = [dict(row) for row in rows]
+        for note in notes:
+            content = note.get("content") or ""
+            note["snippet"] = html.escape(content[:50] + "..." if len(content) > 50 else content)
+        return notes
     except Exception as e:
         logger.error(f"Ошибка при поиске заметок: {e}")
         return []
@@ -139,7 +202,7 @@ async def update_note(user_id: int, note_id: int, title: str = None, content: st
         updates.append("updated_at = CURRENT_TIMESTAMP")
         params.extend([note_id, user_id])
         
-        async with aiosqlite.connect(config.NOTES_DB) as db:
+        async with get_connection(config.NOTES_DB) as db:
             await db.execute(f"""
                 UPDATE notes
                 SET {', '.join(updates)}
@@ -164,7 +227,7 @@ async def delete_note(user_id: int, note_id: int) -> bool:
         bool: True если успешно удалено
     """
     try:
-        async with aiosqlite.connect(config.NOTES_DB) as db:
+        async with get_connection(config.NOTES_DB) as db:
             cursor = await db.execute("""
                 DELETE FROM notes
                 WHERE id = ? AND user_id = ?
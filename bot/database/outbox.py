@@ -0,0 +1,462 @@
+"""
+Outbox отложенных записей в Supabase
+
+Новая строка сразу сохраняется в локальную таблицу SQLite, и обработчик
+может ответить пользователю, не дожидаясь запроса к Supabase. Фоновая
+задача отправляет накопленные строки пачками (один multi-row запрос на
+пачку строк одной таблицы). Порядок соблюдается для строк одного
+пользователя: пока его ранняя строка ждет повтора, поздние не отправляются,
+а строки других пользователей идут дальше.
+
+Каждая строка получает client_id (UUID) при добавлении, а пачка
+отправляется как upsert по этой колонке: если вставка прошла, но ответ
+потерялся, повтор не создает дубликатов.
+
+Временные ошибки (сеть, таймауты, 5xx) повторяются с экспоненциальной
+задержкой (не реже раза в max_backoff секунд); после max_attempts попыток
+владельцы строк один раз получают уведомление через on_failure. Пачка,
+отклоненная сервером (4xx: нарушение ограничения, неверные данные),
+делится пополам, пока не останутся строки, которые отклоняются сами по
+себе. Такие строки отмечаются failed, убираются из очереди, а владельцы
+получают уведомление.
+
+Отклоненные строки и возврат их в очередь после исправления причины
+(отправятся после перезапуска бота):
+
+    python -m bot.database.outbox status
+    python -m bot.database.outbox redrive
+
+Пока строка не отправлена, чтения видят ее через pending_rows() с
+отрицательным id (-id записи outbox); по такому id строку можно изменить
+или удалить до отправки, а после отправки - узнать настоящий id.
+"""
+import asyncio
+import json
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from postgrest.exceptions import APIError
+import config
+from bot.database.db import get_connection
+from bot.utils.logger import logger
+
+# Отправка пачки строк (upsert по IDEMPOTENCY_KEY): (таблица, строки) -> строки в том же порядке
+Sender = Callable[[str, List[Dict[str, Any]]], Awaitable[List[Dict[str, Any]]]]
+# Уведомление о неотправленных строках: (таблица, строки, отклонены ли сервером) -> None
+FailureHandler = Callable[[str, List[Dict[str, Any]], bool], Awaitable[None]]
+
+# Колонка с UUID строки (уникальна в Supabase) - повторная отправка не создает дубликат
+IDEMPOTENCY_KEY = "client_id"
+
+# Сколько соответствий "id в outbox -> id в Supabase" помнить после отправки
+RESOLVED_MAX_ENTRIES = 10000
+
+# Классы SQLSTATE, при которых PostgREST отвечает 5xx: соединение, конфликт
+# сериализации, нехватка ресурсов, остановка сервера, внутренние ошибки
+_TRANSIENT_SQLSTATE_CLASSES = ("08", "40", "53", "57", "58", "XX")
+# Ошибки PostgREST при недоступности Postgres (503/504)
+_TRANSIENT_PGRST_CODES = ("PGRST000", "PGRST001", "PGRST002", "PGRST003")
+
+
+def _has_values(row: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    return not where or all(row.get(field) == value for field, value in where.items())
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Стоит ли повторять отправку после ошибки
+
+    Сетевые ошибки и таймауты повторяются, как и ответы 5xx. Отказ сервера
+    по самим данным (4xx) при повторе не исчезнет.
+    """
+    if not isinstance(error, APIError):
+        return True
+    code = str(error.code or "")
+    if not code:
+        return True
+    if code.isdigit() and len(code) == 3:
+        # Ответ без JSON: в code - HTTP-статус
+        return int(code) >= 500
+    if code.startswith("PGRST"):
+        return code in _TRANSIENT_PGRST_CODES
+    return code[:2] in _TRANSIENT_SQLSTATE_CLASSES
+
+
+class SupabaseOutbox:
+    """
+    Очередь записей с хранением в SQLite и фоновой отправкой
+    """
+
+    def __init__(self, flush_interval: float, batch_size: int, max_attempts: int, max_backoff: float):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        # id записи -> (таблица, строка), в порядке добавления
+        self._pending: "OrderedDict[int, Tuple[str, Dict[str, Any]]]" = OrderedDict()
+        self._attempts: Dict[int, int] = {}
+        # id записи -> момент time.monotonic(), раньше которого запись не повторяется
+        self._retry_at: Dict[int, float] = {}
+        self._resolved: "OrderedDict[int, int]" = OrderedDict()
+        # Держится на время отправки пачки и при изменении неотправленных строк
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._sender: Optional[Sender] = None
+        self._on_failure: Optional[FailureHandler] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Метрики
+        self.flushed = 0
+        self.batches = 0
+        self.retries = 0
+        self.rejected = 0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None
+
+    async def start(self, sender: Sender, on_failure: Optional[FailureHandler] = None):
+        """
+        Загрузка неотправленных записей и запуск фоновой отправки
+
+        Args:
+            sender: Функция multi-row вставки в Supabase
+            on_failure: Вызывается для отклоненных строк и один раз для строк,
+                исчерпавших max_attempts из-за временных ошибок
+        """
+        if self._worker is not None:
+            return
+        self._sender = sender
+        self._on_failure = on_failure
+        self._stopping = False
+        # Отклоненные записи (failed) ждут redrive и в очередь не попадают
+        async with get_connection(config.OUTBOX_DB) as db:
+            async with db.execute(
+                "SELECT id, target, row, attempts FROM supabase_outbox WHERE failed = 0 ORDER BY id"
+            ) as cursor:
+                entries = await cursor.fetchall()
+            keyed = []
+            for entry_id, target, row, attempts in entries:
+                row = json.loads(row)
+                if IDEMPOTENCY_KEY not in row:
+                    # Записи, добавленные до появления client_id
+                    row[IDEMPOTENCY_KEY] = str(uuid.uuid4())
+                    keyed.append((json.dumps(row, ensure_ascii=False), entry_id))
+                self._pending[entry_id] = (target, row)
+                self._attempts[entry_id] = attempts
+            if keyed:
+                await db.executemany("UPDATE supabase_outbox SET row = ? WHERE id = ?", keyed)
+                await db.commit()
+        if self._pending:
+            logger.info(f"Неотправленных записей в outbox: {len(self._pending)}")
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Последняя попытка отправить очередь и остановка фоновой задачи"""
+        if self._worker is None:
+            return
+        # Ничего не отменяем: прерванная посреди запроса пачка была бы отправлена повторно.
+        # Таймаут проверяется только между пачками
+        self._stopping = True
+        self._wakeup.set()
+        await self._worker
+        self._worker = None
+        try:
+            await self.flush(deadline=time.monotonic() + timeout)
+        except Exception as e:
+            logger.error(f"Не удалось отправить outbox при остановке: {e}")
+        if self._pending:
+            logger.info(f"В outbox осталось записей: {len(self._pending)} (отправятся после запуска)")
+
+    async def add(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Сохранение строки для отправки в Supabase
+
+        Returns:
+            dict: Строка с временным отрицательным id
+        """
+        row = {**row, IDEMPOTENCY_KEY: str(uuid.uuid4())}
+        async with get_connection(config.OUTBOX_DB) as db:
+            cursor = await db.execute(
+                "INSERT INTO supabase_outbox (target, row) VALUES (?, ?)",
+                (table, json.dumps(row, ensure_ascii=False))
+            )
+            await db.commit()
+            entry_id = cursor.lastrowid
+        self._pending[entry_id] = (table, row)
+        self._wakeup.set()
+        return {**row, "id": -entry_id}
+
+    def pending_rows(self, table: str) -> List[Dict[str, Any]]:
+        """Неотправленные строки таблицы (id отрицательный)"""
+        return [
+            {**row, "id": -entry_id}
+            for entry_id, (target, row) in self._pending.items()
+            if target == table
+        ]
+
+    async def update(self, entry_id: int, changes: Dict[str, Any],
+                     where: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Изменение еще не отправленной строки
+
+        Args:
+            entry_id: ID записи outbox
+            changes: Новые значения полей
+            where: Значения, которые должны быть у строки (например, владелец)
+
+        Returns:
+            bool: False если строка уже отправлена (см. resolve) или не найдена
+        """
+        async with self._lock:
+            entry = self._pending.get(entry_id)
+            if entry is None or not _has_values(entry[1], where):
+                return False
+            table, row = entry
+            row = {**row, **changes}
+            async with get_connection(config.OUTBOX_DB) as db:
+                await db.execute(
+                    "UPDATE supabase_outbox SET row = ? WHERE id = ?",
+                    (json.dumps(row, ensure_ascii=False), entry_id)
+                )
+                await db.commit()
+            self._pending[entry_id] = (table, row)
+            return True
+
+    async def discard(self, entry_id: int, where: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Удаление еще не отправленной строки
+
+        Args:
+            entry_id: ID записи outbox
+            where: Значения, которые должны быть у строки (например, владелец)
+
+        Returns:
+            bool: False если строка уже отправлена (см. resolve) или не найдена
+        """
+        async with self._lock:
+            entry = self._pending.get(entry_id)
+            if entry is None or not _has_values(entry[1], where):
+                return False
+            async with get_connection(config.OUTBOX_DB) as db:
+                await db.execute("DELETE FROM supabase_outbox WHERE id = ?", (entry_id,))
+                await db.commit()
+            self._forget(entry_id)
+            return True
+
+    def resolve(self, entry_id: int) -> Optional[int]:
+        """ID строки в Supabase для уже отправленной записи outbox"""
+        return self._resolved.get(entry_id)
+
+    async def flush(self, deadline: Optional[float] = None) -> int:
+        """
+        Отправка накопленных записей (каждая - не больше одной попытки за вызов)
+
+        Args:
+            deadline: Момент time.monotonic(), после которого новые пачки не начинаются
+
+        Returns:
+            int: Количество отправленных строк
+        """
+        sent = 0
+        tried: Set[int] = set()
+        while deadline is None or time.monotonic() < deadline:
+            async with self._lock:
+                batch = self._next_batch(tried)
+                if not batch:
+                    return sent
+                tried.update(batch[1])
+                # shield: отмена flush не прерывает начатую пачку
+                sent += await asyncio.shield(asyncio.ensure_future(self._send(*batch)))
+        return sent
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики outbox"""
+        return {
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "stalled": sum(1 for attempts in self._attempts.values() if attempts >= self.max_attempts),
+        }
+
+    def _next_batch(self, skip: Set[int]) -> Optional[Tuple[str, List[int]]]:
+        # Первая готовая запись задает таблицу, к ней добавляются следующие готовые записи
+        # той же таблицы. Запись, которая ждет повтора или не попала в пачку, задерживает
+        # более поздние записи своего пользователя
+        now = time.monotonic()
+        table = None
+        ids = []
+        held = set()
+        for entry_id, (target, row) in self._pending.items():
+            if len(ids) >= self.batch_size:
+                break
+            owner = row.get("user_id")
+            if owner in held:
+                continue
+            waiting = entry_id in skip or self._retry_at.get(entry_id, 0.0) > now
+            if waiting or (table is not None and target != table):
+                held.add(owner)
+                continue
+            table = target
+            ids.append(entry_id)
+        return (table, ids) if ids else None
+
+    async def _send(self, table: str, ids: List[int]) -> int:
+        rejected: List[Tuple[int, Exception]] = []
+        sent, _ = await self._send_part(table, ids, rejected)
+        if rejected:
+            await self._reject(table, rejected)
+        return sent
+
+    async def _send_part(self, table: str, ids: List[int],
+                         rejected: List[Tuple[int, Exception]]) -> Tuple[int, bool]:
+        # Возвращает (отправлено строк, была ли временная ошибка)
+        rows = [self._pending[entry_id][1] for entry_id in ids]
+        try:
+            created = await self._sender(table, rows)
+        except Exception as e:
+            if is_transient_error(e):
+                await self._record_failure(table, ids, e)
+                return 0, True
+            if len(ids) == 1:
+                rejected.append((ids[0], e))
+                return 0, False
+            # Ищем строки, из-за которых сервер отклоняет пачку
+            middle = len(ids) // 2
+            sent, stalled = await self._send_part(table, ids[:middle], rejected)
+            if stalled:
+                # Вторая половина ждет: в ней могут быть более поздние строки тех же пользователей
+                return sent, True
+            rest, stalled = await self._send_part(table, ids[middle:], rejected)
+            return sent + rest, stalled
+
+        for entry_id in ids:
+            self._forget(entry_id)
+        # PostgREST возвращает строки в порядке запроса
+        if len(created) == len(ids):
+            for entry_id, row in zip(ids, created):
+                self._resolved[entry_id] = row.get("id")
+            while len(self._resolved) > RESOLVED_MAX_ENTRIES:
+                self._resolved.popitem(last=False)
+        async with get_connection(config.OUTBOX_DB) as db:
+            await db.executemany("DELETE FROM supabase_outbox WHERE id = ?", [(entry_id,) for entry_id in ids])
+            await db.commit()
+        self.flushed += len(ids)
+        self.batches += 1
+        return len(ids), False
+
+    async def _record_failure(self, table: str, ids: List[int], error: Exception):
+        attempts = max(self._attempts.get(entry_id, 0) for entry_id in ids) + 1
+        self.retries += 1
+        async with get_connection(config.OUTBOX_DB) as db:
+            await db.executemany(
+                "UPDATE supabase_outbox SET attempts = ?, last_error = ? WHERE id = ?",
+                [(attempts, str(error)[:500], entry_id) for entry_id in ids]
+            )
+            await db.commit()
+        delay = min(self.flush_interval * 2 ** attempts, self.max_backoff)
+        retry_at = time.monotonic() + delay
+        for entry_id in ids:
+            self._attempts[entry_id] = attempts
+            self._retry_at[entry_id] = retry_at
+        logger.warning(f"Ошибка отправки outbox (попытка {attempts}), повтор через {delay:.1f} с: {error}")
+
+        # Строки остаются в очереди: ошибка временная, а пользователь уже получил подтверждение
+        if attempts == self.max_attempts:
+            logger.error(f"Записи outbox {ids} ({table}) не отправлены после {attempts} попыток, "
+                         f"отправка продолжается не реже раза в {self.max_backoff} с: {error}")
+            await self._notify(table, [self._pending[entry_id][1] for entry_id in ids], False)
+
+    async def _reject(self, table: str, rejected: List[Tuple[int, Exception]]):
+        # Строки, которые сервер отклоняет сами по себе, убираются из очереди до redrive
+        async with get_connection(config.OUTBOX_DB) as db:
+            await db.executemany(
+                "UPDATE supabase_outbox SET attempts = attempts + 1, last_error = ?, failed = 1 WHERE id = ?",
+                [(str(error)[:500], entry_id) for entry_id, error in rejected]
+            )
+            await db.commit()
+        rows = []
+        for entry_id, error in rejected:
+            rows.append(self._pending[entry_id][1])
+            self._forget(entry_id)
+            logger.error(f"Запись outbox {entry_id} ({table}) отклонена сервером: {error}")
+        self.rejected += len(rejected)
+        await self._notify(table, rows, True)
+
+    async def _notify(self, table: str, rows: List[Dict[str, Any]], rejected: bool):
+        if self._on_failure is None:
+            return
+        try:
+            await self._on_failure(table, rows, rejected)
+        except Exception as e:
+            logger.error(f"Ошибка уведомления о неотправленных записях outbox: {e}")
+
+    def _forget(self, entry_id: int):
+        del self._pending[entry_id]
+        self._attempts.pop(entry_id, None)
+        self._retry_at.pop(entry_id, None)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping:
+                return
+            # Короткая пауза, чтобы записи, добавленные одновременно, ушли одной пачкой
+            await asyncio.sleep(min(self.flush_interval, 0.05))
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка в фоновой отправке outbox: {e}")
+
+
+# Глобальный outbox для использования в проекте
+outbox = SupabaseOutbox(
+    flush_interval=config.OUTBOX_FLUSH_INTERVAL,
+    batch_size=config.OUTBOX_BATCH_SIZE,
+    max_attempts=config.OUTBOX_MAX_ATTEMPTS,
+    max_backoff=config.OUTBOX_MAX_BACKOFF
+)
+
+
+async def _main(command: str):
+    # Обслуживание outbox из командной строки (бот может быть запущен)
+    from bot.database.db import close_databases, init_databases
+    await init_databases()
+    try:
+        async with get_connection(config.OUTBOX_DB) as db:
+            if command == "redrive":
+                # Отклоненные записи возвращаются в очередь со сброшенным счетчиком попыток;
+                # запущенный бот подхватит их после перезапуска
+                cursor = await db.execute(
+                    "UPDATE supabase_outbox SET attempts = 0, failed = 0 WHERE failed = 1"
+                )
+                await db.commit()
+                print(f"Возвращено в очередь: {cursor.rowcount}")
+                return
+            async with db.execute(
+                "SELECT id, target, attempts, last_error, created_at FROM supabase_outbox "
+                "WHERE failed = 1 ORDER BY id"
+            ) as cursor:
+                rows = await cursor.fetchall()
+            async with db.execute("SELECT COUNT(*) FROM supabase_outbox") as cursor:
+                (total,) = await cursor.fetchone()
+        print(f"Записей в outbox: {total}, отклонено сервером: {len(rows)}")
+        for entry_id, target, attempts, last_error, created_at in rows:
+            print(f"  {entry_id} {target} попыток: {attempts}, создана {created_at}: {last_error}")
+    finally:
+        await close_databases()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("status", "redrive"):
+        print("Использование: python -m bot.database.outbox status|redrive")
+        sys.exit(2)
+    asyncio.run(_main(sys.argv[1]))
@@ -1,9 +1,9 @@
 """
 Модель для работы с расписанием
 """
-import aiosqlite
 import config
 from typing import List, Dict, Any, Optional
+from bot.database.db import get_connection
 from bot.utils.logger import logger
 
 
@@ -22,7 +22,7 @@ async def add_schedule_item(user_id: int, day_of_week: int, subject: str, time:
         int: ID добавленного элемента
     """
     try:
-        async with aiosqlite.connect(config.SCHEDULE_DB) as db:
+        async with get_connection(config.SCHEDULE_DB) as db:
             cursor = await db.execute("""
                 INSERT INTO schedule (user_id, day_of_week, subject, time, room)
                 VALUES (?, ?, ?, ?, ?)
@@ -46,8 +46,7 @@ async def get_schedule_by_day(user_id: int, day_of_week: int) -> List[Dict[str,
         List[Dict]: Список предметов
     """
     try:
-        async with aiosqlite.connect(config.SCHEDULE_DB) as db:
-            db.row_factory = aiosqlite.Row
+        async with get_connection(config.SCHEDULE_DB) as db:
             async with db.execute("""
                 SELECT * FROM schedule
                 WHERE user_id = ? AND day_of_week = ?
@@ -71,8 +70,7 @@ async def get_all_schedule(user_id: int) -> List[Dict[str, Any]]:
         List[Dict]: Список всех предметов
     """
     try:
-        async with aiosqlite.connect(config.SCHEDULE_DB) as db:
-            db.row_factory = aiosqlite.Row
+        async with get_connection(config.SCHEDULE_DB) as db:
             async with db.execute("""
                 SELECT * FROM schedule
                 WHERE user_id = ?
@@ -97,7 +95,7 @@ async def delete_schedule_item(user_id: int, item_id: int) -> bool:
         bool: True если успешно удалено
     """
     try:
-        async with aiosqlite.connect(config.SCHEDULE_DB) as db:
+        async with get_connection(config.SCHEDULE_DB) as db:
             cursor = await db.execute("""
                 DELETE FROM schedule
                 WHERE id = ? AND user_id = ?
@@ -143,7 +141,7 @@ async def update_schedule_item(user_id: int, item_id: int, subject: str = None,
         
         params.extend([item_id, user_id])
         
-        async with aiosqlite.connect(config.SCHEDULE_DB) as db:
+        async with get_connection(config.SCHEDULE_DB) as db:
             await db.execute(f"""
                 UPDATE schedule
                 SET {', '.join(updates)}
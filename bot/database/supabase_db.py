@@ -1,9 +1,16 @@
 # Работа с Supabase
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from supabase import create_client, Client
 from datetime import datetime, date
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Hashable, Iterable, Optional, Tuple
 import config
+from bot.database.cache import QueryCache, query_owner, row_matches
+from bot.database.outbox import IDEMPOTENCY_KEY, outbox
 from bot.utils.logger import logger
+from bot.utils.metrics import db_coalesced, db_errors, db_latency
+from bot.utils.send_queue import PRIORITY_BULK, send_queue
 
 
 class SupabaseDB:
@@ -13,20 +20,176 @@ class SupabaseDB:
                 raise ValueError("SUPABASE_URL и SUPABASE_KEY должны быть установлены в .env")
             
             self.supabase: Client = create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
+            # Клиент supabase синхронный, поэтому HTTP-запросы выполняются
+            # в отдельном пуле потоков и не блокируют event loop
+            self._executor = ThreadPoolExecutor(
+                max_workers=config.SUPABASE_IO_WORKERS,
+                thread_name_prefix="supabase-io"
+            )
+            self.cache = QueryCache(
+                ttl=config.QUERY_CACHE_TTL,
+                max_entries=config.QUERY_CACHE_MAX_ENTRIES,
+                max_bytes=config.QUERY_CACHE_MAX_BYTES
+            )
+            # Выполняющиеся чтения: ключ запроса -> (поколение данных запроса, задача)
+            self._in_flight: Dict[Hashable, Tuple[Hashable, asyncio.Task]] = {}
             logger.info("Подключение к Supabase установлено")
         except Exception as e:
             logger.error(f"Ошибка при подключении к Supabase: {e}")
             raise
     
-    def add_homework(self, subject: str, hw: str, deadline: Optional[date] = None) -> Dict[str, Any]:
+    async def _execute(self, query):
+        loop = asyncio.get_running_loop()
+        labels = {
+            "backend": "supabase",
+            "target": getattr(query, "path", "").strip("/"),
+            "operation": getattr(query, "http_method", ""),
+        }
+        started = time.perf_counter()
         try:
-            data = {
-                "subject": subject,
-                "hw": hw,
-                "deadline": deadline.isoformat() if deadline else None
-            }
+            return await loop.run_in_executor(self._executor, query.execute)
+        except Exception:
+            db_errors.inc(**labels)
+            raise
+        finally:
+            db_latency.observe(time.perf_counter() - started, **labels)
+    
+    async def _select(self, table: str, filters: Dict[str, Any], query,
+                      aggregate: Optional[str] = None) -> List[Dict[str, Any]]:
+        # Чтение через кэш: ключ - таблица и фильтры запроса.
+        # aggregate - имя агрегата (RPC): такой результат сбрасывается при любой записи в таблицу
+        key = (table, tuple(sorted(filters.items())), aggregate)
+        hit, cached = self.cache.get(key)
+        if hit:
+            return cached
+        
+        # Single-flight: одинаковые одновременные запросы ждут один HTTP-запрос.
+        # Присоединяться можно только к запросу, начатому после последней записи
+        # в строки этого пользователя (записи других пользователей не мешают)
+        generation = self.cache.generation(table, query_owner(filters))
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None and in_flight[0] == generation:
+            db_coalesced.inc(backend="supabase", target=table)
+            task = in_flight[1]
+        else:
+            task = asyncio.create_task(self._fetch(key, table, filters, query, generation, aggregate is not None))
+            self._in_flight[key] = (generation, task)
+            task.add_done_callback(lambda done: self._forget_in_flight(key, done))
+        # shield: отмена одного из ожидающих не отменяет общий запрос
+        data = await asyncio.shield(task)
+        return list(data)
+    
+    async def _fetch(self, key: Hashable, table: str, filters: Dict[str, Any], query,
+                     generation: Hashable, aggregate: bool) -> List[Dict[str, Any]]:
+        result = await self._execute(query)
+        data = result.data if result.data else []
+        self.cache.set(key, data, table, filters, generation, aggregate=aggregate)
+        return data
+    
+    def _forget_in_flight(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key, (None, None))[1] is task:
+            del self._in_flight[key]
+        # Ошибку уже получили ожидающие; если все они отменены - не пишем "never retrieved"
+        if not task.cancelled():
+            task.exception()
+    
+    def _with_pending(self, table: str, filters: Dict[str, Any], data: List[Dict[str, Any]],
+                      order: Tuple[str, ...]) -> List[Dict[str, Any]]:
+        # Строки из outbox, еще не отправленные в Supabase, видны в результатах чтения
+        pending = [row for row in outbox.pending_rows(table) if row_matches(filters, row)]
+        if not pending:
+            return data
+        # Сортировка как в Postgres: NULL в конце
+        return sorted(
+            data + pending,
+            key=lambda row: tuple((row.get(field) is None, row.get(field) or "") for field in order)
+        )
+    
+    async def insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Вставка нескольких строк одним запросом (id назначает база);
+        # возвращает созданные строки в том же порядке
+        result = await self._execute(self.supabase.table(table).insert(rows))
+        created = result.data if result.data else []
+        for row in created or rows:
+            self.cache.invalidate(table, row=row, row_id=row.get("id"))
+        return created
+    
+    async def upsert_by_client_id(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Вставка строк с client_id одним запросом: строка, уже вставленная прошлой
+        # попыткой (ответ на нее потерялся), не дублируется, а возвращается с прежним id
+        result = await self._execute(self.supabase.table(table).upsert(rows, on_conflict=IDEMPOTENCY_KEY))
+        created = result.data if result.data else []
+        for row in created or rows:
+            self.cache.invalidate(table, row=row, row_id=row.get("id"))
+        return created
+    
+    async def _insert_many(self, table: str, rows: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        # Пакетная вставка частями по SUPABASE_BATCH_SIZE; None - строка из части с ошибкой
+        results: List[Optional[Dict[str, Any]]] = []
+        for chunk in _chunks(rows, config.SUPABASE_BATCH_SIZE):
+            try:
+                created = await self.insert_rows(table, chunk)
+            except Exception as e:
+                logger.error(f"Ошибка при пакетной записи в {table} ({len(chunk)} строк): {e}")
+                created = []
+            results.extend(created if len(created) == len(chunk) else [None] * len(chunk))
+        return results
+    
+    async def _delete_many(self, table: str, user_id: int, ids: Iterable[int]) -> Dict[int, bool]:
+        # Удаление по списку id: DELETE ... WHERE user_id = ... AND id IN (...) частями по SUPABASE_BATCH_SIZE
+        results: Dict[int, bool] = {}
+        remote: Dict[int, int] = {}  # id в Supabase -> переданный id
+        for row_id in ids:
+            if row_id < 0:
+                real_id = await self._delete_pending(table, user_id, row_id)
+                if real_id is None:
+                    results[row_id] = True
+                    continue
+                remote[real_id] = row_id
+            else:
+                remote[row_id] = row_id
+        
+        for chunk in _chunks(list(remote), config.SUPABASE_BATCH_SIZE):
+            try:
+                result = await self._execute(
+                    self.supabase.table(table).delete().eq("user_id", user_id).in_("id", chunk)
+                )
+            except Exception as e:
+                logger.error(f"Ошибка при пакетном удалении из {table} ({len(chunk)} строк): {e}")
+                results.update((remote[row_id], False) for row_id in chunk)
+                continue
+            deleted = {row.get("id") for row in result.data or []}
+            for row_id in chunk:
+                results[remote[row_id]] = row_id in deleted
+                if row_id in deleted:
+                    self.cache.invalidate(table, row_id=row_id, user_id=user_id)
+        return results
+    
+    async def _update_pending(self, table: str, user_id: int, row_id: int,
+                              changes: Dict[str, Any]) -> Optional[int]:
+        # Отрицательный id - строка в outbox. Возвращает id в Supabase, если строка уже отправлена;
+        # для чужой строки - сам row_id (запрос к Supabase по нему ничего не найдет)
+        if await outbox.update(-row_id, changes, where={"user_id": user_id}):
+            self.cache.invalidate(table, user_id=user_id)
+            return None
+        return outbox.resolve(-row_id) or row_id
+    
+    async def _delete_pending(self, table: str, user_id: int, row_id: int) -> Optional[int]:
+        if await outbox.discard(-row_id, where={"user_id": user_id}):
+            self.cache.invalidate(table, user_id=user_id)
+            return None
+        return outbox.resolve(-row_id) or row_id
+    
+    def close(self):
+        self._executor.shutdown(wait=False)
+    
+    async def add_homework(self, user_id: int, subject: str, hw: str,
+                           deadline: Optional[date] = None) -> Dict[str, Any]:
+        try:
+            data = homework_row(user_id, subject, hw, deadline)
             
-            result = self.supabase.table("homework").insert(data).execute()
+            result = await self._execute(self.supabase.table("homework").insert(data))
+            self.cache.invalidate("homework", row=result.data[0] if result.data else data)
             
             if result.data:
                 logger.info(f"Домашнее задание добавлено: {subject}")
@@ -38,34 +201,83 @@ class SupabaseDB:
             logger.error(f"Ошибка при добавлении домашнего задания: {e}")
             raise
     
-    def get_homework(self, deadline: Optional[date] = None, subject: Optional[str] = None) -> List[Dict[str, Any]]:
+    async def get_homework(self, user_id: int, deadline: Optional[date] = None,
+                           subject: Optional[str] = None) -> List[Dict[str, Any]]:
+        # Все запросы ограничены одним пользователем (индексы (user_id, deadline) и (user_id, subject))
         try:
-            query = self.supabase.table("homework").select("*")
+            query = self.supabase.table("homework").select("*").eq("user_id", user_id)
+            filters = {"user_id": ("eq", str(user_id))}
             
             if deadline:
                 query = query.eq("deadline", deadline.isoformat())
+                filters["deadline"] = ("eq", deadline.isoformat())
             
             if subject:
                 query = query.eq("subject", subject)
+                filters["subject"] = ("eq", subject)
             
-            result = query.order("deadline", desc=False).execute()
+            data = await self._select("homework", filters, query.order("deadline", desc=False))
+            data = self._with_pending("homework", filters, data, ("deadline",))
             
-            logger.info(f"Получено домашних заданий: {len(result.data)}")
-            return result.data if result.data else []
+            logger.info(f"Получено домашних заданий: {len(data)}")
+            return data
             
         except Exception as e:
             logger.error(f"Ошибка при получении домашних заданий: {e}")
             return []
     
-    def add_schedule(self, date: date, subject: str, time: str) -> Dict[str, Any]:
+    async def get_homework_between(self, user_id: int, start: date, end: date) -> List[Dict[str, Any]]:
+        # Один запрос на диапазон дат (использует idx_homework_user_deadline)
         try:
-            data = {
-                "date": date.isoformat(),
-                "subject": subject,
-                "time": time
+            query = (
+                self.supabase.table("homework").select("*")
+                .eq("user_id", user_id)
+                .gte("deadline", start.isoformat())
+                .lte("deadline", end.isoformat())
+            )
+            filters = {
+                "user_id": ("eq", str(user_id)),
+                "deadline": ("range", (start.isoformat(), end.isoformat())),
             }
+            data = await self._select("homework", filters, query.order("deadline", desc=False))
+            data = self._with_pending("homework", filters, data, ("deadline",))
             
-            result = self.supabase.table("schedule").insert(data).execute()
+            logger.info(f"Получено домашних заданий за {start} - {end}: {len(data)}")
+            return data
+            
+        except Exception as e:
+            logger.error(f"Ошибка при получении домашних заданий за период: {e}")
+            return []
+    
+    async def get_homework_stats(self, user_id: int, today: date) -> Dict[str, int]:
+        # Счётчики для экрана прогресса одним RPC (migrations/003_user_scope.sql):
+        # выполненными считаются задания с прошедшим дедлайном
+        try:
+            query = self.supabase.rpc("homework_stats", {"p_user_id": user_id, "p_today": today.isoformat()})
+            filters = {"user_id": ("eq", str(user_id)), "p_today": ("eq", today.isoformat())}
+            data = await self._select("homework", filters, query, aggregate="homework_stats")
+            row = data[0] if data else {}
+            stats = {field: int(row.get(field) or 0) for field in ("total", "completed", "pending")}
+            
+            # Неотправленные строки из outbox тоже учитываются
+            for pending_row in outbox.pending_rows("homework"):
+                if pending_row.get("user_id") != user_id:
+                    continue
+                done = bool(pending_row.get("deadline")) and pending_row["deadline"] < today.isoformat()
+                stats["total"] += 1
+                stats["completed" if done else "pending"] += 1
+            return stats
+            
+        except Exception as e:
+            logger.error(f"Ошибка при получении статистики домашних заданий: {e}")
+            raise
+    
+    async def add_schedule(self, user_id: int, date: date, subject: str, time: str) -> Dict[str, Any]:
+        try:
+            data = schedule_row(user_id, date, subject, time)
+            
+            result = await self._execute(self.supabase.table("schedule").insert(data))
+            self.cache.invalidate("schedule", row=result.data[0] if result.data else data)
             
             if result.data:
                 logger.info(f"Расписание добавлено: {subject} на {date}")
@@ -77,23 +289,53 @@ class SupabaseDB:
             logger.error(f"Ошибка при добавлении расписания: {e}")
             raise
     
-    def get_schedule(self, date: Optional[date] = None) -> List[Dict[str, Any]]:
+    async def get_schedule(self, user_id: int, date: Optional[date] = None) -> List[Dict[str, Any]]:
         try:
-            query = self.supabase.table("schedule").select("*")
+            query = self.supabase.table("schedule").select("*").eq("user_id", user_id)
+            filters = {"user_id": ("eq", str(user_id))}
             
             if date:
                 query = query.eq("date", date.isoformat())
+                filters["date"] = ("eq", date.isoformat())
             
-            result = query.order("time", desc=False).execute()
+            data = await self._select("schedule", filters, query.order("time", desc=False))
+            data = short_times(data)
+            data = self._with_pending("schedule", filters, data, ("time",))
             
-            logger.info(f"Получено записей расписания: {len(result.data)}")
-            return result.data if result.data else []
+            logger.info(f"Получено записей расписания: {len(data)}")
+            return data
             
         except Exception as e:
             logger.error(f"Ошибка при получении расписания: {e}")
             return []
     
-    def update_homework(self, homework_id: int, subject: Optional[str] = None, 
+    async def get_schedule_between(self, user_id: int, start: date, end: date) -> List[Dict[str, Any]]:
+        # Один запрос на диапазон дат (использует idx_schedule_user_date_time)
+        try:
+            query = (
+                self.supabase.table("schedule").select("*")
+                .eq("user_id", user_id)
+                .gte("date", start.isoformat())
+                .lte("date", end.isoformat())
+            )
+            filters = {
+                "user_id": ("eq", str(user_id)),
+                "date": ("range", (start.isoformat(), end.isoformat())),
+            }
+            data = await self._select(
+                "schedule", filters, query.order("date", desc=False).order("time", desc=False)
+            )
+            data = short_times(data)
+            data = self._with_pending("schedule", filters, data, ("date", "time"))
+            
+            logger.info(f"Получено записей расписания за {start} - {end}: {len(data)}")
+            return data
+            
+        except Exception as e:
+            logger.error(f"Ошибка при получении расписания за период: {e}")
+            return []
+    
+    async def update_homework(self, user_id: int, homework_id: int, subject: Optional[str] = None,
                        hw: Optional[str] = None, deadline: Optional[date] = None) -> bool:
         try:
             data = {}
@@ -107,7 +349,15 @@ class SupabaseDB:
             if not data:
                 return False
             
-            result = self.supabase.table("homework").update(data).eq("id", homework_id).execute()
+            if homework_id < 0:
+                homework_id = await self._update_pending("homework", user_id, homework_id, data)
+                if homework_id is None:
+                    return True
+            
+            result = await self._execute(
+                self.supabase.table("homework").update(data).eq("id", homework_id).eq("user_id", user_id)
+            )
+            self.cache.invalidate("homework", row=data, row_id=homework_id, user_id=user_id)
             
             if result.data:
                 logger.info(f"Домашнее задание {homework_id} обновлено")
@@ -118,16 +368,47 @@ class SupabaseDB:
             logger.error(f"Ошибка при обновлении домашнего задания: {e}")
             return False
     
-    def delete_homework(self, homework_id: int) -> bool:
+    async def delete_homework(self, user_id: int, homework_id: int) -> bool:
         try:
-            result = self.supabase.table("homework").delete().eq("id", homework_id).execute()
-            logger.info(f"Домашнее задание {homework_id} удалено")
-            return True
+            if homework_id < 0:
+                homework_id = await self._delete_pending("homework", user_id, homework_id)
+                if homework_id is None:
+                    return True
+            result = await self._execute(
+                self.supabase.table("homework").delete().eq("id", homework_id).eq("user_id", user_id)
+            )
+            self.cache.invalidate("homework", row_id=homework_id, user_id=user_id)
+            if result.data:
+                logger.info(f"Домашнее задание {homework_id} удалено")
+                return True
+            return False
         except Exception as e:
             logger.error(f"Ошибка при удалении домашнего задания: {e}")
             return False
     
-    def update_schedule(self, schedule_id: int, subject: Optional[str] = None,
+    async def add_homework_many(self, user_id: int, items: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        # Добавление нескольких ДЗ (ключи subject, hw, deadline); для каждого элемента -
+        # созданная строка или None, если его часть не записалась
+        rows = [homework_row(user_id, item["subject"], item["hw"], item.get("deadline")) for item in items]
+        results = await self._insert_many("homework", rows)
+        logger.info(f"Добавлено домашних заданий: {sum(row is not None for row in results)} из {len(rows)}")
+        return results
+    
+    async def upsert_homework_many(self, user_id: int, items: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        # Обновление своих ДЗ по id (полные строки: id, subject, hw, deadline);
+        # элементы без id добавляются как новые
+        return await self._upsert_many("homework", user_id, [
+            {"id": item.get("id"), **homework_row(user_id, item["subject"], item["hw"], item.get("deadline"))}
+            for item in items
+        ])
+    
+    async def delete_homework_many(self, user_id: int, ids: Iterable[int]) -> Dict[int, bool]:
+        # Удаление нескольких ДЗ; id -> удалено ли (False - не найдено или ошибка запроса)
+        results = await self._delete_many("homework", user_id, ids)
+        logger.info(f"Удалено домашних заданий: {sum(results.values())} из {len(results)}")
+        return results
+    
+    async def update_schedule(self, user_id: int, schedule_id: int, subject: Optional[str] = None,
                        time: Optional[str] = None, date: Optional[date] = None) -> bool:
         try:
             data = {}
@@ -141,7 +422,15 @@ class SupabaseDB:
             if not data:
                 return False
             
-            result = self.supabase.table("schedule").update(data).eq("id", schedule_id).execute()
+            if schedule_id < 0:
+                schedule_id = await self._update_pending("schedule", user_id, schedule_id, data)
+                if schedule_id is None:
+                    return True
+            
+            result = await self._execute(
+                self.supabase.table("schedule").update(data).eq("id", schedule_id).eq("user_id", user_id)
+            )
+            self.cache.invalidate("schedule", row=data, row_id=schedule_id, user_id=user_id)
             
             if result.data:
                 logger.info(f"Расписание {schedule_id} обновлено")
@@ -152,14 +441,90 @@ class SupabaseDB:
             logger.error(f"Ошибка при обновлении расписания: {e}")
             return False
     
-    def delete_schedule(self, schedule_id: int) -> bool:
+    async def delete_schedule(self, user_id: int, schedule_id: int) -> bool:
         try:
-            result = self.supabase.table("schedule").delete().eq("id", schedule_id).execute()
-            logger.info(f"Расписание {schedule_id} удалено")
-            return True
+            if schedule_id < 0:
+                schedule_id = await self._delete_pending("schedule", user_id, schedule_id)
+                if schedule_id is None:
+                    return True
+            result = await self._execute(
+                self.supabase.table("schedule").delete().eq("id", schedule_id).eq("user_id", user_id)
+            )
+            self.cache.invalidate("schedule", row_id=schedule_id, user_id=user_id)
+            if result.data:
+                logger.info(f"Расписание {schedule_id} удалено")
+                return True
+            return False
         except Exception as e:
             logger.error(f"Ошибка при удалении расписания: {e}")
             return False
+    
+    async def add_schedule_many(self, user_id: int, items: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        # Добавление нескольких записей расписания (ключи date, subject, time); для каждого
+        # элемента - созданная строка или None, если его часть не записалась
+        rows = [schedule_row(user_id, item["date"], item["subject"], item["time"]) for item in items]
+        results = await self._insert_many("schedule", rows)
+        logger.info(f"Добавлено записей расписания: {sum(row is not None for row in results)} из {len(rows)}")
+        return results
+    
+    async def upsert_schedule_many(self, user_id: int, items: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        # Обновление своих записей расписания по id (полные строки: id, date, subject, time);
+        # элементы без id добавляются как новые
+        return await self._upsert_many("schedule", user_id, [
+            {"id": item.get("id"), **schedule_row(user_id, item["date"], item["subject"], item["time"])}
+            for item in items
+        ])
+    
+    async def delete_schedule_many(self, user_id: int, ids: Iterable[int]) -> Dict[int, bool]:
+        # Удаление нескольких записей расписания; id -> удалена ли
+        results = await self._delete_many("schedule", user_id, ids)
+        logger.info(f"Удалено записей расписания: {sum(results.values())} из {len(results)}")
+        return results
+    
+    async def _upsert_many(self, table: str, user_id: int,
+                           rows: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        # Один RPC upsert_<table>_many (migrations/005_batch_upsert.sql) на SUPABASE_BATCH_SIZE строк:
+        # строки с id обновляются в базе только если принадлежат пользователю, строки без id
+        # вставляются. Строки из outbox (отрицательный id) меняются на месте
+        results: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+        remote = []  # (позиция, строка для Supabase)
+        for position, row in enumerate(rows):
+            row_id = row.get("id")
+            if row_id is not None and row_id < 0:
+                changes = {key: value for key, value in row.items() if key != "id"}
+                real_id = await self._update_pending(table, user_id, row_id, changes)
+                if real_id is None:
+                    results[position] = row
+                    continue
+                if real_id < 0:
+                    continue
+                row = {**row, "id": real_id}
+            remote.append((position, row))
+        
+        for chunk in _chunks(remote, config.SUPABASE_BATCH_SIZE):
+            try:
+                result = await self._execute(self.supabase.rpc(
+                    f"upsert_{table}_many", {"p_user_id": user_id, "p_rows": [row for _, row in chunk]}
+                ))
+            except Exception as e:
+                logger.error(f"Ошибка при пакетном обновлении {table} ({len(chunk)} строк): {e}")
+                continue
+            saved = result.data or []
+            for item in saved:
+                row = item["item"]
+                results[chunk[item["item_index"]][0]] = row
+                self.cache.invalidate(table, row=row, row_id=row.get("id"), user_id=user_id)
+            if len(saved) < len(chunk):
+                logger.warning(f"Строк {table} не найдено или они принадлежат другому пользователю: "
+                               f"{len(chunk) - len(saved)}")
+        return results
+
+
+def _chunks(items: List[Any], size: int) -> Iterable[List[Any]]:
+    # Разбиение списка на части не длиннее size
+    size = max(size, 1)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
 
 # Глобальный экземпляр для использования в проекте
@@ -174,23 +539,136 @@ def get_db() -> SupabaseDB:
     return _db_instance
 
 
+def homework_row(user_id: int, subject: str, hw: str, deadline: Optional[date] = None) -> Dict[str, Any]:
+    # Строка таблицы homework для вставки
+    return {
+        "user_id": user_id,
+        "subject": subject,
+        "hw": hw,
+        "deadline": deadline.isoformat() if deadline else None
+    }
+
+
+def schedule_row(user_id: int, date: date, subject: str, time: str) -> Dict[str, Any]:
+    # Строка таблицы schedule для вставки
+    return {
+        "user_id": user_id,
+        "date": date.isoformat(),
+        "subject": subject,
+        "time": time
+    }
+
+
+def short_times(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Колонка time в Postgres возвращается как "HH:MM:SS", в боте время везде "HH:MM"
+    return [
+        {**row, "time": row["time"][:5]} if isinstance(row.get("time"), str) and len(row["time"]) > 5 else row
+        for row in rows
+    ]
+
+
+def group_by_date(rows: List[Dict[str, Any]], field: str) -> Dict[date, List[Dict[str, Any]]]:
+    # Группировка строк по дате за один проход (порядок внутри дня сохраняется)
+    grouped: Dict[date, List[Dict[str, Any]]] = {}
+    for row in rows:
+        value = row.get(field)
+        if not value:
+            continue
+        day = date.fromisoformat(value[:10]) if isinstance(value, str) else value
+        grouped.setdefault(day, []).append(row)
+    return grouped
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    # Счётчики кэша запросов (попадания, промахи, вытеснения)
+    return get_db().cache.stats()
+
+
+def get_table_version(table: str, user_id: int) -> Tuple[int, int]:
+    # Версия данных пользователя в таблице (для кэша готовых экранов):
+    # меняется при записи его строк, записи других пользователей ее не трогают
+    return get_db().cache.version(table, user_id)
+
+
+OUTBOX_FAILURE_TEXT = {
+    "homework": "⚠️ Домашнее задание пока не сохранено: база данных недоступна. Бот продолжает попытки.",
+    "schedule": "⚠️ Запись расписания пока не сохранена: база данных недоступна. Бот продолжает попытки.",
+}
+OUTBOX_REJECTED_TEXT = {
+    "homework": "❌ Домашнее задание «{subject}» не сохранено: база данных отклонила запись. Добавьте его заново.",
+    "schedule": "❌ Запись расписания «{subject}» не сохранена: база данных отклонила запись. Добавьте ее заново.",
+}
+
+
+async def notify_outbox_failure(table: str, rows: List[Dict[str, Any]], rejected: bool):
+    # Пользователь уже видел "добавлено": сообщаем, что запись еще не дошла до Supabase
+    if not send_queue.running:
+        return
+    if rejected:
+        for row in rows:
+            if row.get("user_id"):
+                text = OUTBOX_REJECTED_TEXT[table].format(subject=row.get("subject", ""))
+                await send_queue.send(row["user_id"], text, priority=PRIORITY_BULK)
+        return
+    for user_id in {row.get("user_id") for row in rows if row.get("user_id")}:
+        await send_queue.send(user_id, OUTBOX_FAILURE_TEXT[table], priority=PRIORITY_BULK)
+
+
+async def start_outbox():
+    # Загрузка неотправленных записей и запуск фоновой отправки в Supabase
+    if config.SUPABASE_WRITE_BEHIND:
+        await outbox.start(get_db().upsert_by_client_id, on_failure=notify_outbox_failure)
+
+
+def close_db():
+    # Остановка пула потоков при завершении работы бота
+    global _db_instance
+    if _db_instance is not None:
+        _db_instance.close()
+        _db_instance = None
+
+
 # Обёртки для удобства использования
-async def add_homework(subject: str, text: str, deadline: Optional[date] = None) -> Dict[str, Any]:
+async def add_homework(user_id: int, subject: str, text: str, deadline: Optional[date] = None) -> Dict[str, Any]:
+    db = get_db()
+    if outbox.running:
+        # Запись подтверждается сразу, в Supabase строка уйдет фоном
+        row = await outbox.add("homework", homework_row(user_id, subject, text, deadline))
+        db.cache.invalidate("homework", user_id=user_id)
+        return row
+    return await db.add_homework(user_id, subject, text, deadline)
+
+
+async def get_homework(user_id: int, deadline: Optional[date] = None,
+                       subject: Optional[str] = None) -> List[Dict[str, Any]]:
     db = get_db()
-    return db.add_homework(subject, text, deadline)
+    return await db.get_homework(user_id, deadline, subject)
 
 
-async def get_homework(deadline: Optional[date] = None, subject: Optional[str] = None) -> List[Dict[str, Any]]:
+async def get_homework_between(user_id: int, start: date, end: date) -> List[Dict[str, Any]]:
     db = get_db()
-    return db.get_homework(deadline, subject)
+    return await db.get_homework_between(user_id, start, end)
 
 
-async def add_schedule(date: date, subject: str, time: str) -> Dict[str, Any]:
+async def get_homework_stats(user_id: int, today: date) -> Dict[str, int]:
     db = get_db()
-    return db.add_schedule(date, subject, time)
+    return await db.get_homework_stats(user_id, today)
 
 
-async def get_schedule(date: Optional[date] = None) -> List[Dict[str, Any]]:
+async def add_schedule(user_id: int, date: date, subject: str, time: str) -> Dict[str, Any]:
     db = get_db()
-    return db.get_schedule(date)
+    if outbox.running:
+        row = await outbox.add("schedule", schedule_row(user_id, date, subject, time))
+        db.cache.invalidate("schedule", user_id=user_id)
+        return row
+    return await db.add_schedule(user_id, date, subject, time)
 
+
+async def get_schedule(user_id: int, date: Optional[date] = None) -> List[Dict[str, Any]]:
+    db = get_db()
+    return await db.get_schedule(user_id, date)
+
+
+async def get_schedule_between(user_id: int, start: date, end: date) -> List[Dict[str, Any]]:
+    db = get_db()
+    return await db.get_schedule_between(user_id, start, end)
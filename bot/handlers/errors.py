@@ -1,9 +1,20 @@
 # Глобальная обработка ошибок
 from aiogram import Router
-from aiogram.types import ErrorEvent, Update
+from aiogram.types import CallbackQuery, ErrorEvent, Update
+from bot.middlewares.callback_data import MALFORMED_TEXT, rejected
 from bot.utils.logger import logger
 
-router = Router()
+# Подключается последним: сюда доходят нажатия, которые не обработал ни один роутер
+router = Router(name="errors")
+
+
+@router.callback_query()
+async def unknown_callback(callback: CallbackQuery):
+    # Кнопки старых сообщений (например, "complete_homework_42" до перехода на
+    # закодированную callback_data) не подходят ни одному обработчику
+    rejected.inc()
+    logger.warning(f"Необработанная callback_data от {callback.from_user.id}: {callback.data!r}")
+    await callback.answer(MALFORMED_TEXT, show_alert=True)
 
 
 @router.error()
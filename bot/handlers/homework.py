@@ -1,5 +1,5 @@
 # Обработка домашних заданий
-from aiogram import Router, F
+from aiogram import F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from datetime import datetime
@@ -8,22 +8,28 @@ from bot.keyboards.homework_kb import (
     get_homework_menu, get_homework_items_keyboard, get_edit_homework_keyboard
 )
 from bot.keyboards.main_menu import get_main_menu
+from bot.keyboards.callbacks import HomeworkComplete, HomeworkDelete, HomeworkEdit, HomeworkEditField
 from bot.database.supabase_db import add_homework as supabase_add_homework, get_homework as supabase_get_homework
-from bot.database.supabase_db import get_db
+from bot.database.supabase_db import get_db, get_homework_between, get_table_version, group_by_date
 from datetime import date as date_type
 from bot.utils.validators import validate_text, validate_date
 from bot.utils.formatters import format_homework_list, format_date, get_week_dates
+from bot.utils.callback_data import PayloadRouter
 from bot.utils.logger import logger
-from bot.database.achievements_model import check_achievements
+from bot.utils.render import edit_or_skip
+from bot.utils.view_cache import view_cache
+from bot.database.achievements_model import record_homework_completed, record_homework_deleted
 
-router = Router()
+router = PayloadRouter(name="homework")
+
+MENU_TEXT = "📘 <b>Домашние задания</b>\n\nВыберите действие:"
 
 
 @router.message(F.text == "📘 Домашние задания")
 async def homework_menu(message: Message):
     """Меню домашних заданий"""
     await message.answer(
-        "📘 <b>Домашние задания</b>\n\nВыберите действие:",
+        MENU_TEXT,
         reply_markup=get_homework_menu(),
         parse_mode="HTML"
     )
@@ -84,6 +90,7 @@ async def homework_add_deadline(message: Message, state: FSMContext):
     try:
         deadline_date = deadline.date() if deadline else None
         await supabase_add_homework(
+            user_id=message.from_user.id,
             subject=data['subject'],
             text=data['task'],
             deadline=deadline_date
@@ -105,11 +112,9 @@ async def homework_add_deadline(message: Message, state: FSMContext):
         await state.clear()
 
 
-@router.callback_query(F.data == "homework_today")
-async def homework_view_today(callback: CallbackQuery):
-    """Просмотр ДЗ на сегодня"""
-    today = datetime.now().date()
-    homework_list = await supabase_get_homework(deadline=today)
+async def render_homework_today(user_id: int, today: date_type):
+    """Экран ДЗ на сегодня: (текст, клавиатура)"""
+    homework_list = await supabase_get_homework(user_id, deadline=today)
     
     # Преобразуем данные для форматирования
     formatted_homework = []
@@ -121,24 +126,22 @@ async def homework_view_today(callback: CallbackQuery):
             'is_completed': False  # Supabase схема не имеет этого поля
         })
     
-    text = format_homework_list(formatted_homework, "Домашние задания на сегодня")
-    
-    await callback.message.edit_text(
-        text,
-        reply_markup=get_homework_menu(),
-        parse_mode="HTML"
-    )
+    return format_homework_list(formatted_homework, "Домашние задания на сегодня"), get_homework_menu()
 
 
-@router.callback_query(F.data == "homework_week")
-async def homework_view_week(callback: CallbackQuery):
-    """Просмотр ДЗ на неделю"""
+async def render_homework_week(user_id: int):
+    """Экран ДЗ на неделю: (текст, клавиатура)"""
     week_dates = get_week_dates()
     text = "📘 <b>Домашние задания на неделю</b>\n\n"
     
+    # Один запрос на всю неделю, группировка по дням на клиенте
+    week_homework = group_by_date(
+        await get_homework_between(user_id, week_dates[0][0].date(), week_dates[-1][0].date()),
+        'deadline'
+    )
+    
     for date_obj, day_name in week_dates:
-        date_only = date_obj.date()
-        homework_list = await supabase_get_homework(deadline=date_only)
+        homework_list = week_homework.get(date_obj.date(), [])
         if homework_list:
             text += f"📅 <b>{day_name}</b>\n"
             for item in homework_list:
@@ -158,9 +161,38 @@ async def homework_view_week(callback: CallbackQuery):
     if text == "📘 <b>Домашние задания на неделю</b>\n\n":
         text += "Нет заданий на эту неделю"
     
-    await callback.message.edit_text(
+    return text, get_homework_menu()
+
+
+@router.callback_query(F.data == "homework_today")
+async def homework_view_today(callback: CallbackQuery):
+    """Просмотр ДЗ на сегодня"""
+    today = datetime.now().date()
+    text, markup = await view_cache.get_or_render(
+        callback.from_user.id, "homework_today", today, get_table_version("homework", callback.from_user.id),
+        lambda: render_homework_today(callback.from_user.id, today)
+    )
+    
+    await edit_or_skip(
+        callback,
         text,
-        reply_markup=get_homework_menu(),
+        reply_markup=markup,
+        parse_mode="HTML"
+    )
+
+
+@router.callback_query(F.data == "homework_week")
+async def homework_view_week(callback: CallbackQuery):
+    """Просмотр ДЗ на неделю"""
+    text, markup = await view_cache.get_or_render(
+        callback.from_user.id, "homework_week", datetime.now().date(), get_table_version("homework", callback.from_user.id),
+        lambda: render_homework_week(callback.from_user.id)
+    )
+    
+    await edit_or_skip(
+        callback,
+        text,
+        reply_markup=markup,
         parse_mode="HTML"
     )
 
@@ -179,7 +211,7 @@ async def homework_by_subject_start(callback: CallbackQuery, state: FSMContext):
 async def homework_show_by_subject(message: Message, state: FSMContext):
     """Показ ДЗ по предмету"""
     subject = message.text
-    homework_list = await supabase_get_homework(subject=subject)
+    homework_list = await supabase_get_homework(message.from_user.id, subject=subject)
     
     # Преобразуем данные для форматирования
     formatted_homework = []
@@ -204,7 +236,7 @@ async def homework_show_by_subject(message: Message, state: FSMContext):
 @router.callback_query(F.data == "homework_complete")
 async def homework_complete_start(callback: CallbackQuery):
     """Начало отметки выполнения"""
-    homework_list = await supabase_get_homework()
+    homework_list = await supabase_get_homework(callback.from_user.id)
     if not homework_list:
         await callback.answer("Нет заданий", show_alert=True)
         return
@@ -219,42 +251,45 @@ async def homework_complete_start(callback: CallbackQuery):
             'is_completed': False
         })
     
-    await callback.message.edit_text(
+    await edit_or_skip(
+        callback,
         "✅ <b>Отметить как выполненное</b>\n\nВыберите задание:",
-        reply_markup=get_homework_items_keyboard(formatted_homework, "complete"),
+        reply_markup=get_homework_items_keyboard(formatted_homework, HomeworkComplete),
         parse_mode="HTML"
     )
 
 
-@router.callback_query(F.data.startswith("complete_homework_"))
-async def homework_complete_confirm(callback: CallbackQuery):
+@router.callback_query(HomeworkComplete, flags={"optimistic_ack": "⏳ Сохраняю..."})
+async def homework_complete_confirm(callback: CallbackQuery, payload: HomeworkComplete):
     """Подтверждение выполнения"""
     # В Supabase схеме нет поля is_completed, поэтому просто удаляем задание
-    item_id = int(callback.data.split("_")[-1])
+    item_id = payload.item_id
     db = get_db()
-    success = await db.delete_homework(item_id)
+    success = await db.delete_homework(callback.from_user.id, item_id)
     
-    if success:
-        # Проверка достижений
-        try:
-            bot = callback.bot
-            await check_achievements(callback.from_user.id, bot)
-        except Exception as e:
-            logger.error(f"Ошибка при проверке достижений: {e}")
-        
-        await callback.answer("✅ Задание отмечено как выполненное и удалено", show_alert=True)
+    if not success:
         await callback.message.edit_text(
-            "✅ Задание успешно отмечено как выполненное!",
+            "❌ Не удалось отметить задание. Попробуйте еще раз.",
             reply_markup=get_homework_menu()
         )
-    else:
-        await callback.answer("❌ Ошибка", show_alert=True)
+        return
+    
+    await callback.message.edit_text(
+        "✅ Задание успешно отмечено как выполненное!",
+        reply_markup=get_homework_menu()
+    )
+    
+    # Обновление счетчиков и проверка достижений (уведомления приходят отдельно)
+    try:
+        await record_homework_completed(callback.from_user.id)
+    except Exception as e:
+        logger.error(f"Ошибка при проверке достижений: {e}")
 
 
 @router.callback_query(F.data == "homework_delete")
 async def homework_delete_start(callback: CallbackQuery):
     """Начало удаления"""
-    homework_list = await supabase_get_homework()
+    homework_list = await supabase_get_homework(callback.from_user.id)
     if not homework_list:
         await callback.answer("Нет заданий для удаления", show_alert=True)
         return
@@ -269,34 +304,38 @@ async def homework_delete_start(callback: CallbackQuery):
             'is_completed': False
         })
     
-    await callback.message.edit_text(
+    await edit_or_skip(
+        callback,
         "🗑️ <b>Удаление задания</b>\n\nВыберите задание:",
-        reply_markup=get_homework_items_keyboard(formatted_homework, "delete"),
+        reply_markup=get_homework_items_keyboard(formatted_homework, HomeworkDelete),
         parse_mode="HTML"
     )
 
 
-@router.callback_query(F.data.startswith("delete_homework_"))
-async def homework_delete_confirm(callback: CallbackQuery):
+@router.callback_query(HomeworkDelete, flags={"optimistic_ack": "⏳ Удаляю..."})
+async def homework_delete_confirm(callback: CallbackQuery, payload: HomeworkDelete):
     """Подтверждение удаления"""
-    item_id = int(callback.data.split("_")[-1])
+    item_id = payload.item_id
     db = get_db()
-    success = await db.delete_homework(item_id)
+    success = await db.delete_homework(callback.from_user.id, item_id)
     
     if success:
-        await callback.answer("✅ Задание удалено", show_alert=True)
         await callback.message.edit_text(
             "✅ Задание успешно удалено!",
             reply_markup=get_homework_menu()
         )
+        await record_homework_deleted(callback.from_user.id)
     else:
-        await callback.answer("❌ Ошибка при удалении", show_alert=True)
+        await callback.message.edit_text(
+            "❌ Ошибка при удалении задания. Попробуйте еще раз.",
+            reply_markup=get_homework_menu()
+        )
 
 
 @router.callback_query(F.data == "homework_edit")
 async def homework_edit_start(callback: CallbackQuery):
     """Начало редактирования"""
-    homework_list = await supabase_get_homework()
+    homework_list = await supabase_get_homework(callback.from_user.id)
     if not homework_list:
         await callback.answer("Нет заданий для редактирования", show_alert=True)
         return
@@ -311,40 +350,40 @@ async def homework_edit_start(callback: CallbackQuery):
             'is_completed': False
         })
     
-    await callback.message.edit_text(
+    await edit_or_skip(
+        callback,
         "✏️ <b>Редактирование задания</b>\n\nВыберите задание:",
-        reply_markup=get_homework_items_keyboard(formatted_homework, "edit"),
+        reply_markup=get_homework_items_keyboard(formatted_homework, HomeworkEdit),
         parse_mode="HTML"
     )
 
 
-@router.callback_query(F.data.startswith("edit_homework_"))
-async def homework_edit_item(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(HomeworkEdit)
+async def homework_edit_item(callback: CallbackQuery, payload: HomeworkEdit):
     """Редактирование задания"""
-    parts = callback.data.split("_")
-    if len(parts) == 4:  # edit_homework_subject_123
-        field = parts[2]
-        item_id = int(parts[3])
-        await state.update_data(edit_item_id=item_id, edit_field=field)
-        await state.set_state(HomeworkStates.waiting_for_edit_value)
-        
-        field_names = {
-            "subject": "название предмета",
-            "task": "описание задания",
-            "deadline": "дедлайн (DD.MM.YY)"
-        }
-        
-        await callback.message.edit_text(
-            f"✏️ Введите новое {field_names.get(field, field)}:",
-            parse_mode="HTML"
-        )
-    else:  # edit_homework_123
-        item_id = int(parts[2])
-        await callback.message.edit_text(
-            "✏️ <b>Редактирование</b>\n\nЧто вы хотите изменить?",
-            reply_markup=get_edit_homework_keyboard(item_id),
-            parse_mode="HTML"
-        )
+    await callback.message.edit_text(
+        "✏️ <b>Редактирование</b>\n\nЧто вы хотите изменить?",
+        reply_markup=get_edit_homework_keyboard(payload.item_id),
+        parse_mode="HTML"
+    )
+
+
+@router.callback_query(HomeworkEditField)
+async def homework_edit_field(callback: CallbackQuery, state: FSMContext, payload: HomeworkEditField):
+    """Выбор поля для редактирования"""
+    await state.update_data(edit_item_id=payload.item_id, edit_field=payload.field)
+    await state.set_state(HomeworkStates.waiting_for_edit_value)
+    
+    field_names = {
+        "subject": "название предмета",
+        "task": "описание задания",
+        "deadline": "дедлайн (DD.MM.YY)"
+    }
+    
+    await callback.message.edit_text(
+        f"✏️ Введите новое {field_names[payload.field]}:",
+        parse_mode="HTML"
+    )
 
 
 @router.message(HomeworkStates.waiting_for_edit_value)
@@ -361,22 +400,22 @@ async def homework_edit_save(message: Message, state: FSMContext):
             if not is_valid:
                 await message.answer(f"❌ {error}\n\nПопробуйте снова:")
                 return
-            success = await db.update_homework(item_id, subject=message.text)
+            success = await db.update_homework(message.from_user.id, item_id, subject=message.text)
         elif field == "task":
             is_valid, error = validate_text(message.text, min_length=1, max_length=500)
             if not is_valid:
                 await message.answer(f"❌ {error}\n\nПопробуйте снова:")
                 return
-            success = await db.update_homework(item_id, hw=message.text)
+            success = await db.update_homework(message.from_user.id, item_id, hw=message.text)
         elif field == "deadline":
             if message.text == "/skip":
-                success = await db.update_homework(item_id, deadline=None)
+                success = await db.update_homework(message.from_user.id, item_id, deadline=None)
             else:
                 is_valid, error, date_obj = validate_date(message.text)
                 if not is_valid:
                     await message.answer(f"❌ {error}\n\nПопробуйте снова:")
                     return
-                success = await db.update_homework(item_id, deadline=date_obj.date())
+                success = await db.update_homework(message.from_user.id, item_id, deadline=date_obj.date())
         else:
             success = False
         
@@ -398,6 +437,5 @@ async def homework_edit_save(message: Message, state: FSMContext):
 @router.callback_query(F.data == "homework_back")
 async def homework_back(callback: CallbackQuery):
     """Возврат в меню ДЗ"""
-    await homework_menu(callback.message)
-    await callback.answer()
+    await edit_or_skip(callback, MENU_TEXT, reply_markup=get_homework_menu(), answer=True, parse_mode="HTML")
 
@@ -1,5 +1,5 @@
 # Обработка заметок
-from aiogram import Router, F
+from aiogram import F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from bot.states.notes_states import NotesStates
@@ -7,22 +7,27 @@ from bot.keyboards.notes_kb import (
     get_notes_menu, get_notes_list_keyboard, get_note_actions_keyboard
 )
 from bot.keyboards.main_menu import get_main_menu
+from bot.keyboards.callbacks import NoteDelete, NoteEdit
 from bot.database.notes_model import (
     add_note, get_all_notes, get_note, search_notes,
     update_note, delete_note
 )
 from bot.utils.validators import validate_text
 from bot.utils.formatters import format_notes_list, format_date
+from bot.utils.callback_data import PayloadRouter
 from bot.utils.logger import logger
+from bot.utils.render import edit_or_skip
 
-router = Router()
+router = PayloadRouter(name="notes")
+
+MENU_TEXT = "📝 <b>Заметки</b>\n\nВыберите действие:"
 
 
 @router.message(F.text == "📝 Заметки")
 async def notes_menu(message: Message):
     """Меню заметок"""
     await message.answer(
-        "📝 <b>Заметки</b>\n\nВыберите действие:",
+        MENU_TEXT,
         reply_markup=get_notes_menu(),
         parse_mode="HTML"
     )
@@ -89,7 +94,8 @@ async def notes_view_all(callback: CallbackQuery):
     """Просмотр всех заметок"""
     notes = await get_all_notes(callback.from_user.id)
     if not notes:
-        await callback.message.edit_text(
+        await edit_or_skip(
+            callback,
             "📝 <b>Заметки</b>\n\nНет заметок",
             reply_markup=get_notes_menu(),
             parse_mode="HTML"
@@ -97,7 +103,8 @@ async def notes_view_all(callback: CallbackQuery):
         return
     
     text = format_notes_list(notes)
-    await callback.message.edit_text(
+    await edit_or_skip(
+        callback,
         text,
         reply_markup=get_notes_menu(),
         parse_mode="HTML"
@@ -130,9 +137,9 @@ async def notes_search_execute(message: Message, state: FSMContext):
         text = f"🔍 <b>Результаты поиска: '{query}'</b>\n\n"
         for idx, note in enumerate(notes, 1):
             title = note.get('title', 'Без названия')
-            content = note.get('content', '')
-            preview = content[:50] + "..." if len(content) > 50 else content
-            text += f"<b>{idx}.</b> {title}\n{preview}\n\n"
+            # Фрагмент с подсветкой совпадений (уже экранирован)
+            snippet = note.get('snippet', '')
+            text += f"<b>{idx}.</b> {title}\n{snippet}\n\n"
         
         await message.answer(
             text,
@@ -151,17 +158,18 @@ async def notes_edit_start(callback: CallbackQuery):
         await callback.answer("Нет заметок для редактирования", show_alert=True)
         return
     
-    await callback.message.edit_text(
+    await edit_or_skip(
+        callback,
         "✏️ <b>Редактирование заметки</b>\n\nВыберите заметку:",
-        reply_markup=get_notes_list_keyboard(notes, "edit"),
+        reply_markup=get_notes_list_keyboard(notes, NoteEdit),
         parse_mode="HTML"
     )
 
 
-@router.callback_query(F.data.startswith("edit_note_"))
-async def notes_edit_item(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(NoteEdit)
+async def notes_edit_item(callback: CallbackQuery, state: FSMContext, payload: NoteEdit):
     """Редактирование заметки"""
-    note_id = int(callback.data.split("_")[-1])
+    note_id = payload.note_id
     note = await get_note(callback.from_user.id, note_id)
     
     if not note:
@@ -262,32 +270,34 @@ async def notes_delete_start(callback: CallbackQuery):
         await callback.answer("Нет заметок для удаления", show_alert=True)
         return
     
-    await callback.message.edit_text(
+    await edit_or_skip(
+        callback,
         "🗑️ <b>Удаление заметки</b>\n\nВыберите заметку:",
-        reply_markup=get_notes_list_keyboard(notes, "delete"),
+        reply_markup=get_notes_list_keyboard(notes, NoteDelete),
         parse_mode="HTML"
     )
 
 
-@router.callback_query(F.data.startswith("delete_note_"))
-async def notes_delete_confirm(callback: CallbackQuery):
+@router.callback_query(NoteDelete, flags={"optimistic_ack": "⏳ Удаляю..."})
+async def notes_delete_confirm(callback: CallbackQuery, payload: NoteDelete):
     """Подтверждение удаления"""
-    note_id = int(callback.data.split("_")[-1])
+    note_id = payload.note_id
     success = await delete_note(callback.from_user.id, note_id)
     
     if success:
-        await callback.answer("✅ Заметка удалена", show_alert=True)
         await callback.message.edit_text(
             "✅ Заметка успешно удалена!",
             reply_markup=get_notes_menu()
         )
     else:
-        await callback.answer("❌ Ошибка при удалении", show_alert=True)
+        await callback.message.edit_text(
+            "❌ Ошибка при удалении заметки. Попробуйте еще раз.",
+            reply_markup=get_notes_menu()
+        )
 
 
 @router.callback_query(F.data == "notes_back")
 async def notes_back(callback: CallbackQuery):
     """Возврат в меню заметок"""
-    await notes_menu(callback.message)
-    await callback.answer()
+    await edit_or_skip(callback, MENU_TEXT, reply_markup=get_notes_menu(), answer=True, parse_mode="HTML")
 
@@ -1,37 +1,26 @@
 # Отображение прогресса
+from datetime import date
 from aiogram import Router, F
 from aiogram.types import Message
 from bot.keyboards.main_menu import get_main_menu
-from bot.database.supabase_db import get_homework as supabase_get_homework
+from bot.database.supabase_db import get_homework_stats
 from bot.utils.formatters import format_progress_bar
 from bot.utils.logger import logger
 
-router = Router()
+router = Router(name="progress")
 
 
 @router.message(F.text == "📊 Прогресс")
 async def progress_menu(message: Message):
     """Отображение прогресса"""
     try:
-        # Получаем все ДЗ из Supabase
-        all_homework = await supabase_get_homework()
-        total = len(all_homework)
-        
-        # В Supabase схеме нет поля is_completed, поэтому считаем все как невыполненные
-        completed = 0
-        pending = total
-        percentage = 0.0
-        
-        if total > 0:
-            # Можно считать выполненные по дате дедлайна (если дедлайн прошел)
-            from datetime import date
-            today = date.today()
-            completed = len([h for h in all_homework if h.get('deadline') and 
-                            (isinstance(h.get('deadline'), str) and 
-                             date.fromisoformat(h.get('deadline')) < today or
-                             (not isinstance(h.get('deadline'), str) and h.get('deadline') < today))])
-            pending = total - completed
-            percentage = (completed / total * 100) if total > 0 else 0
+        # Счётчики считаются в базе: выполненными считаются задания с прошедшим дедлайном
+        # (в Supabase схеме нет поля is_completed)
+        stats = await get_homework_stats(message.from_user.id, date.today())
+        total = stats["total"]
+        completed = stats["completed"]
+        pending = stats["pending"]
+        percentage = (completed / total * 100) if total > 0 else 0.0
         
         progress_bar = format_progress_bar(percentage)
         
@@ -4,22 +4,34 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from datetime import datetime, timedelta
 from bot.keyboards.main_menu import get_main_menu
+from bot.utils.reminder_dispatcher import reminder_callback
 from bot.utils.reminder_scheduler import (
     add_daily_reminder, add_one_time_reminder, get_user_reminders
 )
+from bot.utils.send_queue import send_queue, PRIORITY_BULK
 from bot.utils.validators import validate_time, validate_date
 from bot.utils.logger import logger
 from bot.database.supabase_db import get_schedule as supabase_get_schedule, get_homework as supabase_get_homework
 from datetime import date as date_type
 
-router = Router()
+router = Router(name="reminders")
 
 
-async def send_reminder_message(bot, user_id: int, text: str):
+@reminder_callback
+async def send_reminder_message(user_id: int, text: str):
+    # Вызывается планировщиком; отправка идет через общую очередь с лимитами Telegram.
+    # Ждем ответа Telegram: при ошибке диспетчер повторит напоминание
     try:
-        await bot.send_message(user_id, f"⏰ <b>Напоминание</b>\n\n{text}", parse_mode="HTML")
+        await send_queue.send(
+            user_id,
+            f"⏰ <b>Напоминание</b>\n\n{text}",
+            priority=PRIORITY_BULK,
+            wait=True,
+            parse_mode="HTML"
+        )
     except Exception as e:
         logger.error(f"Ошибка при отправке напоминания: {e}")
+        raise
 
 
 @router.message(F.text == "⏰ Напоминания")
@@ -36,12 +48,12 @@ async def reminders_menu(message: Message):
     await message.answer(text, reply_markup=get_main_menu(), parse_mode="HTML")
 
 
-async def setup_schedule_reminders(bot, user_id: int, reminder_time: str = "08:00"):
+async def setup_schedule_reminders(user_id: int, reminder_time: str = "08:00"):
     try:
         today = datetime.now().date()
         
         # Получаем расписание на сегодня
-        schedule_list = await supabase_get_schedule(date=today)
+        schedule_list = await supabase_get_schedule(user_id, date=today)
         
         if schedule_list:
             # Сортируем по времени
@@ -61,16 +73,15 @@ async def setup_schedule_reminders(bot, user_id: int, reminder_time: str = "08:0
                     user_id,
                     reminder_datetime,
                     send_reminder_message,
-                    bot,
                     text
                 )
     except Exception as e:
         logger.error(f"Ошибка при настройке напоминаний о парах: {e}")
 
 
-async def setup_homework_reminders(bot, user_id: int):
+async def setup_homework_reminders(user_id: int):
     try:
-        homework_list = await supabase_get_homework()
+        homework_list = await supabase_get_homework(user_id)
         today = datetime.now().date()
         
         for item in homework_list:
@@ -96,7 +107,6 @@ async def setup_homework_reminders(bot, user_id: int):
                         user_id,
                         reminder_datetime,
                         send_reminder_message,
-                        bot,
                         text
                     )
     except Exception as e:
@@ -1,5 +1,5 @@
 # Обработка расписания
-from aiogram import Router, F
+from aiogram import F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from bot.states.schedule_states import ScheduleStates
@@ -7,20 +7,26 @@ from bot.keyboards.schedule_kb import (
     get_schedule_menu, get_days_keyboard, get_schedule_items_keyboard, get_edit_schedule_keyboard
 )
 from bot.keyboards.main_menu import get_main_menu
+from bot.keyboards.callbacks import ScheduleAddDay, ScheduleDelete, ScheduleEdit, ScheduleEditField, ScheduleViewDay
 from bot.database.supabase_db import add_schedule as supabase_add_schedule, get_schedule as supabase_get_schedule
-from bot.database.supabase_db import get_db
+from bot.database.supabase_db import get_db, get_schedule_between, get_table_version, group_by_date
 from datetime import date as date_type, timedelta, datetime
 from bot.utils.validators import validate_time, validate_text, validate_room
 from bot.utils.formatters import format_schedule_day, get_week_dates, get_day_name
+from bot.utils.callback_data import PayloadRouter
 from bot.utils.logger import logger
+from bot.utils.render import edit_or_skip
+from bot.utils.view_cache import view_cache
 
-router = Router()
+router = PayloadRouter(name="schedule")
+
+MENU_TEXT = "📅 <b>Расписание</b>\n\nВыберите действие:"
 
 
 @router.message(F.text == "📅 Расписание")
 async def schedule_menu(message: Message):
     await message.answer(
-        "📅 <b>Расписание</b>\n\nВыберите действие:",
+        MENU_TEXT,
         reply_markup=get_schedule_menu(),
         parse_mode="HTML"
     )
@@ -35,9 +41,9 @@ async def schedule_add_start(callback: CallbackQuery, state: FSMContext):
     )
 
 
-@router.callback_query(F.data.startswith("day_"))
-async def schedule_add_day(callback: CallbackQuery, state: FSMContext):
-    day_of_week = int(callback.data.split("_")[1])
+@router.callback_query(ScheduleAddDay)
+async def schedule_add_day(callback: CallbackQuery, state: FSMContext, payload: ScheduleAddDay):
+    day_of_week = payload.day
     await state.update_data(day_of_week=day_of_week)
     await state.set_state(ScheduleStates.waiting_for_subject)
     
@@ -100,6 +106,7 @@ async def schedule_add_room(message: Message, state: FSMContext):
         schedule_date = today + timedelta(days=days_until)
         
         await supabase_add_schedule(
+            user_id=message.from_user.id,
             date=schedule_date,
             subject=data['subject'],
             time=data['time']
@@ -125,26 +132,17 @@ async def schedule_add_room(message: Message, state: FSMContext):
 
 @router.callback_query(F.data == "schedule_day")
 async def schedule_view_day(callback: CallbackQuery):
-    await callback.message.edit_text(
+    await edit_or_skip(
+        callback,
         "📅 <b>Просмотр расписания</b>\n\nВыберите день:",
-        reply_markup=get_days_keyboard(),
+        reply_markup=get_days_keyboard(ScheduleViewDay),
         parse_mode="HTML"
     )
 
 
-@router.callback_query(F.data.startswith("day_") and F.message.text.startswith("📅 <b>Просмотр расписания</b>"))
-async def schedule_show_day(callback: CallbackQuery):
-    day_of_week = int(callback.data.split("_")[1])
-    days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
-    
-    # Преобразуем day_of_week в дату
-    today = datetime.now().date()
-    days_until = day_of_week - today.weekday()
-    if days_until < 0:
-        days_until += 7
-    schedule_date = today + timedelta(days=days_until)
-    
-    schedule_list = await supabase_get_schedule(date=schedule_date)
+async def render_schedule_day(user_id: int, schedule_date: date_type, day_name: str):
+    """Экран расписания на день: (текст, клавиатура)"""
+    schedule_list = await supabase_get_schedule(user_id, date=schedule_date)
     
     # Преобразуем для форматирования
     formatted_schedule = []
@@ -155,23 +153,22 @@ async def schedule_show_day(callback: CallbackQuery):
             'room': ''  # В Supabase схеме нет поля room
         })
     
-    text = format_schedule_day(formatted_schedule, days[day_of_week])
-    
-    await callback.message.edit_text(
-        text,
-        reply_markup=get_schedule_menu(),
-        parse_mode="HTML"
-    )
+    return format_schedule_day(formatted_schedule, day_name), get_schedule_menu()
 
 
-@router.callback_query(F.data == "schedule_week")
-async def schedule_view_week(callback: CallbackQuery):
+async def render_schedule_week(user_id: int):
+    """Экран расписания на неделю: (текст, клавиатура)"""
     week_dates = get_week_dates()
     text = "📅 <b>Расписание на неделю</b>\n\n"
     
+    # Один запрос на всю неделю, группировка по дням на клиенте
+    week_schedule = group_by_date(
+        await get_schedule_between(user_id, week_dates[0][0].date(), week_dates[-1][0].date()),
+        'date'
+    )
+    
     for date_obj, day_name in week_dates:
-        date_only = date_obj.date()
-        schedule_list = await supabase_get_schedule(date=date_only)
+        schedule_list = week_schedule.get(date_obj.date(), [])
         
         # Преобразуем для форматирования
         formatted_schedule = []
@@ -184,16 +181,52 @@ async def schedule_view_week(callback: CallbackQuery):
         
         text += format_schedule_day(formatted_schedule, day_name) + "\n\n"
     
-    await callback.message.edit_text(
+    return text, get_schedule_menu()
+
+
+@router.callback_query(ScheduleViewDay)
+async def schedule_show_day(callback: CallbackQuery, payload: ScheduleViewDay):
+    day_of_week = payload.day
+    days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+    
+    # Преобразуем day_of_week в дату
+    today = datetime.now().date()
+    days_until = day_of_week - today.weekday()
+    if days_until < 0:
+        days_until += 7
+    schedule_date = today + timedelta(days=days_until)
+    
+    text, markup = await view_cache.get_or_render(
+        callback.from_user.id, "schedule_day", schedule_date, get_table_version("schedule", callback.from_user.id),
+        lambda: render_schedule_day(callback.from_user.id, schedule_date, days[day_of_week])
+    )
+    
+    await edit_or_skip(
+        callback,
         text,
-        reply_markup=get_schedule_menu(),
+        reply_markup=markup,
+        parse_mode="HTML"
+    )
+
+
+@router.callback_query(F.data == "schedule_week")
+async def schedule_view_week(callback: CallbackQuery):
+    text, markup = await view_cache.get_or_render(
+        callback.from_user.id, "schedule_week", datetime.now().date(), get_table_version("schedule", callback.from_user.id),
+        lambda: render_schedule_week(callback.from_user.id)
+    )
+    
+    await edit_or_skip(
+        callback,
+        text,
+        reply_markup=markup,
         parse_mode="HTML"
     )
 
 
 @router.callback_query(F.data == "schedule_delete")
 async def schedule_delete_start(callback: CallbackQuery):
-    schedule_list = await supabase_get_schedule()
+    schedule_list = await supabase_get_schedule(callback.from_user.id)
     if not schedule_list:
         await callback.answer("Нет предметов для удаления", show_alert=True)
         return
@@ -208,32 +241,35 @@ async def schedule_delete_start(callback: CallbackQuery):
             'room': ''
         })
     
-    await callback.message.edit_text(
+    await edit_or_skip(
+        callback,
         "🗑️ <b>Удаление предмета</b>\n\nВыберите предмет для удаления:",
-        reply_markup=get_schedule_items_keyboard(formatted_schedule, "delete"),
+        reply_markup=get_schedule_items_keyboard(formatted_schedule, ScheduleDelete),
         parse_mode="HTML"
     )
 
 
-@router.callback_query(F.data.startswith("delete_schedule_"))
-async def schedule_delete_confirm(callback: CallbackQuery):
-    item_id = int(callback.data.split("_")[-1])
+@router.callback_query(ScheduleDelete, flags={"optimistic_ack": "⏳ Удаляю..."})
+async def schedule_delete_confirm(callback: CallbackQuery, payload: ScheduleDelete):
+    item_id = payload.item_id
     db = get_db()
-    success = await db.delete_schedule(item_id)
+    success = await db.delete_schedule(callback.from_user.id, item_id)
     
     if success:
-        await callback.answer("✅ Предмет удален", show_alert=True)
         await callback.message.edit_text(
             "✅ Предмет успешно удален!",
             reply_markup=get_schedule_menu()
         )
     else:
-        await callback.answer("❌ Ошибка при удалении", show_alert=True)
+        await callback.message.edit_text(
+            "❌ Ошибка при удалении предмета. Попробуйте еще раз.",
+            reply_markup=get_schedule_menu()
+        )
 
 
 @router.callback_query(F.data == "schedule_edit")
 async def schedule_edit_start(callback: CallbackQuery):
-    schedule_list = await supabase_get_schedule()
+    schedule_list = await supabase_get_schedule(callback.from_user.id)
     if not schedule_list:
         await callback.answer("Нет предметов для редактирования", show_alert=True)
         return
@@ -248,39 +284,38 @@ async def schedule_edit_start(callback: CallbackQuery):
             'room': ''
         })
     
-    await callback.message.edit_text(
+    await edit_or_skip(
+        callback,
         "✏️ <b>Редактирование расписания</b>\n\nВыберите предмет:",
-        reply_markup=get_schedule_items_keyboard(formatted_schedule, "edit"),
+        reply_markup=get_schedule_items_keyboard(formatted_schedule, ScheduleEdit),
         parse_mode="HTML"
     )
 
 
-@router.callback_query(F.data.startswith("edit_schedule_"))
-async def schedule_edit_item(callback: CallbackQuery, state: FSMContext):
-    parts = callback.data.split("_")
-    if len(parts) == 4:  # edit_schedule_subject_123
-        field = parts[2]
-        item_id = int(parts[3])
-        await state.update_data(edit_item_id=item_id, edit_field=field)
-        await state.set_state(ScheduleStates.waiting_for_edit_value)
-        
-        field_names = {
-            "subject": "название предмета",
-            "time": "время (HH:MM)",
-            "room": "номер кабинета"
-        }
-        
-        await callback.message.edit_text(
-            f"✏️ Введите новое {field_names.get(field, field)}:",
-            parse_mode="HTML"
-        )
-    else:  # edit_schedule_123
-        item_id = int(parts[2])
-        await callback.message.edit_text(
-            "✏️ <b>Редактирование</b>\n\nЧто вы хотите изменить?",
-            reply_markup=get_edit_schedule_keyboard(item_id),
-            parse_mode="HTML"
-        )
+@router.callback_query(ScheduleEdit)
+async def schedule_edit_item(callback: CallbackQuery, payload: ScheduleEdit):
+    await callback.message.edit_text(
+        "✏️ <b>Редактирование</b>\n\nЧто вы хотите изменить?",
+        reply_markup=get_edit_schedule_keyboard(payload.item_id),
+        parse_mode="HTML"
+    )
+
+
+@router.callback_query(ScheduleEditField)
+async def schedule_edit_field(callback: CallbackQuery, state: FSMContext, payload: ScheduleEditField):
+    await state.update_data(edit_item_id=payload.item_id, edit_field=payload.field)
+    await state.set_state(ScheduleStates.waiting_for_edit_value)
+    
+    field_names = {
+        "subject": "название предмета",
+        "time": "время (HH:MM)",
+        "room": "номер кабинета"
+    }
+    
+    await callback.message.edit_text(
+        f"✏️ Введите новое {field_names[payload.field]}:",
+        parse_mode="HTML"
+    )
 
 
 @router.message(ScheduleStates.waiting_for_edit_value)
@@ -296,13 +331,13 @@ async def schedule_edit_save(message: Message, state: FSMContext):
             if not is_valid:
                 await message.answer(f"❌ {error}\n\nПопробуйте снова:")
                 return
-            success = await db.update_schedule(item_id, subject=message.text)
+            success = await db.update_schedule(message.from_user.id, item_id, subject=message.text)
         elif field == "time":
             is_valid, error = validate_time(message.text)
             if not is_valid:
                 await message.answer(f"❌ {error}\n\nПопробуйте снова:")
                 return
-            success = await db.update_schedule(item_id, time=message.text)
+            success = await db.update_schedule(message.from_user.id, item_id, time=message.text)
         elif field == "room":
             # В Supabase схеме нет поля room, пропускаем
             await message.answer("⚠️ Поле 'кабинет' не поддерживается в текущей схеме базы данных.")
@@ -328,6 +363,5 @@ async def schedule_edit_save(message: Message, state: FSMContext):
 
 @router.callback_query(F.data == "schedule_back")
 async def schedule_back(callback: CallbackQuery):
-    await schedule_menu(callback.message)
-    await callback.answer()
+    await edit_or_skip(callback, MENU_TEXT, reply_markup=get_schedule_menu(), answer=True, parse_mode="HTML")
 
@@ -1,6 +1,5 @@
 # Обработка настроек
-import aiosqlite
-from aiogram import Router, F
+from aiogram import F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from bot.states.settings_states import SettingsStates
@@ -8,19 +7,23 @@ from bot.keyboards.settings_kb import (
     get_settings_menu, get_language_keyboard, get_theme_keyboard, get_confirm_clear_keyboard
 )
 from bot.keyboards.main_menu import get_main_menu
+from bot.keyboards.callbacks import LanguageChoice, ThemeChoice
 from bot.utils.validators import validate_time
+from bot.database.db import get_connection
+from bot.utils.reminder_scheduler import remove_user_reminders
+from bot.utils.callback_data import PayloadRouter
 from bot.utils.logger import logger
+from bot.utils.render import edit_or_skip
 import config
 
-router = Router()
-settings_db = f"{config.DB_PATH}/settings.db"
+router = PayloadRouter(name="settings")
+settings_db = config.SETTINGS_DB
 
 
 async def get_user_settings(user_id: int) -> dict:
     """Получение настроек пользователя"""
     try:
-        async with aiosqlite.connect(settings_db) as db:
-            db.row_factory = aiosqlite.Row
+        async with get_connection(settings_db) as db:
             async with db.execute("""
                 SELECT * FROM user_settings WHERE user_id = ?
             """, (user_id,)) as cursor:
@@ -64,7 +67,7 @@ async def update_user_settings(user_id: int, **kwargs):
         
         params.append(user_id)
         
-        async with aiosqlite.connect(settings_db) as db:
+        async with get_connection(settings_db) as db:
             await db.execute(f"""
                 UPDATE user_settings
                 SET {', '.join(updates)}
@@ -77,18 +80,34 @@ async def update_user_settings(user_id: int, **kwargs):
         return False
 
 
-@router.message(F.text == "⚙️ Настройки")
-async def settings_menu(message: Message):
-    """Меню настроек"""
-    settings = await get_user_settings(message.from_user.id)
+async def render_settings_menu(user_id: int) -> str:
+    """Текст меню настроек пользователя"""
+    settings = await get_user_settings(user_id)
     
-    text = (
+    return (
         f"⚙️ <b>Настройки</b>\n\n"
         f"🌐 Язык: {config.LANGUAGES.get(settings.get('language', 'ru'), 'Русский')}\n"
         f"🎨 Тема: {config.THEMES.get(settings.get('theme', 'light'), 'Светлая')}\n"
         f"⏰ Время напоминаний: {settings.get('reminder_time', '08:00')}\n\n"
         f"Выберите параметр для изменения:"
     )
+
+
+async def edit_settings_menu(callback: CallbackQuery, answer: bool = False):
+    """Показ меню настроек в сообщении с кнопкой"""
+    await edit_or_skip(
+        callback,
+        await render_settings_menu(callback.from_user.id),
+        reply_markup=get_settings_menu(),
+        answer=answer,
+        parse_mode="HTML"
+    )
+
+
+@router.message(F.text == "⚙️ Настройки")
+async def settings_menu(message: Message):
+    """Меню настроек"""
+    text = await render_settings_menu(message.from_user.id)
     
     await message.answer(
         text,
@@ -100,22 +119,23 @@ async def settings_menu(message: Message):
 @router.callback_query(F.data == "settings_language")
 async def settings_language(callback: CallbackQuery):
     """Выбор языка"""
-    await callback.message.edit_text(
+    await edit_or_skip(
+        callback,
         "🌐 <b>Выбор языка</b>\n\nВыберите язык:",
         reply_markup=get_language_keyboard(),
         parse_mode="HTML"
     )
 
 
-@router.callback_query(F.data.startswith("lang_"))
-async def settings_language_set(callback: CallbackQuery):
+@router.callback_query(LanguageChoice)
+async def settings_language_set(callback: CallbackQuery, payload: LanguageChoice):
     """Установка языка"""
-    lang_code = callback.data.split("_")[1]
+    lang_code = payload.code
     success = await update_user_settings(callback.from_user.id, language=lang_code)
     
     if success:
         await callback.answer("✅ Язык изменен", show_alert=True)
-        await settings_menu(callback.message)
+        await edit_settings_menu(callback)
     else:
         await callback.answer("❌ Ошибка при изменении языка", show_alert=True)
 
@@ -123,22 +143,23 @@ async def settings_language_set(callback: CallbackQuery):
 @router.callback_query(F.data == "settings_theme")
 async def settings_theme(callback: CallbackQuery):
     """Выбор темы"""
-    await callback.message.edit_text(
+    await edit_or_skip(
+        callback,
         "🎨 <b>Выбор темы</b>\n\nВыберите тему:",
         reply_markup=get_theme_keyboard(),
         parse_mode="HTML"
     )
 
 
-@router.callback_query(F.data.startswith("theme_"))
-async def settings_theme_set(callback: CallbackQuery):
+@router.callback_query(ThemeChoice)
+async def settings_theme_set(callback: CallbackQuery, payload: ThemeChoice):
     """Установка темы"""
-    theme_code = callback.data.split("_")[1]
+    theme_code = payload.code
     success = await update_user_settings(callback.from_user.id, theme=theme_code)
     
     if success:
         await callback.answer("✅ Тема изменена", show_alert=True)
-        await settings_menu(callback.message)
+        await edit_settings_menu(callback)
     else:
         await callback.answer("❌ Ошибка при изменении темы", show_alert=True)
 
@@ -187,43 +208,46 @@ async def settings_clear_data_confirm(callback: CallbackQuery):
     )
 
 
-@router.callback_query(F.data == "confirm_clear")
+@router.callback_query(F.data == "confirm_clear", flags={"optimistic_ack": "⏳ Удаляю данные..."})
 async def settings_clear_data_execute(callback: CallbackQuery):
     """Выполнение очистки данных"""
     user_id = callback.from_user.id
     
     try:
-        import aiosqlite
         from bot.database.schedule_model import delete_schedule_item
         from bot.database.homework_model import delete_homework
         from bot.database.notes_model import delete_note
         
         # Удаляем все данные пользователя
-        async with aiosqlite.connect(config.SCHEDULE_DB) as db:
+        async with get_connection(config.SCHEDULE_DB) as db:
             await db.execute("DELETE FROM schedule WHERE user_id = ?", (user_id,))
             await db.commit()
         
-        async with aiosqlite.connect(config.HOMEWORK_DB) as db:
+        async with get_connection(config.HOMEWORK_DB) as db:
             await db.execute("DELETE FROM homework WHERE user_id = ?", (user_id,))
             await db.commit()
         
-        async with aiosqlite.connect(config.NOTES_DB) as db:
+        async with get_connection(config.NOTES_DB) as db:
             await db.execute("DELETE FROM notes WHERE user_id = ?", (user_id,))
             await db.commit()
         
+        # Отменяем все напоминания пользователя
+        await remove_user_reminders(user_id)
+        
         await callback.message.edit_text(
             "✅ Все данные успешно удалены!",
             reply_markup=get_settings_menu()
         )
-        await callback.answer("✅ Данные удалены", show_alert=True)
     except Exception as e:
         logger.error(f"Ошибка при очистке данных: {e}")
-        await callback.answer("❌ Ошибка при удалении данных", show_alert=True)
+        await callback.message.edit_text(
+            "❌ Ошибка при удалении данных. Попробуйте еще раз.",
+            reply_markup=get_settings_menu()
+        )
 
 
 @router.callback_query(F.data == "settings_back")
 async def settings_back(callback: CallbackQuery):
     """Возврат в меню настроек"""
-    await settings_menu(callback.message)
-    await callback.answer()
+    await edit_settings_menu(callback, answer=True)
 
@@ -5,7 +5,7 @@ from aiogram.fsm.context import FSMContext
 from bot.keyboards.main_menu import get_main_menu
 from bot.utils.logger import logger
 
-router = Router()
+router = Router(name="start")
 
 
 @router.message(F.text.in_(["/start", "🔙 Главное меню"]))
@@ -0,0 +1,80 @@
+"""
+Типы callback_data для кнопок с параметрами
+
+Префиксы - часть формата: менять префикс или порядок полей можно только
+вместе с увеличением VERSION в bot/utils/callback_data.py.
+"""
+from typing import Literal, NamedTuple
+import config
+from bot.utils.callback_data import payload
+
+
+# Домашние задания
+@payload("hc")
+class HomeworkComplete(NamedTuple):
+    item_id: int
+
+
+@payload("hd")
+class HomeworkDelete(NamedTuple):
+    item_id: int
+
+
+@payload("he")
+class HomeworkEdit(NamedTuple):
+    item_id: int
+
+
+@payload("hf")
+class HomeworkEditField(NamedTuple):
+    field: Literal["subject", "task", "deadline"]
+    item_id: int
+
+
+# Расписание
+@payload("da")
+class ScheduleAddDay(NamedTuple):
+    day: Literal[0, 1, 2, 3, 4, 5, 6]
+
+
+@payload("dv")
+class ScheduleViewDay(NamedTuple):
+    day: Literal[0, 1, 2, 3, 4, 5, 6]
+
+
+@payload("sd")
+class ScheduleDelete(NamedTuple):
+    item_id: int
+
+
+@payload("se")
+class ScheduleEdit(NamedTuple):
+    item_id: int
+
+
+@payload("sf")
+class ScheduleEditField(NamedTuple):
+    field: Literal["subject", "time", "room"]
+    item_id: int
+
+
+# Заметки
+@payload("ne")
+class NoteEdit(NamedTuple):
+    note_id: int
+
+
+@payload("nd")
+class NoteDelete(NamedTuple):
+    note_id: int
+
+
+# Настройки
+@payload("lg")
+class LanguageChoice(NamedTuple):
+    code: Literal[tuple(config.LANGUAGES)]
+
+
+@payload("th")
+class ThemeChoice(NamedTuple):
+    code: Literal[tuple(config.THEMES)]
@@ -2,7 +2,9 @@
 Клавиатуры для работы с домашними заданиями
 """
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Type
+from bot.keyboards.callbacks import HomeworkEditField
+from bot.utils.callback_data import pack
 
 
 def get_homework_menu() -> InlineKeyboardMarkup:
@@ -20,8 +22,8 @@ def get_homework_menu() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_homework_items_keyboard(items: List[Dict[str, Any]], action: str = "select") -> InlineKeyboardMarkup:
-    """Клавиатура со списком ДЗ"""
+def get_homework_items_keyboard(items: List[Dict[str, Any]], action: Type) -> InlineKeyboardMarkup:
+    """Клавиатура со списком ДЗ (action - тип payload кнопки, например HomeworkDelete)"""
     keyboard = []
     for item in items:
         subject = item.get('subject', '')
@@ -31,7 +33,7 @@ def get_homework_items_keyboard(items: List[Dict[str, Any]], action: str = "sele
         status = "✅" if is_completed else "⏳"
         keyboard.append([InlineKeyboardButton(
             text=f"{status} {subject}: {task}",
-            callback_data=f"{action}_homework_{item_id}"
+            callback_data=pack(action(item_id))
         )])
     keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="homework_back")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -40,9 +42,9 @@ def get_homework_items_keyboard(items: List[Dict[str, Any]], action: str = "sele
 def get_edit_homework_keyboard(item_id: int) -> InlineKeyboardMarkup:
     """Клавиатура для редактирования ДЗ"""
     keyboard = [
-        [InlineKeyboardButton(text="✏️ Предмет", callback_data=f"edit_homework_subject_{item_id}")],
-        [InlineKeyboardButton(text="📝 Задание", callback_data=f"edit_homework_task_{item_id}")],
-        [InlineKeyboardButton(text="📅 Дедлайн", callback_data=f"edit_homework_deadline_{item_id}")],
+        [InlineKeyboardButton(text="✏️ Предмет", callback_data=pack(HomeworkEditField("subject", item_id)))],
+        [InlineKeyboardButton(text="📝 Задание", callback_data=pack(HomeworkEditField("task", item_id)))],
+        [InlineKeyboardButton(text="📅 Дедлайн", callback_data=pack(HomeworkEditField("deadline", item_id)))],
         [InlineKeyboardButton(text="🔙 Назад", callback_data="homework_back")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -2,7 +2,9 @@
 Клавиатуры для работы с заметками
 """
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Type
+from bot.keyboards.callbacks import NoteDelete, NoteEdit
+from bot.utils.callback_data import pack
 
 
 def get_notes_menu() -> InlineKeyboardMarkup:
@@ -18,15 +20,15 @@ def get_notes_menu() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_notes_list_keyboard(notes: List[Dict[str, Any]], action: str = "select") -> InlineKeyboardMarkup:
-    """Клавиатура со списком заметок"""
+def get_notes_list_keyboard(notes: List[Dict[str, Any]], action: Type) -> InlineKeyboardMarkup:
+    """Клавиатура со списком заметок (action - NoteEdit или NoteDelete)"""
     keyboard = []
     for note in notes:
         title = note.get('title', 'Без названия')
         note_id = note.get('id')
         keyboard.append([InlineKeyboardButton(
             text=title,
-            callback_data=f"{action}_note_{note_id}"
+            callback_data=pack(action(note_id))
         )])
     keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="notes_back")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -35,8 +37,8 @@ def get_notes_list_keyboard(notes: List[Dict[str, Any]], action: str = "select")
 def get_note_actions_keyboard(note_id: int) -> InlineKeyboardMarkup:
     """Клавиатура действий с заметкой"""
     keyboard = [
-        [InlineKeyboardButton(text="✏️ Редактировать", callback_data=f"edit_note_{note_id}")],
-        [InlineKeyboardButton(text="🗑️ Удалить", callback_data=f"delete_note_{note_id}")],
+        [InlineKeyboardButton(text="✏️ Редактировать", callback_data=pack(NoteEdit(note_id)))],
+        [InlineKeyboardButton(text="🗑️ Удалить", callback_data=pack(NoteDelete(note_id)))],
         [InlineKeyboardButton(text="🔙 Назад", callback_data="notes_back")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
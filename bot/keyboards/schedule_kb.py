@@ -2,7 +2,9 @@
 Клавиатуры для работы с расписанием
 """
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Type
+from bot.keyboards.callbacks import ScheduleAddDay, ScheduleEditField
+from bot.utils.callback_data import pack
 
 
 def get_schedule_menu() -> InlineKeyboardMarkup:
@@ -18,8 +20,8 @@ def get_schedule_menu() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_days_keyboard() -> InlineKeyboardMarkup:
-    """Выбор дня недели"""
+def get_days_keyboard(action: Type = ScheduleAddDay) -> InlineKeyboardMarkup:
+    """Выбор дня недели (action - ScheduleAddDay или ScheduleViewDay)"""
     days = [
         ("Понедельник", 0),
         ("Вторник", 1),
@@ -33,14 +35,14 @@ def get_days_keyboard() -> InlineKeyboardMarkup:
     for day_name, day_num in days:
         keyboard.append([InlineKeyboardButton(
             text=day_name,
-            callback_data=f"day_{day_num}"
+            callback_data=pack(action(day_num))
         )])
     keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="schedule_back")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_schedule_items_keyboard(items: List[Dict[str, Any]], action: str = "select") -> InlineKeyboardMarkup:
-    """Клавиатура со списком предметов"""
+def get_schedule_items_keyboard(items: List[Dict[str, Any]], action: Type) -> InlineKeyboardMarkup:
+    """Клавиатура со списком предметов (action - тип payload кнопки, например ScheduleDelete)"""
     keyboard = []
     for item in items:
         subject = item.get('subject', '')
@@ -48,7 +50,7 @@ def get_schedule_items_keyboard(items: List[Dict[str, Any]], action: str = "sele
         item_id = item.get('id')
         keyboard.append([InlineKeyboardButton(
             text=f"{time} - {subject}",
-            callback_data=f"{action}_schedule_{item_id}"
+            callback_data=pack(action(item_id))
         )])
     keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="schedule_back")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -57,9 +59,9 @@ def get_schedule_items_keyboard(items: List[Dict[str, Any]], action: str = "sele
 def get_edit_schedule_keyboard(item_id: int) -> InlineKeyboardMarkup:
     """Клавиатура для редактирования предмета"""
     keyboard = [
-        [InlineKeyboardButton(text="✏️ Предмет", callback_data=f"edit_schedule_subject_{item_id}")],
-        [InlineKeyboardButton(text="🕐 Время", callback_data=f"edit_schedule_time_{item_id}")],
-        [InlineKeyboardButton(text="🚪 Кабинет", callback_data=f"edit_schedule_room_{item_id}")],
+        [InlineKeyboardButton(text="✏️ Предмет", callback_data=pack(ScheduleEditField("subject", item_id)))],
+        [InlineKeyboardButton(text="🕐 Время", callback_data=pack(ScheduleEditField("time", item_id)))],
+        [InlineKeyboardButton(text="🚪 Кабинет", callback_data=pack(ScheduleEditField("room", item_id)))],
         [InlineKeyboardButton(text="🔙 Назад", callback_data="schedule_back")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -3,6 +3,8 @@
 """
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import config
+from bot.keyboards.callbacks import LanguageChoice, ThemeChoice
+from bot.utils.callback_data import pack
 
 
 def get_settings_menu() -> InlineKeyboardMarkup:
@@ -23,7 +25,7 @@ def get_language_keyboard() -> InlineKeyboardMarkup:
     for lang_code, lang_name in config.LANGUAGES.items():
         keyboard.append([InlineKeyboardButton(
             text=lang_name,
-            callback_data=f"lang_{lang_code}"
+            callback_data=pack(LanguageChoice(lang_code))
         )])
     keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="settings_back")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -35,7 +37,7 @@ def get_theme_keyboard() -> InlineKeyboardMarkup:
     for theme_code, theme_name in config.THEMES.items():
         keyboard.append([InlineKeyboardButton(
             text=theme_name,
-            callback_data=f"theme_{theme_code}"
+            callback_data=pack(ThemeChoice(theme_code))
         )])
     keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="settings_back")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
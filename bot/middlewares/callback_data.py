@@ -0,0 +1,45 @@
+"""
+Разбор callback_data до обработчиков
+
+Закодированные кнопки (см. bot/utils/callback_data.py) разбираются один раз
+на уровне диспетчера, payload передается обработчикам в data["payload"].
+Некорректная или устаревшая callback_data не доходит до обработчиков:
+пользователь получает уведомление, а апдейт считается обработанным.
+Кнопкам старого формата без версии отвечает bot.handlers.errors.unknown_callback.
+"""
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+from bot.utils.callback_data import MalformedCallbackData, is_packed, unpack
+from bot.utils.logger import logger
+from bot.utils.metrics import registry
+
+MALFORMED_TEXT = "⚠️ Кнопка устарела. Откройте меню заново."
+
+rejected = registry.counter(
+    "bot_callback_data_rejected_total", "Нажатия с некорректной или устаревшей callback_data"
+)
+
+
+class CallbackDataMiddleware(BaseMiddleware):
+    """
+    Outer-middleware для callback_query
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, CallbackQuery) or not is_packed(event.data):
+            return await handler(event, data)
+
+        try:
+            data["payload"] = unpack(event.data)
+        except MalformedCallbackData as e:
+            rejected.inc()
+            logger.warning(f"Отклонена callback_data от {event.from_user.id}: {e}")
+            await event.answer(MALFORMED_TEXT, show_alert=True)
+            return None
+        return await handler(event, data)
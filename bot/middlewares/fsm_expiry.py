@@ -0,0 +1,43 @@
+"""
+Сообщение пользователю об истекшем диалоге
+
+Если состояние FSM было сброшено по TTL или вытеснено, а пользователь
+продолжил ввод, сообщение не попадет ни в один обработчик состояния.
+Вместо тишины бот объясняет, что ввод прерван, и показывает главное меню.
+"""
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import CallbackQuery, Message, TelegramObject
+from bot.keyboards.main_menu import get_main_menu
+
+EXPIRED_TEXT = "⌛ Ввод был прерван из-за долгого бездействия. Начните заново из меню."
+
+
+class FSMExpiryMiddleware(BaseMiddleware):
+    """
+    Outer-middleware для message и callback_query
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        storage = data.get("fsm_storage")
+        context = data.get("state")
+        expired = None
+        if context is not None and data.get("raw_state") is None and hasattr(storage, "pop_expired"):
+            expired = storage.pop_expired(context.key)
+
+        result = await handler(event, data)
+
+        # Кнопки меню и команды обрабатываются как обычно,
+        # объясняем только ввод, который относился к прерванному диалогу
+        if expired and result is UNHANDLED:
+            if isinstance(event, Message):
+                await event.answer(EXPIRED_TEXT, reply_markup=get_main_menu())
+            elif isinstance(event, CallbackQuery):
+                await event.answer(EXPIRED_TEXT, show_alert=True)
+        return result
@@ -0,0 +1,67 @@
+"""
+Замер времени работы обработчиков и запросов к Bot API
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+from bot.utils.metrics import (
+    api_errors, api_latency, handler_errors, handler_latency, handlers_in_flight
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner-middleware: задержка, ошибки и число выполняющихся обработчиков
+
+    Регистрируется на наблюдателях диспетчера и действует на все вложенные
+    роутеры. Метки - имя роутера и имя функции-обработчика.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        router = data.get("event_router")
+        handler_object = data.get("handler")
+        labels = {
+            "router": router.name if router is not None else "",
+            "handler": getattr(handler_object.callback, "__name__", "") if handler_object else "",
+        }
+        handlers_in_flight.inc(**labels)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(**labels)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, **labels)
+            handlers_in_flight.dec(**labels)
+
+
+class BotAPIMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: задержка и ошибки каждого запроса к Bot API
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            api_errors.inc(method=name)
+            raise
+        finally:
+            api_latency.observe(time.perf_counter() - started, method=name)
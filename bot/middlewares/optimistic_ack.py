@@ -0,0 +1,72 @@
+"""
+Мгновенный ответ на нажатие кнопки
+
+Обработчики с флагом optimistic_ack сначала отвечают на callback (кнопка
+перестает "крутиться" после одного запроса к Bot API), а медленная работа
+и итоговое edit_text выполняются в фоновой задаче. Пример:
+
+    @router.callback_query(F.data == "...", flags={"optimistic_ack": "⏳ Сохраняю..."})
+
+Значение флага - текст всплывающего уведомления (True - без текста).
+Такие обработчики сообщают результат правкой сообщения, а не callback.answer().
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Set
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, TelegramObject
+from bot.utils.logger import logger
+from bot.utils.send_queue import PRIORITY_INTERACTIVE, send_queue
+
+FAILURE_TEXT = "❌ Не удалось выполнить действие. Попробуйте позже."
+
+
+class OptimisticAckMiddleware(BaseMiddleware):
+    """
+    Inner-middleware для callback_query
+    """
+
+    def __init__(self, max_background: int):
+        """
+        Args:
+            max_background: Сколько фоновых задач может выполняться одновременно;
+                сверх этого обработчик выполняется сразу (после ответа на callback)
+        """
+        self.max_background = max_background
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        ack = get_flag(data, "optimistic_ack")
+        if not ack or not isinstance(event, CallbackQuery):
+            return await handler(event, data)
+
+        await event.answer(ack if isinstance(ack, str) else None)
+
+        if len(self._tasks) >= self.max_background:
+            return await self._run(handler, event, data)
+        task = asyncio.create_task(self._run(handler, event, data))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return None
+
+    async def _run(self, handler, event: CallbackQuery, data: Dict[str, Any]) -> Any:
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            # Ошибки фоновой задачи не доходят до errors.py - сообщаем сами
+            logger.error(f"Ошибка в фоновом обработчике {event.data}: {e}", exc_info=e)
+            try:
+                await send_queue.send(event.from_user.id, FAILURE_TEXT, priority=PRIORITY_INTERACTIVE)
+            except Exception as notify_error:
+                logger.error(f"Не удалось сообщить пользователю об ошибке: {notify_error}")
+            return None
+
+    async def drain(self):
+        """Ожидание завершения фоновых задач (при остановке бота)"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,94 @@
+"""
+Ограничение частоты запросов пользователей
+
+У каждого пользователя своя корзина токенов: частые нажатия сверх лимита
+не доходят до обработчиков (и до Supabase). Текстовые сообщения внутри
+диалога FSM не ограничиваются: потерянный ответ оставил бы пользователя
+в середине диалога. Об ограничении пользователь узнает один раз, пока
+его снова не пропустят. Общий семафор ограничивает
+число одновременно выполняемых обработчиков, поэтому нагрузка на backend
+остается ограниченной при любом поведении клиентов.
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject, User
+import config
+from bot.utils.logger import logger
+from bot.utils.rate_limit import TokenBucket
+
+THROTTLED_TEXT = "⏳ Слишком часто, подождите немного"
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Outer-middleware: корзина токенов на пользователя и общий лимит параллельности
+    """
+
+    def __init__(self, rate: float, burst: float, concurrency: int, max_users: int):
+        """
+        Args:
+            rate: Сколько событий в секунду разрешено одному пользователю
+            burst: Сколько событий подряд можно сделать сверх rate
+            concurrency: Сколько обработчиков может выполняться одновременно
+            max_users: Сколько корзин пользователей держать в памяти
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        # Кому уже ответили THROTTLED_TEXT с момента последнего пропущенного события
+        self._warned: set = set()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # Метрики
+        self.throttled = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user: User = data.get("event_from_user")
+        # Ответ на шаг диалога (предмет -> задание -> дедлайн) не отбрасываем
+        in_dialog = isinstance(event, Message) and data.get("raw_state") is not None
+        if user is not None and not in_dialog:
+            if self._bucket(user.id).try_acquire():
+                self.throttled += 1
+                logger.debug(f"Пользователь {user.id} ограничен по частоте")
+                # Дешевый путь: без обработчика и без запросов к базе
+                if isinstance(event, CallbackQuery):
+                    await event.answer(THROTTLED_TEXT)
+                elif user.id not in self._warned:
+                    if len(self._warned) >= self.max_users:
+                        self._warned.clear()
+                    self._warned.add(user.id)
+                    await event.answer(THROTTLED_TEXT)
+                return None
+            self._warned.discard(user.id)
+
+        async with self._semaphore:
+            return await handler(event, data)
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+            # Полные корзины ничего не помнят, их можно выбросить
+            if len(self._buckets) > self.max_users:
+                for idle_id in [uid for uid, b in self._buckets.items() if b.is_idle()]:
+                    del self._buckets[idle_id]
+        else:
+            self._buckets.move_to_end(user_id)
+        return bucket
+
+
+def create_throttling_middleware() -> ThrottlingMiddleware:
+    """Middleware с настройками из config"""
+    return ThrottlingMiddleware(
+        rate=config.THROTTLE_RATE,
+        burst=config.THROTTLE_BURST,
+        concurrency=config.HANDLER_CONCURRENCY,
+        max_users=config.THROTTLE_MAX_USERS
+    )
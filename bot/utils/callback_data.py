@@ -0,0 +1,198 @@
+"""
+Компактный формат callback_data и маршрутизация по таблице префиксов
+
+Кнопки с параметрами кодируются как "<версия><префикс>:<поле>:<поле>",
+например "1hc:42" - отметить ДЗ 42 выполненным. Каждому префиксу
+соответствует типизированный payload (NamedTuple), поля которого
+проверяются при разборе: int - целое число, Literal[...] - одно из
+допустимых значений, str - строка без разделителя.
+
+Payload регистрируется декоратором @payload("префикс"), а обработчик -
+обычным декоратором роутера с классом payload вместо фильтра:
+
+    @router.callback_query(HomeworkComplete)
+    async def handler(callback: CallbackQuery, payload: HomeworkComplete): ...
+
+CallbackDataMiddleware один раз разбирает callback_data, а PayloadRouter
+находит обработчик по типу payload в словаре, не перебирая фильтры.
+Статические кнопки ("homework_today" и т.п.) обрабатываются как раньше.
+"""
+from typing import (
+    Any, Dict, Literal, NamedTuple, Optional, Tuple, get_args, get_origin, get_type_hints
+)
+from aiogram import Router
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.dispatcher.event.handler import CallbackType
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.types import TelegramObject
+
+# Версия формата: кнопки старых сообщений с другой версией отклоняются
+VERSION = "1"
+SEPARATOR = ":"
+# Ограничение Telegram на длину callback_data (байты)
+MAX_LENGTH = 64
+
+# префикс -> (класс payload, [(имя поля, тип, допустимые значения)])
+_Field = Tuple[str, type, Optional[Tuple[Any, ...]]]
+_payloads: Dict[str, Tuple[type, Tuple[_Field, ...]]] = {}
+_prefixes: Dict[type, str] = {}
+
+
+class MalformedCallbackData(ValueError):
+    """callback_data не соответствует формату или схеме payload"""
+
+
+def payload(prefix: str):
+    """
+    Декоратор регистрации payload (NamedTuple) под коротким префиксом
+
+    Args:
+        prefix: Уникальный префикс из латинских букв (2 символа достаточно)
+    """
+    if not prefix.isascii() or not prefix.isalpha():
+        raise ValueError(f"Префикс callback_data должен состоять из латинских букв: {prefix!r}")
+
+    def register(cls):
+        if prefix in _payloads:
+            raise ValueError(f"Префикс callback_data {prefix!r} уже занят {_payloads[prefix][0].__name__}")
+        fields = []
+        for name, annotation in get_type_hints(cls).items():
+            if get_origin(annotation) is Literal:
+                choices = get_args(annotation)
+                fields.append((name, type(choices[0]), choices))
+            elif annotation in (int, str):
+                fields.append((name, annotation, None))
+            else:
+                raise TypeError(f"Неподдерживаемый тип поля {cls.__name__}.{name}: {annotation}")
+        _payloads[prefix] = (cls, tuple(fields))
+        _prefixes[cls] = prefix
+        return cls
+
+    return register
+
+
+def is_payload_type(obj: Any) -> bool:
+    """Зарегистрирован ли obj как класс payload"""
+    return isinstance(obj, type) and obj in _prefixes
+
+
+def pack(value: NamedTuple) -> str:
+    """
+    Кодирование payload в callback_data
+
+    Raises:
+        ValueError: Если значение поля содержит разделитель или строка длиннее 64 байт
+    """
+    parts = [VERSION + _prefixes[type(value)]]
+    for item in value:
+        text = str(item)
+        if SEPARATOR in text:
+            raise ValueError(f"Значение {text!r} содержит разделитель callback_data")
+        parts.append(text)
+    data = SEPARATOR.join(parts)
+    if len(data.encode()) > MAX_LENGTH:
+        raise ValueError(f"callback_data длиннее {MAX_LENGTH} байт: {data!r}")
+    return data
+
+
+def is_packed(data: Optional[str]) -> bool:
+    """Закодирована ли строка через pack (начинается с номера версии)"""
+    return bool(data) and data[0].isdigit()
+
+
+def unpack(data: str) -> NamedTuple:
+    """
+    Разбор callback_data в payload
+
+    Raises:
+        MalformedCallbackData: Неизвестная версия или префикс, неверное число полей или значение
+    """
+    if len(data.encode()) > MAX_LENGTH:
+        raise MalformedCallbackData("callback_data слишком длинная")
+    head, *values = data.split(SEPARATOR)
+    if not head.startswith(VERSION):
+        raise MalformedCallbackData(f"Устаревшая версия callback_data: {data!r}")
+    entry = _payloads.get(head[len(VERSION):])
+    if entry is None:
+        raise MalformedCallbackData(f"Неизвестный префикс callback_data: {data!r}")
+    cls, fields = entry
+    if len(values) != len(fields):
+        raise MalformedCallbackData(f"Неверное число полей callback_data: {data!r}")
+
+    parsed = []
+    for (name, kind, choices), text in zip(fields, values):
+        if kind is int:
+            digits = text[1:] if text.startswith("-") else text
+            if not digits or not digits.isascii() or not digits.isdigit():
+                raise MalformedCallbackData(f"Поле {name} должно быть числом: {data!r}")
+            value = int(text)
+        else:
+            value = text
+        if choices is not None and value not in choices:
+            raise MalformedCallbackData(f"Недопустимое значение поля {name}: {data!r}")
+        parsed.append(value)
+    return cls(*parsed)
+
+
+class _PayloadIs:
+    """Фильтр: в data["payload"] значение заданного класса"""
+
+    def __init__(self, payload_type: type):
+        self.payload_type = payload_type
+
+    def __call__(self, event: TelegramObject, payload: Any = None) -> bool:
+        return type(payload) is self.payload_type
+
+
+class PayloadObserver(TelegramEventObserver):
+    """
+    Наблюдатель callback_query с таблицей "класс payload -> обработчик"
+
+    Каждый обработчик payload живет в отдельном обычном наблюдателе aiogram
+    с единственным обработчиком: фильтры, флаги и middleware роутера
+    проверяются штатным trigger. Обработчики статических кнопок
+    проверяются по очереди, как в aiogram.
+
+    Обработчик payload регистрируется и в самом наблюдателе (с фильтром
+    _PayloadIs, который статические нажатия не пропускает), чтобы
+    resolve_used_update_types видел callback_query у роутера только с payload.
+    """
+
+    def __init__(self, router: Router, event_name: str):
+        super().__init__(router=router, event_name=event_name)
+        self.table: Dict[type, TelegramEventObserver] = {}
+
+    def register(self, callback: CallbackType, *filters: CallbackType,
+                 flags: Optional[Dict[str, Any]] = None, **kwargs: Any) -> CallbackType:
+        if not filters or not is_payload_type(filters[0]):
+            return super().register(callback, *filters, flags=flags, **kwargs)
+
+        payload_type, *filters = filters
+        if payload_type in self.table:
+            raise ValueError(f"Обработчик для {payload_type.__name__} уже зарегистрирован")
+        observer = TelegramEventObserver(router=self.router, event_name=self.event_name)
+        # Лишние именованные аргументы отклоняет register aiogram (UnsupportedKeywordArgument)
+        observer.register(callback, *filters, flags=flags, **kwargs)
+        self.table[payload_type] = observer
+        super().register(callback, _PayloadIs(payload_type), *filters, flags=flags)
+        return callback
+
+    async def trigger(self, event: TelegramObject, **kwargs: Any) -> Any:
+        value = kwargs.get("payload")
+        if value is None:
+            return await super().trigger(event, **kwargs)
+
+        observer = self.table.get(type(value))
+        if observer is None:
+            return UNHANDLED
+        return await observer.trigger(event, **kwargs)
+
+
+class PayloadRouter(Router):
+    """Router, в котором callback_query маршрутизируются по таблице payload"""
+
+    def __init__(self, *, name: Optional[str] = None):
+        super().__init__(name=name)
+        self.callback_query = PayloadObserver(router=self, event_name="callback_query")
+        self.observers["callback_query"] = self.callback_query
+
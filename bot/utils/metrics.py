@@ -0,0 +1,260 @@
+"""
+Метрики в текстовом формате Prometheus
+
+Счетчики, gauge и гистограммы с метками хранятся в памяти процесса и
+отдаются встроенным HTTP-сервером на локальном порту (GET /metrics).
+Запись метрики - это несколько операций со словарем, поэтому метрики
+можно не выключать в продакшене.
+"""
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from aiohttp import web
+import config
+from bot.utils.logger import logger
+
+# Границы корзин гистограмм задержки (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Строки значений метрики в формате Prometheus"""
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """Значение, которое может расти и уменьшаться"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам (для задержек)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # Метки -> [счетчики по корзинам (последняя - +Inf), сумма]
+        self._values: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Замер длительности блока"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Набор метрик и функций, добавляющих значения на момент запроса
+    (например, счетчики кэша и очереди отправки)
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Dict[str, float]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames))
+
+    def add_collector(self, collector: Callable[[], Dict[str, float]]):
+        """
+        Добавление функции, возвращающей {имя метрики: значение} (тип gauge)
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                values = collector()
+            except Exception as e:
+                logger.error(f"Ошибка при сборе метрик: {e}")
+                continue
+            for name, value in values.items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+
+# Глобальный реестр и общие метрики проекта
+registry = Registry()
+
+handler_latency = registry.histogram(
+    "bot_handler_duration_seconds", "Время выполнения обработчика", ("router", "handler")
+)
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ("router", "handler")
+)
+handlers_in_flight = registry.gauge(
+    "bot_handlers_in_flight", "Обработчики, выполняющиеся сейчас", ("router", "handler")
+)
+db_latency = registry.histogram(
+    "bot_db_query_duration_seconds", "Время запроса к базе данных", ("backend", "target", "operation")
+)
+db_errors = registry.counter(
+    "bot_db_errors_total", "Ошибки запросов к базе данных", ("backend", "target", "operation")
+)
+db_coalesced = registry.counter(
+    "bot_db_coalesced_total", "Запросы, присоединившиеся к такому же выполняющемуся запросу", ("backend", "target")
+)
+api_latency = registry.histogram(
+    "bot_api_request_duration_seconds", "Время запроса к Telegram Bot API", ("method",)
+)
+api_errors = registry.counter(
+    "bot_api_errors_total", "Ошибки запросов к Telegram Bot API", ("method",)
+)
+
+
+def flatten_stats(prefix: str, stats: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Числовые поля словаря stats() в виде {prefix_поле: значение}
+
+    Вложенные словари разворачиваются через "_", нечисловые поля пропускаются.
+    """
+    result = {}
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            result.update(flatten_stats(name, value))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            result[name] = value
+    return result
+
+
+_runner: Optional[web.AppRunner] = None
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server():
+    """Запуск HTTP-сервера метрик (config.METRICS_PORT = 0 - не запускать)"""
+    global _runner
+    if not config.METRICS_PORT or _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host=config.METRICS_HOST, port=config.METRICS_PORT).start()
+    logger.info(f"Метрики доступны на http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
+
+
+async def stop_metrics_server():
+    """Остановка HTTP-сервера метрик"""
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
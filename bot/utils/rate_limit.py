@@ -0,0 +1,59 @@
+"""
+Ограничение частоты: token bucket
+"""
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Корзина токенов: rate токенов в секунду, не больше capacity про запас
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Попытка взять токены без ожидания
+
+        Returns:
+            float: 0 если токены взяты, иначе сколько секунд ждать до их появления
+        """
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1.0):
+        """Ожидание и взятие токенов"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def penalize(self, seconds: float):
+        """
+        Запрет выдачи токенов на seconds секунд (например, после 429 от Telegram)
+
+        Несколько одновременных штрафов не складываются: действует самый долгий.
+        """
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def is_idle(self) -> bool:
+        """Корзина полная - ее можно удалить без потери состояния"""
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
@@ -0,0 +1,259 @@
+"""
+Диспетчер напоминаний по минутным корзинам
+
+Вместо отдельной задачи APScheduler на каждое напоминание все напоминания
+хранятся компактными строками в таблице reminder_queue с номером минуты
+срабатывания. Одна задача-диспетчер раз в минуту забирает созревшие
+напоминания пачками и отправляет их.
+
+Напоминание удаляется (или переносится на следующий день) только после
+успешной отправки. На время отправки строка арендуется (leased_until), и
+если бот упадет посередине, после истечения аренды она отправится снова.
+Ежедневные напоминания срабатывают в одно и то же время по часам (daily_at),
+в том числе после перехода на летнее/зимнее время.
+"""
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from apscheduler.util import obj_to_ref
+import config
+from bot.database.db import get_connection
+from bot.utils.logger import logger
+
+# Функции, которые можно вызывать из напоминаний: ссылка "модуль:имя" -> функция.
+# Ссылка читается из базы, поэтому произвольные функции по ней не импортируются
+_callbacks: Dict[str, Callable] = {}
+
+
+def reminder_callback(func: Callable) -> Callable:
+    """Декоратор: разрешает использовать функцию как callback напоминаний"""
+    _callbacks[obj_to_ref(func)] = func
+    return func
+
+
+def to_minute(moment: datetime) -> int:
+    """Номер минуты (от начала эпохи) для момента времени"""
+    return int(moment.timestamp() // 60)
+
+
+def next_daily_minute(daily_at: str, now: datetime) -> int:
+    """
+    Минута следующего срабатывания ежедневного напоминания после now
+
+    Считается по часам (как CronTrigger), а не прибавлением 24 часов,
+    поэтому смена часового пояса на летнее время не сдвигает напоминание.
+    """
+    hour, minute = map(int, daily_at.split(":"))
+    candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if to_minute(candidate) <= to_minute(now):
+        candidate = (now + timedelta(days=1)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return to_minute(candidate)
+
+
+async def enqueue_reminder(key: str, user_id: int, run_at: datetime, callback: Callable,
+                           args: List[Any], kwargs: Dict[str, Any], daily_at: Optional[str] = None):
+    """
+    Постановка напоминания в очередь
+
+    Args:
+        key: ID напоминания (повторная постановка с тем же ID заменяет его)
+        user_id: ID пользователя
+        run_at: Время первого срабатывания
+        callback: Функция, отмеченная @reminder_callback; вызывается как callback(user_id, *args, **kwargs)
+            и должна выбрасывать исключение, если отправить не удалось
+        args, kwargs: Сериализуемые в JSON аргументы
+        daily_at: Время HH:MM для ежедневного напоминания (None - разовое)
+
+    Raises:
+        ValueError: Если callback не отмечен @reminder_callback
+    """
+    ref = obj_to_ref(callback)
+    if _callbacks.get(ref) is not callback:
+        raise ValueError(f"{ref} не зарегистрирован через @reminder_callback")
+    async with get_connection(config.REMINDERS_DB) as db:
+        await db.execute("""
+            INSERT INTO reminder_queue (key, user_id, due_minute, repeat_minutes, daily_at, callback, args)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                user_id = excluded.user_id,
+                due_minute = excluded.due_minute,
+                repeat_minutes = excluded.repeat_minutes,
+                daily_at = excluded.daily_at,
+                callback = excluded.callback,
+                args = excluded.args,
+                leased_until = 0
+        """, (key, user_id, to_minute(run_at), 24 * 60 if daily_at else 0, daily_at, ref,
+              json.dumps([args, kwargs], ensure_ascii=False, separators=(",", ":"))))
+        await db.commit()
+
+
+async def remove_reminder(key: str) -> bool:
+    """
+    Удаление напоминания из очереди
+
+    Args:
+        key: ID напоминания
+
+    Returns:
+        bool: True если напоминание было удалено
+    """
+    async with get_connection(config.REMINDERS_DB) as db:
+        cursor = await db.execute("DELETE FROM reminder_queue WHERE key = ?", (key,))
+        await db.commit()
+        return cursor.rowcount > 0
+
+
+async def remove_user_reminders(user_id: int) -> int:
+    """
+    Удаление всех напоминаний пользователя
+
+    Args:
+        user_id: ID пользователя
+
+    Returns:
+        int: Количество удаленных напоминаний
+    """
+    async with get_connection(config.REMINDERS_DB) as db:
+        cursor = await db.execute("DELETE FROM reminder_queue WHERE user_id = ?", (user_id,))
+        await db.commit()
+        return cursor.rowcount
+
+
+async def get_user_reminders(user_id: int) -> List[Dict[str, Any]]:
+    """
+    Напоминания пользователя в формате reminder_scheduler.get_user_reminders
+
+    Args:
+        user_id: ID пользователя
+
+    Returns:
+        list: Список напоминаний
+    """
+    async with get_connection(config.REMINDERS_DB) as db:
+        async with db.execute("""
+            SELECT key, due_minute, daily_at FROM reminder_queue
+            WHERE user_id = ?
+            ORDER BY due_minute
+        """, (user_id,)) as cursor:
+            rows = await cursor.fetchall()
+    return [
+        {
+            "id": row["key"],
+            "next_run": datetime.fromtimestamp(row["due_minute"] * 60),
+            "trigger": f"daily at {row['daily_at']}" if row["daily_at"] else "once"
+        }
+        for row in rows
+    ]
+
+
+async def _take_due_batch(now_minute: int, now_ts: int) -> List[Dict[str, Any]]:
+    """
+    Забирает пачку созревших напоминаний в аренду на REMINDER_LEASE_TIME секунд
+
+    Пока аренда не истекла, строку не заберет ни следующая пачка, ни
+    следующий тик; удаляется она только в _finish_batch.
+    """
+    async with get_connection(config.REMINDERS_DB) as db:
+        async with db.execute("""
+            SELECT id, user_id, due_minute, daily_at, callback, args
+            FROM reminder_queue
+            WHERE due_minute <= ? AND leased_until <= ?
+            ORDER BY due_minute, id
+            LIMIT ?
+        """, (now_minute, now_ts, config.REMINDER_BATCH_SIZE)) as cursor:
+            rows = [dict(row) for row in await cursor.fetchall()]
+
+        if rows:
+            await db.executemany(
+                "UPDATE reminder_queue SET leased_until = ? WHERE id = ?",
+                [(now_ts + config.REMINDER_LEASE_TIME, row["id"]) for row in rows]
+            )
+            await db.commit()
+        return rows
+
+
+async def _finish_batch(done: List[Dict[str, Any]], retry: List[Dict[str, Any]], now: datetime):
+    """
+    Обработанные напоминания удаляются или переносятся на следующий день,
+    неотправленные остаются в очереди до следующего тика
+    """
+    finished = [(row["id"],) for row in done if not row["daily_at"]]
+    rescheduled = [
+        (next_daily_minute(row["daily_at"], now), row["id"])
+        for row in done if row["daily_at"]
+    ]
+    retry_at = int(now.timestamp()) + 60
+    async with get_connection(config.REMINDERS_DB) as db:
+        if finished:
+            await db.executemany("DELETE FROM reminder_queue WHERE id = ?", finished)
+        if rescheduled:
+            await db.executemany(
+                "UPDATE reminder_queue SET due_minute = ?, leased_until = 0 WHERE id = ?", rescheduled
+            )
+        if retry:
+            await db.executemany(
+                "UPDATE reminder_queue SET leased_until = ? WHERE id = ?",
+                [(retry_at, row["id"]) for row in retry]
+            )
+        await db.commit()
+
+
+async def _deliver(row: Dict[str, Any], semaphore: asyncio.Semaphore) -> bool:
+    """Отправка одного напоминания; False - повторить на следующем тике"""
+    callback = _callbacks.get(row["callback"])
+    if callback is None:
+        # Повтор не поможет: строка удаляется
+        logger.error(f"Напоминание {row['id']}: callback {row['callback']} не разрешен, пропущено")
+        return True
+    async with semaphore:
+        try:
+            args, kwargs = json.loads(row["args"])
+            await callback(row["user_id"], *args, **kwargs)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при отправке напоминания {row['id']}: {e}")
+            return False
+
+
+async def dispatch_due_reminders():
+    """
+    Тик диспетчера: отправка всех созревших напоминаний пачками
+    """
+    started = time.monotonic()
+    now = datetime.now()
+    now_minute = to_minute(now)
+    now_ts = int(now.timestamp())
+    oldest_allowed = now_minute - config.REMINDER_MISFIRE_GRACE_TIME // 60
+    semaphore = asyncio.Semaphore(config.REMINDER_SEND_CONCURRENCY)
+    delivered = 0
+    skipped = 0
+    failed = 0
+
+    while True:
+        batch = await _take_due_batch(now_minute, now_ts)
+        if not batch:
+            break
+
+        # Слишком старые (например, пропущенные за время простоя или безуспешно
+        # повторяемые дольше REMINDER_MISFIRE_GRACE_TIME) не отправляем
+        due = [row for row in batch if row["due_minute"] >= oldest_allowed]
+        stale = [row for row in batch if row["due_minute"] < oldest_allowed]
+        results = await asyncio.gather(*(_deliver(row, semaphore) for row in due))
+        sent = [row for row, ok in zip(due, results) if ok]
+        retry = [row for row, ok in zip(due, results) if not ok]
+        await _finish_batch(sent + stale, retry, now)
+        delivered += len(sent)
+        skipped += len(stale)
+        failed += len(retry)
+
+        if len(batch) < config.REMINDER_BATCH_SIZE:
+            break
+
+    if delivered or skipped or failed:
+        logger.info(
+            f"Диспетчер напоминаний: отправлено {delivered}, пропущено {skipped}, "
+            f"отложено после ошибки {failed} "
+            f"за {time.monotonic() - started:.2f} с"
+        )
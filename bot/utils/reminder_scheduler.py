@@ -1,21 +1,116 @@
 """
 Модуль для работы с напоминаниями через apscheduler
+
+Задачи хранятся в локальной SQLite (SQLAlchemyJobStore) и переживают
+перезапуск бота. Поэтому в аргументы задач передаются только
+сериализуемые значения, а экземпляр бота берется через get_bot().
+
+В режиме REMINDER_DISPATCH_MODE = "buckets" напоминания не становятся
+отдельными задачами, а передаются в reminder_dispatcher.
 """
+import os
+from apscheduler.events import EVENT_JOB_REMOVED
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
-from datetime import datetime, timedelta
-from typing import Callable, Any
+from datetime import datetime
+from typing import Callable, Any, Dict, Optional, Set
+import config
+from bot.utils import reminder_dispatcher
 from bot.utils.logger import logger
 
 # Глобальный планировщик
-scheduler = AsyncIOScheduler()
+scheduler = AsyncIOScheduler(
+    jobstores={"default": SQLAlchemyJobStore(url=f"sqlite:///{config.SCHEDULER_DB}")},
+    job_defaults={
+        # Пропущенные за время простоя запуски схлопываются в один,
+        # слишком старые не выполняются вовсе
+        "coalesce": True,
+        "misfire_grace_time": config.REMINDER_MISFIRE_GRACE_TIME,
+    }
+)
+
+# Индекс задач по пользователям: user_id -> ID задач и обратно
+_user_jobs: Dict[int, Set[str]] = {}
+_job_owner: Dict[str, int] = {}
+
+# Экземпляр бота для задач (в хранилище задач его сохранить нельзя)
+_bot = None
+
+
+def set_bot(bot):
+    """Регистрация экземпляра бота для задач планировщика"""
+    global _bot
+    _bot = bot
+
+
+def get_bot():
+    """Экземпляр бота для задач планировщика"""
+    if _bot is None:
+        raise RuntimeError("Бот не зарегистрирован в планировщике (вызовите set_bot)")
+    return _bot
+
+
+def _index_job(user_id: int, job_id: str):
+    _user_jobs.setdefault(user_id, set()).add(job_id)
+    _job_owner[job_id] = user_id
+
+
+def _unindex_job(job_id: str):
+    user_id = _job_owner.pop(job_id, None)
+    if user_id is None:
+        return
+    jobs = _user_jobs.get(user_id)
+    if jobs is not None:
+        jobs.discard(job_id)
+        if not jobs:
+            del _user_jobs[user_id]
+
+
+def _on_job_removed(event):
+    # Срабатывает и при явном удалении, и после последнего запуска разовой задачи
+    _unindex_job(event.job_id)
+
+
+def _rebuild_index():
+    """Построение индекса по задачам, восстановленным из хранилища"""
+    _user_jobs.clear()
+    _job_owner.clear()
+    for job in scheduler.get_jobs():
+        # Все задачи создаются с user_id первым аргументом
+        if job.args and isinstance(job.args[0], int):
+            _index_job(job.args[0], job.id)
+
+
+DISPATCHER_JOB_ID = "reminder_dispatcher"
+
+
+def _use_buckets() -> bool:
+    return config.REMINDER_DISPATCH_MODE == "buckets"
 
 
 def start_scheduler():
     """Запуск планировщика"""
     if not scheduler.running:
+        os.makedirs(config.DB_PATH, exist_ok=True)
+        scheduler.add_listener(_on_job_removed, EVENT_JOB_REMOVED)
         scheduler.start()
+        _rebuild_index()
+        
+        if _use_buckets():
+            # Одна задача на все напоминания: раз в минуту разбирает созревшую корзину
+            scheduler.add_job(
+                reminder_dispatcher.dispatch_due_reminders,
+                trigger=CronTrigger(second=0),
+                id=DISPATCHER_JOB_ID,
+                max_instances=1,
+                replace_existing=True
+            )
+        elif scheduler.get_job(DISPATCHER_JOB_ID):
+            scheduler.remove_job(DISPATCHER_JOB_ID)
+        
         logger.info("Планировщик напоминаний запущен")
 
 
@@ -33,13 +128,23 @@ async def add_daily_reminder(user_id: int, time: str, callback: Callable, *args,
     Args:
         user_id: ID пользователя
         time: Время в формате HH:MM
-        callback: Функция обратного вызова
-        *args, **kwargs: Аргументы для callback
+        callback: Функция обратного вызова уровня модуля (вызывается как callback(user_id, *args))
+        *args, **kwargs: Сериализуемые аргументы для callback
     """
     try:
         hour, minute = map(int, time.split(':'))
         job_id = f"daily_reminder_{user_id}_{time}"
         
+        if _use_buckets():
+            first_run = datetime.fromtimestamp(
+                reminder_dispatcher.next_daily_minute(f"{hour:02d}:{minute:02d}", datetime.now()) * 60
+            )
+            await reminder_dispatcher.enqueue_reminder(
+                job_id, user_id, first_run, callback, list(args), kwargs, daily_at=f"{hour:02d}:{minute:02d}"
+            )
+            logger.info(f"Добавлено ежедневное напоминание для пользователя {user_id} в {time}")
+            return
+        
         trigger = CronTrigger(hour=hour, minute=minute)
         scheduler.add_job(
             callback,
@@ -49,6 +154,7 @@ async def add_daily_reminder(user_id: int, time: str, callback: Callable, *args,
             kwargs=kwargs,
             replace_existing=True
         )
+        _index_job(user_id, job_id)
         logger.info(f"Добавлено ежедневное напоминание для пользователя {user_id} в {time}")
     except Exception as e:
         logger.error(f"Ошибка при добавлении ежедневного напоминания: {e}")
@@ -61,20 +167,28 @@ async def add_one_time_reminder(user_id: int, reminder_time: datetime, callback:
     Args:
         user_id: ID пользователя
         reminder_time: Время напоминания
-        callback: Функция обратного вызова
-        *args, **kwargs: Аргументы для callback
+        callback: Функция обратного вызова уровня модуля (вызывается как callback(user_id, *args))
+        *args, **kwargs: Сериализуемые аргументы для callback
     """
     try:
         job_id = f"reminder_{user_id}_{reminder_time.timestamp()}"
         
+        if _use_buckets():
+            await reminder_dispatcher.enqueue_reminder(
+                job_id, user_id, reminder_time, callback, list(args), kwargs
+            )
+            logger.info(f"Добавлено одноразовое напоминание для пользователя {user_id} на {reminder_time}")
+            return
+        
         scheduler.add_job(
             callback,
             trigger=DateTrigger(run_date=reminder_time),
             id=job_id,
-            args=[*args, user_id],
+            args=[user_id, *args],
             kwargs=kwargs,
             replace_existing=True
         )
+        _index_job(user_id, job_id)
         logger.info(f"Добавлено одноразовое напоминание для пользователя {user_id} на {reminder_time}")
     except Exception as e:
         logger.error(f"Ошибка при добавлении одноразового напоминания: {e}")
@@ -88,12 +202,43 @@ async def remove_reminder(job_id: str):
         job_id: ID задачи
     """
     try:
+        if _use_buckets():
+            await reminder_dispatcher.remove_reminder(job_id)
+            logger.info(f"Удалено напоминание {job_id}")
+            return
+        
         scheduler.remove_job(job_id)
         logger.info(f"Удалено напоминание {job_id}")
+    except JobLookupError:
+        # Задачи уже нет (например, разовая уже выполнилась)
+        _unindex_job(job_id)
     except Exception as e:
         logger.error(f"Ошибка при удалении напоминания: {e}")
 
 
+async def remove_user_reminders(user_id: int) -> int:
+    """
+    Удаление всех напоминаний пользователя
+    
+    Args:
+        user_id: ID пользователя
+        
+    Returns:
+        int: Количество удаленных напоминаний
+    """
+    if _use_buckets():
+        count = await reminder_dispatcher.remove_user_reminders(user_id)
+        logger.info(f"Удалено напоминаний пользователя {user_id}: {count}")
+        return count
+    
+    job_ids = list(_user_jobs.get(user_id, ()))
+    for job_id in job_ids:
+        await remove_reminder(job_id)
+    if job_ids:
+        logger.info(f"Удалено напоминаний пользователя {user_id}: {len(job_ids)}")
+    return len(job_ids)
+
+
 async def get_user_reminders(user_id: int) -> list:
     """
     Получение всех напоминаний пользователя
@@ -104,13 +249,19 @@ async def get_user_reminders(user_id: int) -> list:
     Returns:
         list: Список напоминаний
     """
+    if _use_buckets():
+        return await reminder_dispatcher.get_user_reminders(user_id)
+    
     reminders = []
-    for job in scheduler.get_jobs():
-        if f"_{user_id}_" in job.id:
-            reminders.append({
-                "id": job.id,
-                "next_run": job.next_run_time,
-                "trigger": str(job.trigger)
-            })
+    for job_id in list(_user_jobs.get(user_id, ())):
+        job = scheduler.get_job(job_id)
+        if job is None:
+            _unindex_job(job_id)
+            continue
+        reminders.append({
+            "id": job.id,
+            "next_run": job.next_run_time,
+            "trigger": str(job.trigger)
+        })
     return reminders
 
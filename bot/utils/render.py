@@ -0,0 +1,90 @@
+"""
+Редактирование сообщений без лишних запросов к Bot API
+
+Для каждого сообщения запоминается хэш последнего отправленного содержимого
+(текст и клавиатура) и edit_date из ответа Telegram. Если пользователь
+повторно нажал кнопку и содержимое не изменилось, запрос editMessageText
+не отправляется - достаточно ответить на callback.
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
+import config
+from bot.utils.metrics import registry
+
+edits_skipped = registry.counter(
+    "bot_edits_skipped_total", "Повторные редактирования с тем же содержимым, не отправленные в Telegram"
+)
+
+# (chat_id, message_id) -> (хэш содержимого, edit_date сообщения после нашего редактирования)
+_last_content: "OrderedDict[Tuple[int, int], Tuple[bytes, Optional[int]]]" = OrderedDict()
+
+
+def _digest(text: str, reply_markup: Optional[InlineKeyboardMarkup]) -> bytes:
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else ""
+    return hashlib.blake2b(f"{text}\x00{markup}".encode(), digest_size=8).digest()
+
+
+def _remember(key: Tuple[int, int], digest: bytes, edit_date: Optional[int]):
+    _last_content[key] = (digest, edit_date)
+    _last_content.move_to_end(key)
+    while len(_last_content) > config.RENDER_HASH_MAX_ENTRIES:
+        _last_content.popitem(last=False)
+
+
+async def _skip(callback: CallbackQuery):
+    edits_skipped.inc()
+    try:
+        await callback.answer()
+    except TelegramBadRequest:
+        # На callback уже ответили в обработчике
+        pass
+
+
+async def edit_or_skip(callback: CallbackQuery, text: str,
+                       reply_markup: Optional[InlineKeyboardMarkup] = None,
+                       answer: bool = False, **kwargs) -> bool:
+    """
+    Редактирование сообщения с кнопкой, если его содержимое изменилось
+
+    Args:
+        callback: Нажатие кнопки
+        text: Новый текст
+        reply_markup: Новая клавиатура
+        answer: Ответить на callback и после успешного редактирования
+        **kwargs: Параметры edit_text (parse_mode и т.п.)
+
+    Returns:
+        bool: True если сообщение было отредактировано
+    """
+    message = callback.message
+    if not isinstance(message, Message):
+        # Недоступное сообщение - редактировать нечего
+        await _skip(callback)
+        return False
+
+    key = (message.chat.id, message.message_id)
+    digest = _digest(text, reply_markup)
+    last = _last_content.get(key)
+    # edit_date совпадает - с нашего редактирования сообщение никто не менял
+    if last is not None and last == (digest, message.edit_date):
+        _last_content.move_to_end(key)
+        await _skip(callback)
+        return False
+
+    try:
+        result = await message.edit_text(text, reply_markup=reply_markup, **kwargs)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+        _remember(key, digest, message.edit_date)
+        await _skip(callback)
+        return False
+
+    if isinstance(result, Message):
+        _remember(key, digest, result.edit_date)
+    if answer:
+        await callback.answer()
+    return True
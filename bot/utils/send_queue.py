@@ -0,0 +1,232 @@
+"""
+Общая очередь исходящих сообщений Telegram
+
+Все фоновые отправки (напоминания, уведомления о достижениях) проходят
+через одну очередь с приоритетами. Она соблюдает лимиты Telegram:
+общий (около 30 сообщений в секунду) и на один чат (около 1 в секунду).
+При ответе 429 сообщение откладывается на retry_after секунд и
+отправляется повторно, а вся очередь приостанавливается на это же время:
+ограничение Telegram действует на бота целиком, а не на один чат.
+
+Ответы обработчиков (message.answer, редактирование сообщений) идут в
+Telegram напрямую, минуя очередь, и ее приоритеты на них не влияют.
+"""
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+import config
+from bot.utils.logger import logger
+from bot.utils.rate_limit import TokenBucket
+
+# Классы приоритета: меньше - раньше. INTERACTIVE - фоновые сообщения, вызванные
+# действием пользователя (достижения, ошибки фоновой обработки), BULK - рассылки
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+_PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+
+class _Outgoing:
+    __slots__ = ("chat_id", "text", "kwargs", "priority", "future", "enqueued_at", "attempts")
+
+    def __init__(self, chat_id: int, text: str, kwargs: Dict[str, Any], priority: int,
+                 future: Optional[asyncio.Future]):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class SendQueue:
+    """
+    Очередь отправки с общим и поканальным token bucket
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, max_retries: int, concurrency: int):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.concurrency = concurrency
+        self._chat_buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._delayed: Dict[asyncio.TimerHandle, _Outgoing] = {}
+        self._inflight: set = set()
+        self._worker: Optional[asyncio.Task] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._bot = None
+        # Метрики
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._latencies: Dict[int, Deque[float]] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None
+
+    def start(self, bot):
+        """Запуск обработчика очереди"""
+        if self.running:
+            return
+        self._bot = bot
+        self._queue = asyncio.PriorityQueue()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._worker = asyncio.create_task(self._run())
+        logger.info("Очередь отправки сообщений запущена")
+
+    async def stop(self):
+        """Остановка очереди (неотправленные сообщения отменяются)"""
+        if not self.running:
+            return
+        self._worker.cancel()
+        for handle, item in list(self._delayed.items()):
+            handle.cancel()
+            self._cancel(item)
+        self._delayed.clear()
+        while not self._queue.empty():
+            self._cancel(self._queue.get_nowait()[2])
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        self._worker = None
+        logger.info("Очередь отправки сообщений остановлена")
+
+    async def send(self, chat_id: int, text: str, priority: int = PRIORITY_INTERACTIVE,
+                   wait: bool = False, **kwargs):
+        """
+        Постановка сообщения в очередь
+
+        Args:
+            chat_id: ID чата
+            text: Текст сообщения
+            priority: PRIORITY_INTERACTIVE или PRIORITY_BULK
+            wait: Дождаться отправки и вернуть Message (ошибки пробрасываются)
+            **kwargs: Параметры bot.send_message
+
+        Returns:
+            Message, если wait=True
+        """
+        if not self.running:
+            raise RuntimeError("Очередь отправки не запущена")
+        future = asyncio.get_running_loop().create_future() if wait else None
+        self._put(_Outgoing(chat_id, text, kwargs, priority, future))
+        if future is not None:
+            return await future
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики и задержка доставки (от постановки в очередь до ответа Telegram)"""
+        latency = {}
+        for priority, samples in self._latencies.items():
+            ordered = sorted(samples)
+            latency[_PRIORITY_NAMES.get(priority, str(priority))] = {
+                "p50": round(ordered[len(ordered) // 2], 3),
+                "p95": round(ordered[int(len(ordered) * 0.95)], 3),
+                "max": round(ordered[-1], 3),
+            }
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "delayed": len(self._delayed),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "latency": latency,
+        }
+
+    def _put(self, item: _Outgoing):
+        self._queue.put_nowait((item.priority, next(self._sequence), item))
+
+    def _put_later(self, item: _Outgoing, delay: float):
+        loop = asyncio.get_running_loop()
+        handle = None
+
+        def requeue():
+            self._delayed.pop(handle, None)
+            self._put(item)
+
+        handle = loop.call_later(delay, requeue)
+        self._delayed[handle] = item
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+            # Полные корзины ничего не помнят, их можно выбросить
+            if len(self._chat_buckets) > config.SEND_QUEUE_MAX_CHATS:
+                for idle_id in [cid for cid, b in self._chat_buckets.items() if b.is_idle()]:
+                    del self._chat_buckets[idle_id]
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _run(self):
+        while True:
+            _, _, item = await self._queue.get()
+
+            # Чат еще не готов - откладываем, не блокируя остальные чаты
+            wait = self._chat_bucket(item.chat_id).try_acquire()
+            if wait:
+                self._put_later(item, wait)
+                continue
+
+            await self.global_bucket.acquire()
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._deliver(item))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _deliver(self, item: _Outgoing):
+        try:
+            item.attempts += 1
+            message = await self._bot.send_message(item.chat_id, item.text, **item.kwargs)
+        except TelegramRetryAfter as e:
+            # Flood wait относится ко всему боту: остальные чаты тоже ждут
+            self.global_bucket.penalize(e.retry_after)
+            self._retry(item, e.retry_after, e)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            self._retry(item, min(2 ** item.attempts, 60), e)
+        except Exception as e:
+            self._fail(item, e)
+        else:
+            self.sent += 1
+            self._latencies.setdefault(item.priority, deque(maxlen=1000)).append(
+                time.monotonic() - item.enqueued_at
+            )
+            if item.future is not None and not item.future.done():
+                item.future.set_result(message)
+        finally:
+            self._semaphore.release()
+
+    def _retry(self, item: _Outgoing, delay: float, error: Exception):
+        if item.attempts > self.max_retries:
+            self._fail(item, error)
+            return
+        self.retried += 1
+        self._chat_bucket(item.chat_id).penalize(delay)
+        logger.warning(f"Повтор отправки в чат {item.chat_id} через {delay} с: {error}")
+        self._put_later(item, delay)
+
+    def _fail(self, item: _Outgoing, error: Exception):
+        self.failed += 1
+        logger.error(f"Не удалось отправить сообщение в чат {item.chat_id}: {error}")
+        if item.future is not None and not item.future.done():
+            item.future.set_exception(error)
+
+    def _cancel(self, item: _Outgoing):
+        if item.future is not None and not item.future.done():
+            item.future.cancel()
+
+
+# Глобальная очередь для использования в проекте
+send_queue = SendQueue(
+    global_rate=config.SEND_GLOBAL_RATE,
+    chat_rate=config.SEND_CHAT_RATE,
+    max_retries=config.SEND_MAX_RETRIES,
+    concurrency=config.SEND_CONCURRENCY
+)
@@ -0,0 +1,83 @@
+"""
+Кэш готовых экранов (текст и клавиатура)
+
+Экраны просмотра ДЗ и расписания хранятся по ключу (пользователь, экран, дата).
+Запись строк пользователя увеличивает его версию данных таблицы в SupabaseDB,
+и экран, построенный по старой версии, считается устаревшим. Записи других
+пользователей эту версию не меняют. Дата в ключе меняется в полночь,
+поэтому вчерашние экраны просто перестают запрашиваться и вытесняются.
+"""
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from aiogram.types import InlineKeyboardMarkup
+import config
+
+View = Tuple[str, Optional[InlineKeyboardMarkup]]
+
+
+class _Entry:
+    __slots__ = ("view", "version", "expires_at")
+
+    def __init__(self, view: View, version: Hashable, expires_at: float):
+        self.view = view
+        self.version = version
+        self.expires_at = expires_at
+
+
+class ViewCache:
+    """
+    LRU-кэш отрендеренных экранов с проверкой версии данных
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_render(self, user_id: int, view: str, day: date, version: Hashable,
+                            render: Callable[[], Awaitable[View]]) -> View:
+        """
+        Готовый экран из кэша или результат render()
+
+        Args:
+            user_id: ID пользователя
+            view: Имя экрана
+            day: Дата, от которой зависит экран
+            version: Текущая версия данных экрана (см. supabase_db.get_table_version)
+            render: Функция построения экрана, возвращает (текст, клавиатура)
+
+        Returns:
+            tuple: (текст, клавиатура)
+        """
+        key = (user_id, view, day)
+        entry = self._entries.get(key)
+        if entry is not None and entry.version == version and entry.expires_at > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.view
+
+        self.misses += 1
+        result = await render()
+        self._entries[key] = _Entry(result, version, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики кэша экранов"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+# Глобальный кэш экранов для использования в проекте
+view_cache = ViewCache(ttl=config.VIEW_CACHE_TTL, max_entries=config.VIEW_CACHE_MAX_ENTRIES)
@@ -0,0 +1,98 @@
+"""
+Получение обновлений через webhook
+
+Встроенный aiohttp-сервер принимает обновления от Telegram, проверяет
+секретный токен и сразу отвечает 200, а само обновление обрабатывается
+в фоне.
+
+Поддерживается один экземпляр бота: outbox, кэши, состояния FSM и задачи
+напоминаний хранятся в памяти и локальных файлах процесса.
+"""
+import asyncio
+import signal
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+import config
+from bot.utils.logger import logger
+
+
+def get_webhook_url() -> str:
+    """Полный адрес webhook из настроек"""
+    return config.WEBHOOK_BASE_URL.rstrip("/") + config.WEBHOOK_PATH
+
+
+def create_app(dp: Dispatcher, bot: Bot, secret_token: str) -> web.Application:
+    """
+    Создание aiohttp-приложения с обработчиком обновлений
+
+    Args:
+        dp: Диспетчер
+        bot: Бот
+        secret_token: Ожидаемое значение X-Telegram-Bot-Api-Secret-Token
+
+    Returns:
+        web.Application: Приложение
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=secret_token
+    ).register(app, path=config.WEBHOOK_PATH)
+    # startup/shutdown диспетчера вызываются вместе с приложением
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+def _wait_for_stop_signal() -> asyncio.Event:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: остановка через KeyboardInterrupt
+            pass
+    return stop
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """
+    Запуск бота в режиме webhook (работает до SIGINT/SIGTERM)
+
+    Args:
+        dp: Диспетчер
+        bot: Бот
+    """
+    if not config.WEBHOOK_BASE_URL:
+        raise ValueError("Для RUN_MODE=webhook нужно установить WEBHOOK_BASE_URL в .env")
+    if not config.WEBHOOK_SECRET:
+        raise ValueError("Для RUN_MODE=webhook нужно установить WEBHOOK_SECRET в .env")
+    secret_token = config.WEBHOOK_SECRET
+
+    app = create_app(dp, bot, secret_token)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.WEBAPP_HOST, port=config.WEBAPP_PORT)
+    await site.start()
+    logger.info(f"HTTP-сервер запущен на {config.WEBAPP_HOST}:{config.WEBAPP_PORT}")
+
+    try:
+        await bot.set_webhook(
+            url=get_webhook_url(),
+            secret_token=secret_token,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        logger.info(f"Webhook установлен: {get_webhook_url()}")
+
+        await _wait_for_stop_signal().wait()
+    finally:
+        if config.WEBHOOK_DELETE_ON_SHUTDOWN:
+            try:
+                await bot.delete_webhook()
+                logger.info("Webhook удален")
+            except Exception as e:
+                logger.error(f"Ошибка при удалении webhook: {e}")
+        await runner.cleanup()
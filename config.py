@@ -10,12 +10,64 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 # Supabase настройки
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
+# Количество потоков для запросов к Supabase (клиент синхронный)
+SUPABASE_IO_WORKERS = int(os.getenv("SUPABASE_IO_WORKERS", "8"))
+# Сколько строк отправлять в одном пакетном запросе (тело INSERT или список id в URL для DELETE)
+SUPABASE_BATCH_SIZE = int(os.getenv("SUPABASE_BATCH_SIZE", "500"))
+# Отложенная запись: новые ДЗ и расписание сначала сохраняются в локальный outbox,
+# а в Supabase отправляются фоном пачками (1 - включить).
+# Пока запись не отправлена, у строки временный отрицательный id
+SUPABASE_WRITE_BEHIND = os.getenv("SUPABASE_WRITE_BEHIND", "0") == "1"
+OUTBOX_FLUSH_INTERVAL = float(os.getenv("OUTBOX_FLUSH_INTERVAL", "1"))  # секунд
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+# После стольких попыток с временной ошибкой (сеть, 5xx) владелец записи получает уведомление
+# (отправка продолжается раз в OUTBOX_MAX_BACKOFF секунд). Записи, отклоненные сервером (4xx),
+# отмечаются failed сразу и ждут python -m bot.database.outbox redrive
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_MAX_BACKOFF = int(os.getenv("OUTBOX_MAX_BACKOFF", "300"))  # секунд
+
+# Кэш запросов к Supabase
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "30"))  # секунд
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1000"))
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(5 * 1024 * 1024)))
+# Кэш готовых экранов просмотра ДЗ и расписания
+VIEW_CACHE_TTL = int(os.getenv("VIEW_CACHE_TTL", "60"))  # секунд
+VIEW_CACHE_MAX_ENTRIES = int(os.getenv("VIEW_CACHE_MAX_ENTRIES", "5000"))
+# Сколько сообщений помнить для пропуска повторных одинаковых редактирований
+RENDER_HASH_MAX_ENTRIES = int(os.getenv("RENDER_HASH_MAX_ENTRIES", "10000"))
 
 # Пути к базам данных (для локальных БД, если нужны)
 DB_PATH = "data"
+# Все локальные таблицы в одном файле (старые отдельные файлы переносятся автоматически)
+DB_UNIFIED = os.getenv("DB_UNIFIED", "1") == "1"
+MAIN_DB = f"{DB_PATH}/bot.db"
 SCHEDULE_DB = f"{DB_PATH}/schedule.db"
 HOMEWORK_DB = f"{DB_PATH}/homework.db"
 NOTES_DB = f"{DB_PATH}/notes.db"
+SETTINGS_DB = f"{DB_PATH}/settings.db"
+ACHIEVEMENTS_DB = f"{DB_PATH}/achievements.db"
+REMINDERS_DB = f"{DB_PATH}/reminders.db"
+FSM_DB = f"{DB_PATH}/fsm.db"
+OUTBOX_DB = f"{DB_PATH}/outbox.db"
+
+# Хранилище состояний FSM: "sqlite" (переживает перезапуск) или "memory"
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+# Сколько состояний держать в памяти и как часто (секунд) сбрасывать изменения в базу.
+# Если несколько процессов работают с одной базой, задайте FSM_CACHE_SIZE=0 и FSM_FLUSH_INTERVAL=0
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1"))
+# Брошенный диалог сбрасывается через FSM_STATE_TTL секунд после последнего шага (0 - никогда)
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(24 * 60 * 60)))
+# Лимиты на все хранимые состояния (самые старые вытесняются) и период фоновой очистки
+FSM_MAX_ENTRIES = int(os.getenv("FSM_MAX_ENTRIES", "100000"))
+FSM_MAX_BYTES = int(os.getenv("FSM_MAX_BYTES", str(64 * 1024 * 1024)))
+FSM_SWEEP_INTERVAL = int(os.getenv("FSM_SWEEP_INTERVAL", "300"))
+
+# Количество соединений в пуле на каждую базу SQLite
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+# Кэш страниц SQLite на соединение (КБ) и размер mmap (байт)
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "8192"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
 
 # Путь к логам
 LOGS_PATH = f"{DB_PATH}/logs"
@@ -26,6 +78,50 @@ LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
 # Настройки напоминаний
 DEFAULT_REMINDER_TIME = "08:00"  # Время по умолчанию для напоминаний
+# Хранилище задач планировщика напоминаний
+SCHEDULER_DB = f"{DB_PATH}/scheduler.db"
+# Сколько секунд после назначенного времени пропущенное напоминание еще отправляется
+REMINDER_MISFIRE_GRACE_TIME = int(os.getenv("REMINDER_MISFIRE_GRACE_TIME", "3600"))
+# Режим доставки напоминаний:
+#   "jobs"    - отдельная задача APScheduler на каждое напоминание
+#   "buckets" - компактные записи в таблице по минутам и одна задача-диспетчер
+REMINDER_DISPATCH_MODE = os.getenv("REMINDER_DISPATCH_MODE", "jobs")
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "500"))
+REMINDER_SEND_CONCURRENCY = int(os.getenv("REMINDER_SEND_CONCURRENCY", "25"))
+# На сколько секунд диспетчер забирает напоминание на время отправки: если бот упадет,
+# после этого срока напоминание отправится повторно
+REMINDER_LEASE_TIME = int(os.getenv("REMINDER_LEASE_TIME", "900"))
+
+# Очередь исходящих сообщений (лимиты Telegram: ~30 сообщений/с всего, ~1/с в один чат)
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "28"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", "30"))
+SEND_QUEUE_MAX_CHATS = int(os.getenv("SEND_QUEUE_MAX_CHATS", "10000"))
+
+# Ограничение частоты: событий в секунду на пользователя, запас подряд,
+# сколько обработчиков выполняется одновременно и сколько корзин держать в памяти
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "2"))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "5"))
+HANDLER_CONCURRENCY = int(os.getenv("HANDLER_CONCURRENCY", "50"))
+THROTTLE_MAX_USERS = int(os.getenv("THROTTLE_MAX_USERS", "10000"))
+
+# Режим получения обновлений: "polling" (long polling) или "webhook"
+RUN_MODE = os.getenv("RUN_MODE", "polling")
+# Публичный адрес, на который Telegram отправляет обновления (https://example.com)
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ и -), обязателен для webhook
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Адрес встроенного HTTP-сервера
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+# Удалять webhook при остановке
+WEBHOOK_DELETE_ON_SHUTDOWN = os.getenv("WEBHOOK_DELETE_ON_SHUTDOWN", "1") == "1"
+
+# HTTP-сервер метрик Prometheus (GET /metrics); 0 - не запускать
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
 
 # Языки
 LANGUAGES = {
@@ -4,12 +4,23 @@ import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 
 import config
-from bot.database.supabase_db import get_db
+from bot.database.supabase_db import get_db, close_db, get_cache_stats, start_outbox
+from bot.database.outbox import outbox
+from bot.database.db import init_databases, close_databases
+from bot.database.fsm_storage import create_fsm_storage
+from bot.middlewares.callback_data import CallbackDataMiddleware
+from bot.middlewares.fsm_expiry import FSMExpiryMiddleware
+from bot.middlewares.throttling import create_throttling_middleware
+from bot.middlewares.metrics import BotAPIMetricsMiddleware, HandlerMetricsMiddleware
+from bot.middlewares.optimistic_ack import OptimisticAckMiddleware
 from bot.utils.logger import logger
-from bot.utils.reminder_scheduler import start_scheduler, stop_scheduler
+from bot.utils.reminder_scheduler import start_scheduler, stop_scheduler, set_bot
+from bot.utils.send_queue import send_queue
+from bot.utils.view_cache import view_cache
+from bot.utils.webhook import run_webhook
+from bot.utils.metrics import registry, flatten_stats, start_metrics_server, stop_metrics_server
 from bot.handlers import (
     start, schedule, homework, notes, reminders, progress, settings, errors
 )
@@ -41,12 +52,46 @@ async def main():
         logger.error(f"Ошибка при подключении к Supabase: {e}")
         return
     
+    # Инициализация локальных баз данных (соединения остаются открытыми)
+    await init_databases()
+    
+    # Фоновая отправка отложенных записей в Supabase (включая оставшиеся с прошлого запуска)
+    await start_outbox()
+    
     # Создание бота и диспетчера
     bot = Bot(
         token=config.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-    dp = Dispatcher(storage=MemoryStorage())
+    dp = Dispatcher(storage=create_fsm_storage())
+    
+    # Ограничение частоты (общий экземпляр: один лимит на сообщения и нажатия)
+    throttling = create_throttling_middleware()
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+    
+    # Сообщение об истекших диалогах FSM
+    dp.message.outer_middleware(FSMExpiryMiddleware())
+    dp.callback_query.outer_middleware(FSMExpiryMiddleware())
+    
+    # Разбор закодированной callback_data (один раз на нажатие, до обработчиков)
+    dp.callback_query.outer_middleware(CallbackDataMiddleware())
+    
+    # Мгновенный ответ на нажатия для обработчиков с флагом optimistic_ack
+    # (регистрируется до метрик, чтобы они замеряли фоновую работу)
+    optimistic_ack = OptimisticAckMiddleware(max_background=config.HANDLER_CONCURRENCY)
+    dp.callback_query.middleware(optimistic_ack)
+    
+    # Метрики: обработчики, запросы к Bot API и счетчики подсистем
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    bot.session.middleware(BotAPIMetricsMiddleware())
+    registry.add_collector(lambda: flatten_stats("bot_query_cache", get_cache_stats()))
+    registry.add_collector(lambda: flatten_stats("bot_view_cache", view_cache.stats()))
+    registry.add_collector(lambda: flatten_stats("bot_send_queue", send_queue.stats()))
+    registry.add_collector(lambda: flatten_stats("bot_outbox", outbox.stats()))
+    registry.add_collector(lambda: flatten_stats("bot_fsm", dp.storage.stats()) if hasattr(dp.storage, "stats") else {})
+    registry.add_collector(lambda: {"bot_throttled_total": throttling.throttled})
     
     # Регистрация роутеров
     dp.include_router(start.router)
@@ -58,17 +103,32 @@ async def main():
     dp.include_router(settings.router)
     dp.include_router(errors.router)
     
-    # Запуск планировщика напоминаний
+    # Очередь исходящих сообщений (напоминания, уведомления)
+    send_queue.start(bot)
+    
+    # Запуск планировщика напоминаний (задачи восстанавливаются из хранилища)
+    set_bot(bot)
     start_scheduler()
     
+    await start_metrics_server()
+    
     logger.info("Бот запущен!")
     
     try:
         # Запуск бота
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if config.RUN_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
         # Остановка планировщика
         stop_scheduler()
+        await optimistic_ack.drain()
+        await send_queue.stop()
+        await stop_metrics_server()
+        await outbox.stop()
+        close_db()
+        await close_databases()
         await bot.session.close()
 
 
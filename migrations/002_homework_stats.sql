@@ -0,0 +1,18 @@
+-- Агрегаты для экрана прогресса: счётчики считаются в базе,
+-- клиенту возвращается одна строка вместо всей таблицы homework
+
+-- Выполненным считается задание с прошедшим дедлайном (в схеме нет поля is_completed).
+-- Дата "сегодня" передаётся ботом, чтобы совпадать с его часовым поясом
+create or replace function homework_stats(p_today date)
+returns table (total bigint, completed bigint, pending bigint)
+language sql
+stable
+as $$
+    select
+        count(*) as total,
+        count(*) filter (where deadline < p_today) as completed,
+        count(*) filter (where deadline is null or deadline >= p_today) as pending
+    from homework;
+$$;
+
+grant execute on function homework_stats(date) to anon, authenticated;
@@ -0,0 +1,63 @@
+-- Разделение данных по пользователям: user_id (Telegram ID) в schedule и homework,
+-- тип time для времени пары и составные индексы под запросы одного пользователя
+
+-- Перед запуском укажите владельца старых строк (Telegram ID единственного пользователя бота):
+--   set app.legacy_user_id = '<telegram_id>';
+-- Без этого миграция остановится, если в таблицах есть строки, и ничего не изменит
+
+begin;
+
+alter table schedule add column if not exists user_id bigint;
+alter table homework add column if not exists user_id bigint;
+
+do $$
+declare
+    legacy_user_id bigint := nullif(current_setting('app.legacy_user_id', true), '')::bigint;
+begin
+    if legacy_user_id is not null then
+        update schedule set user_id = legacy_user_id where user_id is null;
+        update homework set user_id = legacy_user_id where user_id is null;
+    end if;
+    if exists (select 1 from schedule where user_id is null)
+        or exists (select 1 from homework where user_id is null) then
+        raise exception 'Есть строки без user_id: задайте app.legacy_user_id (см. начало файла)';
+    end if;
+end $$;
+
+-- Строка без владельца не видна ни одному пользователю: база такие строки не принимает
+alter table schedule alter column user_id set not null;
+alter table homework alter column user_id set not null;
+
+-- Время пары: текст "HH:MM" -> time (пустые значения становятся null)
+alter table schedule
+    alter column time type time using nullif(trim(time), '')::time;
+
+-- Составные индексы: фильтр по пользователю, затем по дате/предмету/времени
+create index if not exists idx_homework_user_deadline on homework(user_id, deadline);
+create index if not exists idx_homework_user_subject on homework(user_id, subject);
+create index if not exists idx_schedule_user_date_time on schedule(user_id, date, time);
+
+-- Одиночные индексы покрываются составными и только замедляют запись
+drop index if exists idx_schedule_date;
+drop index if exists idx_homework_deadline;
+drop index if exists idx_homework_subject;
+
+-- Статистика прогресса считается по заданиям одного пользователя
+drop function if exists homework_stats(date);
+
+create or replace function homework_stats(p_user_id bigint, p_today date)
+returns table (total bigint, completed bigint, pending bigint)
+language sql
+stable
+as $$
+    select
+        count(*) as total,
+        count(*) filter (where deadline < p_today) as completed,
+        count(*) filter (where deadline is null or deadline >= p_today) as pending
+    from homework
+    where user_id = p_user_id;
+$$;
+
+grant execute on function homework_stats(bigint, date) to anon, authenticated;
+
+commit;
@@ -0,0 +1,10 @@
+-- Идемпотентная отложенная запись: outbox бота присваивает каждой новой строке UUID
+-- и отправляет пачки как upsert по client_id, поэтому повтор после потерянного ответа
+-- не создает дубликат. Строки, добавленные напрямую, оставляют client_id пустым
+
+alter table schedule add column if not exists client_id uuid;
+alter table homework add column if not exists client_id uuid;
+
+-- on_conflict в PostgREST требует именно ограничение уникальности (NULL не конфликтуют)
+alter table schedule add constraint schedule_client_id_key unique (client_id);
+alter table homework add constraint homework_client_id_key unique (client_id);
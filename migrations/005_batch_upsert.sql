@@ -0,0 +1,71 @@
+-- Пакетное обновление и добавление строк пользователя одним RPC-запросом.
+-- p_rows - массив строк: элементы с id обновляют строку, только если она принадлежит
+-- p_user_id (чужие и несуществующие id пропускаются), элементы без id добавляются.
+-- Результат - (item_index, item): номер элемента в p_rows (с 0) и итоговая строка
+
+create or replace function upsert_homework_many(p_user_id bigint, p_rows jsonb)
+returns table (item_index int, item jsonb)
+language plpgsql
+as $$
+declare
+    element record;
+    saved homework;
+begin
+    for element in
+        select (ordinality - 1)::int as idx, value from jsonb_array_elements(p_rows) with ordinality
+    loop
+        if element.value->>'id' is null then
+            insert into homework (user_id, subject, hw, deadline)
+            values (p_user_id, element.value->>'subject', element.value->>'hw',
+                    (element.value->>'deadline')::date)
+            returning * into saved;
+        else
+            update homework
+            set subject = element.value->>'subject',
+                hw = element.value->>'hw',
+                deadline = (element.value->>'deadline')::date
+            where homework.id = (element.value->>'id')::bigint and homework.user_id = p_user_id
+            returning * into saved;
+            continue when not found;
+        end if;
+        item_index := element.idx;
+        item := to_jsonb(saved);
+        return next;
+    end loop;
+end;
+$$;
+
+create or replace function upsert_schedule_many(p_user_id bigint, p_rows jsonb)
+returns table (item_index int, item jsonb)
+language plpgsql
+as $$
+declare
+    element record;
+    saved schedule;
+begin
+    for element in
+        select (ordinality - 1)::int as idx, value from jsonb_array_elements(p_rows) with ordinality
+    loop
+        if element.value->>'id' is null then
+            insert into schedule (user_id, date, subject, time)
+            values (p_user_id, (element.value->>'date')::date, element.value->>'subject',
+                    (element.value->>'time')::time)
+            returning * into saved;
+        else
+            update schedule
+            set date = (element.value->>'date')::date,
+                subject = element.value->>'subject',
+                time = (element.value->>'time')::time
+            where schedule.id = (element.value->>'id')::bigint and schedule.user_id = p_user_id
+            returning * into saved;
+            continue when not found;
+        end if;
+        item_index := element.idx;
+        item := to_jsonb(saved);
+        return next;
+    end loop;
+end;
+$$;
+
+grant execute on function upsert_homework_many(bigint, jsonb) to anon, authenticated;
+grant execute on function upsert_schedule_many(bigint, jsonb) to anon, authenticated;
@@ -0,0 +1,38 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from bot.database.db import close_databases, init_databases  # noqa: E402
+
+_DB_SETTINGS = (
+    "MAIN_DB", "SCHEDULE_DB", "HOMEWORK_DB", "NOTES_DB", "SETTINGS_DB",
+    "ACHIEVEMENTS_DB", "REMINDERS_DB", "FSM_DB", "OUTBOX_DB",
+)
+
+
+@pytest.fixture
+def local_db(tmp_path, monkeypatch):
+    """Все локальные SQLite-базы во временной папке теста"""
+    monkeypatch.setattr(config, "DB_PATH", str(tmp_path))
+    for name in _DB_SETTINGS:
+        monkeypatch.setattr(config, name, str(tmp_path / f"{name.lower()}.db"))
+    return tmp_path
+
+
+@pytest.fixture
+def run_db(local_db):
+    """Запуск корутины в новом event loop с открытыми локальными базами"""
+    def run(coro):
+        async def wrapper():
+            await init_databases()
+            try:
+                return await coro
+            finally:
+                await close_databases()
+        return asyncio.run(wrapper())
+    return run
@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.exceptions import UnsupportedKeywordArgument
+from aiogram.types import CallbackQuery, Update, User
+
+import config
+from bot.keyboards.callbacks import (
+    HomeworkComplete, HomeworkDelete, HomeworkEditField, LanguageChoice,
+    NoteEdit, ScheduleEditField, ScheduleViewDay, ThemeChoice,
+)
+from bot.utils.callback_data import (
+    MAX_LENGTH, MalformedCallbackData, PayloadRouter, is_packed, pack, unpack,
+)
+
+
+@pytest.mark.parametrize("value", [
+    HomeworkComplete(42),
+    HomeworkDelete(-7),
+    HomeworkEditField("deadline", 3),
+    ScheduleViewDay(0),
+    ScheduleEditField("room", 2**40),
+    NoteEdit(1),
+    LanguageChoice(next(iter(config.LANGUAGES))),
+    ThemeChoice(list(config.THEMES)[-1]),
+])
+def test_pack_unpack_round_trip(value):
+    data = pack(value)
+    assert is_packed(data)
+    assert len(data.encode()) <= MAX_LENGTH
+    assert unpack(data) == value
+    assert type(unpack(data)) is type(value)
+
+
+def test_packed_format_is_stable():
+    assert pack(HomeworkComplete(42)) == "1hc:42"
+    assert pack(HomeworkEditField("task", 5)) == "1hf:task:5"
+
+
+@pytest.mark.parametrize("data", [
+    "0hc:1",        # другая версия формата
+    "1zz:1",        # неизвестный префикс
+    "1hc",          # не хватает поля
+    "1hc:1:2",      # лишнее поле
+    "1hc:x",        # не число
+    "1hc:",         # пустое число
+    "1hc:-",
+    "1hc:²",        # unicode-цифра
+    "1hf:bogus:1",  # значение вне Literal
+    "1dv:9",
+    "1hc:" + "1" * MAX_LENGTH,
+])
+def test_unpack_rejects_malformed(data):
+    with pytest.raises(MalformedCallbackData):
+        unpack(data)
+
+
+def test_static_buttons_are_not_packed():
+    assert not is_packed("homework_today")
+    assert not is_packed("")
+    assert not is_packed(None)
+
+
+def test_pack_rejects_separator_and_overflow():
+    with pytest.raises(ValueError):
+        pack(LanguageChoice("a:b"))
+    with pytest.raises(ValueError):
+        pack(HomeworkComplete(10 ** MAX_LENGTH))
+
+
+def test_payload_router_dispatches_by_type():
+    router = PayloadRouter()
+    calls = []
+
+    @router.callback_query(HomeworkComplete, flags={"ack": "done"})
+    async def complete(event, payload: HomeworkComplete):
+        calls.append(("complete", payload.item_id))
+
+    @router.callback_query(HomeworkDelete, lambda event: event == "allowed")
+    async def delete(event, payload: HomeworkDelete):
+        calls.append(("delete", payload.item_id))
+
+    async def scenario():
+        observer = router.callback_query
+        await observer.trigger("event", payload=HomeworkComplete(1))
+        # Фильтры после класса payload проверяются штатно
+        assert await observer.trigger("denied", payload=HomeworkDelete(2)) is UNHANDLED
+        await observer.trigger("allowed", payload=HomeworkDelete(3))
+        assert await observer.trigger("event", payload=NoteEdit(4)) is UNHANDLED
+
+    asyncio.run(scenario())
+    assert calls == [("complete", 1), ("delete", 3)]
+    handler = router.callback_query.table[HomeworkComplete].handlers[0]
+    assert handler.flags == {"ack": "done"}
+
+
+def test_payload_router_rejects_duplicates_and_unknown_kwargs():
+    router = PayloadRouter()
+
+    @router.callback_query(HomeworkComplete)
+    async def complete(event, payload):
+        pass
+
+    with pytest.raises(ValueError):
+        router.callback_query.register(complete, HomeworkComplete)
+    with pytest.raises(UnsupportedKeywordArgument):
+        router.callback_query.register(complete, HomeworkDelete, state="x")
+
+
+def test_payload_only_router_keeps_callback_query_in_allowed_updates():
+    dp = Dispatcher()
+    router = PayloadRouter()
+
+    @router.callback_query(HomeworkComplete)
+    async def complete(event, payload):
+        pass
+
+    dp.include_router(router)
+    assert dp.resolve_used_update_types() == ["callback_query"]
+    # Статическое нажатие не попадает в обработчик payload
+    assert asyncio.run(router.callback_query.trigger("event")) is UNHANDLED
+
+
+def test_legacy_callback_data_gets_an_answer(monkeypatch):
+    from bot.handlers import errors
+    from bot.middlewares.callback_data import MALFORMED_TEXT, CallbackDataMiddleware
+
+    answers = []
+
+    async def answer(self, text=None, show_alert=None, **kwargs):
+        answers.append((self.data, text))
+
+    monkeypatch.setattr(CallbackQuery, "answer", answer)
+    dp = Dispatcher()
+    dp.callback_query.outer_middleware(CallbackDataMiddleware())
+    router = PayloadRouter()
+    handled = []
+
+    @router.callback_query(HomeworkComplete)
+    async def complete(callback, payload):
+        handled.append(payload)
+
+    dp.include_router(router)
+    dp.include_router(errors.router)
+    bot = Bot("42:TEST")
+
+    async def press(data, update_id):
+        callback = CallbackQuery(
+            id=str(update_id), chat_instance="chat", data=data,
+            from_user=User(id=5, is_bot=False, first_name="Test"),
+        )
+        await dp.feed_update(bot, Update(update_id=update_id, callback_query=callback))
+
+    async def scenario():
+        await press("1hc:42", 1)
+        await press("complete_homework_42", 2)
+        await press("0hc:42", 3)
+        await bot.session.close()
+
+    asyncio.run(scenario())
+    assert handled == [HomeworkComplete(42)]
+    assert answers == [("complete_homework_42", MALFORMED_TEXT), ("0hc:42", MALFORMED_TEXT)]
@@ -0,0 +1,84 @@
+from aiogram.fsm.storage.base import StorageKey
+
+import config
+from bot.database.db import get_connection
+from bot.database.fsm_storage import SQLiteStorage
+
+
+def key(user_id):
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+def make_storage(cache_size=2, ttl=3600, max_entries=100):
+    # Запись в базу только по flush(): фоновый период намеренно большой
+    return SQLiteStorage(cache_size=cache_size, flush_interval=3600, ttl=ttl,
+                         max_entries=max_entries, max_bytes=10 ** 6, sweep_interval=3600)
+
+
+async def stored_keys():
+    async with get_connection(config.FSM_DB) as db:
+        async with db.execute("SELECT key FROM fsm_storage ORDER BY key") as cursor:
+            return [row["key"] for row in await cursor.fetchall()]
+
+
+def test_changes_are_batched_until_flush_and_survive_restart(run_db):
+    async def scenario():
+        storage = make_storage()
+        for user_id in (1, 2, 3):
+            await storage.set_state(key(user_id), f"Form:step{user_id}")
+            await storage.set_data(key(user_id), {"subject": f"s{user_id}"})
+        assert await stored_keys() == []
+        # Запись 1 вытеснена из LRU, но ее несохраненные изменения не потеряны
+        assert storage.stats()["cached"] == 2
+        assert await storage.get_state(key(1)) == "Form:step1"
+        await storage.flush()
+        assert len(await stored_keys()) == 3
+        await storage.close()
+
+        restarted = make_storage()
+        state = await restarted.get_state(key(2))
+        data = await restarted.get_data(key(2))
+        await restarted.close()
+        return state, data
+
+    assert run_db(scenario()) == ("Form:step2", {"subject": "s2"})
+
+
+def test_finished_dialog_is_deleted_on_flush(run_db):
+    async def scenario():
+        storage = make_storage()
+        await storage.set_state(key(1), "Form:step")
+        await storage.flush()
+        await storage.set_state(key(1), None)
+        await storage.set_data(key(1), {})
+        await storage.close()
+        return await stored_keys()
+
+    assert run_db(scenario()) == []
+
+
+def test_sweep_expires_old_records_and_evicts_over_limit(run_db):
+    async def scenario():
+        storage = make_storage(max_entries=2)
+        for user_id in (1, 2, 3, 4):
+            await storage.set_state(key(user_id), f"Form:step{user_id}")
+        await storage.flush()
+        async with get_connection(config.FSM_DB) as db:
+            # 1 брошен давно, 2 - самый старый из живых
+            await db.execute("UPDATE fsm_storage SET updated_at = 0 WHERE key LIKE '1:1:1:%'")
+            await db.execute("UPDATE fsm_storage SET updated_at = updated_at - 10 WHERE key LIKE '1:2:2:%'")
+            await db.commit()
+        storage._cache.clear()
+
+        await storage.sweep()
+        stats = storage.stats()
+        expired = storage.pop_expired(key(1))
+        states = [await storage.get_state(key(user_id)) for user_id in (1, 2, 3, 4)]
+        await storage.close()
+        return stats, expired, states
+
+    stats, expired, states = run_db(scenario())
+    assert stats["expired"] == 1
+    assert stats["evicted"] == 1
+    assert expired == "Form:step1"
+    assert states == [None, None, "Form:step3", "Form:step4"]
@@ -0,0 +1,233 @@
+import asyncio
+
+import pytest
+from postgrest.exceptions import APIError
+
+from bot.database.outbox import IDEMPOTENCY_KEY, SupabaseOutbox, is_transient_error
+
+
+class FakeSender:
+    """Supabase с уникальным client_id: повтор строки возвращает уже вставленную"""
+
+    def __init__(self, failures=0, delay=0.0, down_for=(), reject=(), lose_responses=0):
+        self.failures = failures
+        self.delay = delay
+        self.down_for = set(down_for)
+        self.reject = set(reject)
+        self.lose_responses = lose_responses
+        self.batches = []
+        self.stored = {}
+
+    async def __call__(self, table, rows):
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("supabase is down")
+        if any(row["user_id"] in self.down_for for row in rows):
+            raise APIError({"code": "PGRST001", "message": "database connection error"})
+        if any(row["n"] in self.reject for row in rows):
+            raise APIError({"code": "23514", "message": "check constraint violated"})
+        self.batches.append((table, [row["n"] for row in rows]))
+        created = []
+        for row in rows:
+            stored = self.stored.setdefault(row[IDEMPOTENCY_KEY], {**row, "id": 1000 + row["n"]})
+            created.append(stored)
+        if self.lose_responses:
+            self.lose_responses -= 1
+            raise asyncio.TimeoutError()
+        return created
+
+
+def make_outbox(sender, on_failure=None, max_attempts=10):
+    # max_backoff=0: строка после временной ошибки готова к повтору в следующем flush
+    outbox = SupabaseOutbox(flush_interval=60, batch_size=100, max_attempts=max_attempts, max_backoff=0)
+    outbox._sender = sender
+    outbox._on_failure = on_failure
+    return outbox
+
+
+def test_rows_are_sent_in_order_grouped_by_table(run_db):
+    sender = FakeSender()
+
+    async def scenario():
+        outbox = make_outbox(sender)
+        for n, table in enumerate(["homework", "homework", "schedule", "homework"]):
+            await outbox.add(table, {"n": n, "user_id": 1})
+        assert await outbox.flush() == 4
+        return outbox
+
+    outbox = run_db(scenario())
+    assert sender.batches == [("homework", [0, 1]), ("schedule", [2]), ("homework", [3])]
+    assert outbox.stats()["pending"] == 0
+    assert outbox.resolve(1) == 1000
+
+
+def test_transient_failure_holds_only_that_users_later_rows(run_db):
+    sender = FakeSender(down_for={1})
+
+    async def scenario():
+        outbox = make_outbox(sender)
+        await outbox.add("homework", {"n": 0, "user_id": 1})
+        await outbox.add("schedule", {"n": 1, "user_id": 2})
+        await outbox.add("homework", {"n": 2, "user_id": 2})
+        await outbox.add("homework", {"n": 3, "user_id": 1})
+        assert await outbox.flush() == 2
+        assert [row["n"] for row in outbox.pending_rows("homework")] == [0, 3]
+        sender.down_for.clear()
+        assert await outbox.flush() == 2
+        return outbox
+
+    outbox = run_db(scenario())
+    assert sender.batches == [("schedule", [1]), ("homework", [2]), ("homework", [0, 3])]
+    assert outbox.stats()["retries"] == 1
+
+
+def test_later_rows_of_same_user_wait_for_retry(run_db):
+    sender = FakeSender(failures=1)
+
+    async def scenario():
+        outbox = make_outbox(sender)
+        await outbox.add("homework", {"n": 0, "user_id": 1})
+        await outbox.add("schedule", {"n": 1, "user_id": 1})
+        assert await outbox.flush() == 0
+        assert len(outbox.pending_rows("schedule")) == 1
+        assert await outbox.flush() == 2
+        return outbox
+
+    run_db(scenario())
+    assert sender.batches == [("homework", [0]), ("schedule", [1])]
+
+
+def test_rejected_rows_are_isolated_and_dead_lettered(run_db):
+    sender = FakeSender(reject={1})
+    notified = []
+
+    async def on_failure(table, rows, rejected):
+        notified.append((table, [row["n"] for row in rows], rejected))
+
+    async def scenario():
+        outbox = make_outbox(sender, on_failure)
+        for n, user_id in enumerate([1, 2, 1, 3]):
+            await outbox.add("homework", {"n": n, "user_id": user_id})
+        assert await outbox.flush() == 3
+        assert outbox.pending_rows("homework") == []
+        # Отклоненная строка не возвращается в очередь при перезапуске
+        restarted = SupabaseOutbox(flush_interval=60, batch_size=100, max_attempts=10, max_backoff=0)
+        await restarted.start(FakeSender())
+        pending = restarted.stats()["pending"]
+        await restarted.stop()
+        return outbox, pending
+
+    outbox, pending = run_db(scenario())
+    assert sender.batches == [("homework", [0]), ("homework", [2, 3])]
+    assert notified == [("homework", [1], True)]
+    assert outbox.stats()["rejected"] == 1
+    assert outbox.stats()["retries"] == 0
+    assert pending == 0
+
+
+def test_retry_after_lost_response_does_not_duplicate(run_db):
+    sender = FakeSender(lose_responses=1)
+
+    async def scenario():
+        outbox = make_outbox(sender)
+        await outbox.add("homework", {"n": 0, "user_id": 1})
+        await outbox.add("homework", {"n": 1, "user_id": 1})
+        assert await outbox.flush() == 0
+        assert await outbox.flush() == 2
+        return outbox
+
+    outbox = run_db(scenario())
+    assert len(sender.batches) == 2
+    assert sorted(row["n"] for row in sender.stored.values()) == [0, 1]
+    assert outbox.resolve(1) == 1000
+
+
+def test_rows_are_not_dropped_after_max_attempts(run_db):
+    sender = FakeSender(failures=3)
+    notified = []
+
+    async def on_failure(table, rows, rejected):
+        notified.append((table, [row["n"] for row in rows], rejected))
+
+    async def scenario():
+        outbox = make_outbox(sender, on_failure, max_attempts=2)
+        await outbox.add("homework", {"n": 0, "user_id": 1})
+        await outbox.add("homework", {"n": 1, "user_id": 2})
+        for _ in range(3):
+            assert await outbox.flush() == 0
+        assert outbox.stats()["stalled"] == 2
+        assert len(outbox.pending_rows("homework")) == 2
+        assert await outbox.flush() == 2
+        return outbox
+
+    outbox = run_db(scenario())
+    # Уведомление один раз, когда строки исчерпали попытки
+    assert notified == [("homework", [0, 1], False)]
+    assert sender.batches == [("homework", [0, 1])]
+    assert outbox.stats()["stalled"] == 0
+
+
+@pytest.mark.parametrize("error, transient", [
+    (asyncio.TimeoutError(), True),
+    (ConnectionError(), True),
+    (APIError({"code": "PGRST001", "message": "connection"}), True),
+    (APIError({"code": "57014", "message": "statement timeout"}), True),
+    (APIError({"code": 503, "message": "no json"}), True),
+    (APIError({"code": "23505", "message": "duplicate"}), False),
+    (APIError({"code": "22P02", "message": "invalid input"}), False),
+    (APIError({"code": "PGRST204", "message": "unknown column"}), False),
+    (APIError({"code": 413, "message": "too large"}), False),
+])
+def test_transient_error_classification(error, transient):
+    assert is_transient_error(error) is transient
+
+
+def test_pending_rows_survive_restart(run_db):
+    sender = FakeSender()
+
+    async def scenario():
+        await make_outbox(FakeSender()).add("homework", {"n": 7, "user_id": 1})
+        restarted = SupabaseOutbox(flush_interval=60, batch_size=100, max_attempts=10, max_backoff=60)
+        await restarted.start(sender)
+        assert [row["n"] for row in restarted.pending_rows("homework")] == [7]
+        await restarted.stop()
+        return restarted
+
+    outbox = run_db(scenario())
+    assert sender.batches == [("homework", [7])]
+    assert outbox.stats()["pending"] == 0
+
+
+def test_stop_timeout_does_not_interrupt_batch_in_flight(run_db):
+    sender = FakeSender(delay=0.2)
+
+    async def scenario():
+        outbox = SupabaseOutbox(flush_interval=60, batch_size=100, max_attempts=10, max_backoff=60)
+        await outbox.start(sender)
+        await outbox.add("homework", {"n": 0, "user_id": 1})
+        await outbox.stop(timeout=0.01)
+        # После перезапуска отправленная строка не должна уйти повторно
+        again = SupabaseOutbox(flush_interval=60, batch_size=100, max_attempts=10, max_backoff=60)
+        await again.start(sender)
+        pending = again.stats()["pending"]
+        await again.stop()
+        return pending
+
+    assert run_db(scenario()) == 0
+    assert sender.batches == [("homework", [0])]
+
+
+def test_update_and_discard_check_owner(run_db):
+    async def scenario():
+        outbox = make_outbox(FakeSender())
+        row = await outbox.add("homework", {"n": 0, "user_id": 1, "hw": "old"})
+        entry_id = -row["id"]
+        assert not await outbox.update(entry_id, {"hw": "stolen"}, where={"user_id": 2})
+        assert not await outbox.discard(entry_id, where={"user_id": 2})
+        assert await outbox.update(entry_id, {"hw": "new"}, where={"user_id": 1})
+        assert outbox.pending_rows("homework")[0]["hw"] == "new"
+        assert await outbox.discard(entry_id, where={"user_id": 1})
+        return outbox.pending_rows("homework")
+
+    assert run_db(scenario()) == []
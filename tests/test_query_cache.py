@@ -0,0 +1,127 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bot.database.cache import QueryCache
+from bot.database.supabase_db import SupabaseDB
+
+
+class Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class SlowQuery:
+    """Запрос, который отвечает только после release.set()"""
+
+    def __init__(self, server, table):
+        self.server = server
+        self.table = table
+        self.user_id = None
+
+    def select(self, *args):
+        return self
+
+    def eq(self, column, value):
+        if column == "user_id":
+            self.user_id = value
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def execute(self):
+        self.server.fetches.append(self.user_id)
+        self.server.release.wait(5)
+        return Result([{"id": self.user_id, "user_id": self.user_id, "deadline": None}])
+
+
+class SlowSupabase:
+    def __init__(self):
+        self.fetches = []
+        self.release = threading.Event()
+
+    def table(self, name):
+        return SlowQuery(self, name)
+
+
+@pytest.fixture
+def db():
+    instance = SupabaseDB.__new__(SupabaseDB)
+    instance.supabase = SlowSupabase()
+    instance._executor = ThreadPoolExecutor(max_workers=4)
+    instance.cache = QueryCache(ttl=30, max_entries=100, max_bytes=10 ** 6)
+    instance._in_flight = {}
+    yield instance
+    instance.supabase.release.set()
+    instance._executor.shutdown(wait=True)
+
+
+async def _started(db, count):
+    # Ждем, пока запросы дойдут до "сервера"
+    while len(db.supabase.fetches) < count:
+        await asyncio.sleep(0.01)
+
+
+def test_concurrent_identical_reads_share_one_fetch(db):
+    async def scenario():
+        reads = [asyncio.ensure_future(db.get_homework(1)) for _ in range(5)]
+        await _started(db, 1)
+        await asyncio.sleep(0.05)
+        db.supabase.release.set()
+        results = await asyncio.gather(*reads)
+        # Результат сохранен в кэш: следующее чтение обходится без запроса
+        results.append(await db.get_homework(1))
+        return results
+
+    results = asyncio.run(scenario())
+    assert db.supabase.fetches == [1]
+    assert all(rows == results[0] for rows in results)
+
+
+def test_other_users_write_does_not_break_coalescing(db):
+    async def scenario():
+        first = asyncio.ensure_future(db.get_homework(1))
+        await _started(db, 1)
+        db.cache.invalidate("homework", row={"id": 7, "user_id": 2}, row_id=7)
+        second = asyncio.ensure_future(db.get_homework(1))
+        await asyncio.sleep(0.05)
+        db.supabase.release.set()
+        await asyncio.gather(first, second)
+        await db.get_homework(1)
+
+    asyncio.run(scenario())
+    assert db.supabase.fetches == [1]
+
+
+def test_own_write_starts_a_new_fetch(db):
+    async def scenario():
+        first = asyncio.ensure_future(db.get_homework(1))
+        await _started(db, 1)
+        db.cache.invalidate("homework", user_id=1)
+        second = asyncio.ensure_future(db.get_homework(1))
+        await _started(db, 2)
+        db.supabase.release.set()
+        await asyncio.gather(first, second)
+        await db.get_homework(1)
+
+    asyncio.run(scenario())
+    # Результат первого запроса мог устареть: к нему не присоединяются и его не кэшируют,
+    # а результат второго сохраняется
+    assert db.supabase.fetches == [1, 1]
+
+
+def test_versions_are_scoped_per_user():
+    cache = QueryCache(ttl=30, max_entries=100, max_bytes=10 ** 6)
+    mine = cache.version("homework", 1)
+    cache.invalidate("homework", row={"user_id": 2})
+    assert cache.version("homework", 1) == mine
+    assert cache.generation("homework", "1") == mine
+    cache.invalidate("homework", row={"user_id": 1})
+    assert cache.version("homework", 1) != mine
+    # Запись без владельца меняет версии всех пользователей
+    theirs = cache.version("homework", 2)
+    cache.invalidate("homework")
+    assert cache.version("homework", 2) != theirs
@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from bot.utils.send_queue import SendQueue
+
+
+class FakeBot:
+    """Отвечает 429 на первое сообщение в flood_chat, остальные отправляет сразу"""
+
+    def __init__(self, flood_chat, retry_after):
+        self.flood_chat = flood_chat
+        self.retry_after = retry_after
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id == self.flood_chat and self.retry_after:
+            retry_after, self.retry_after = self.retry_after, 0
+            raise TelegramRetryAfter(
+                method=SendMessage(chat_id=chat_id, text=text), message="flood", retry_after=retry_after,
+            )
+        self.sent.append((chat_id, text, time.monotonic()))
+        return text
+
+
+def test_retry_after_pauses_whole_queue():
+    bot = FakeBot(flood_chat=1, retry_after=1)
+
+    async def scenario():
+        queue = SendQueue(global_rate=100, chat_rate=100, max_retries=3, concurrency=1)
+        queue.start(bot)
+        started = time.monotonic()
+        first = asyncio.create_task(queue.send(1, "flooded", wait=True))
+        await asyncio.sleep(0.05)
+        # Другой чат не упирался в лимит, но 429 действует на бота целиком
+        await queue.send(2, "other", wait=True)
+        await first
+        stats = queue.stats()
+        await queue.stop()
+        return started, stats
+
+    started, stats = asyncio.run(scenario())
+    assert [chat_id for chat_id, _, _ in bot.sent] == [2, 1]
+    assert bot.sent[0][2] - started >= 0.9
+    assert stats["sent"] == 2
+    assert stats["retried"] == 1
+    assert stats["failed"] == 0
@@ -0,0 +1,208 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import config
+from bot.database.cache import QueryCache
+from bot.database.outbox import SupabaseOutbox
+import bot.database.supabase_db as supabase_db
+from bot.database.supabase_db import SupabaseDB, homework_row
+
+
+class Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    """Минимальный построитель запросов PostgREST поверх словаря строк"""
+
+    def __init__(self, server, table):
+        self.server = server
+        self.table = table
+        self.operation = ("select", None)
+        self.filters = []
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def insert(self, rows):
+        self.operation = ("insert", rows if isinstance(rows, list) else [rows])
+        return self
+
+    def update(self, changes):
+        self.operation = ("update", changes)
+        return self
+
+    def delete(self):
+        self.operation = ("delete", None)
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = list(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def execute(self):
+        kind, argument = self.operation
+        rows = self.server.rows.setdefault(self.table, {})
+        self.server.requests.append((self.table, kind, argument))
+        matched = [row for row in rows.values() if all(check(row) for check in self.filters)]
+        if kind == "insert":
+            created = []
+            for row in argument:
+                assert "id" not in row, "id назначает база"
+                self.server.next_id += 1
+                rows[self.server.next_id] = {**row, "id": self.server.next_id}
+                created.append(dict(rows[self.server.next_id]))
+            return Result(created)
+        if kind == "update":
+            for row in matched:
+                row.update(argument)
+        elif kind == "delete":
+            for row in matched:
+                del rows[row["id"]]
+        return Result([dict(row) for row in matched])
+
+
+class FakeUpsertRpc:
+    """upsert_<table>_many из migrations/005_batch_upsert.sql"""
+
+    def __init__(self, server, table, params):
+        self.server = server
+        self.table = table
+        self.params = params
+
+    def execute(self):
+        user_id = self.params["p_user_id"]
+        self.server.requests.append((self.table, "rpc", self.params["p_rows"]))
+        rows = self.server.rows.setdefault(self.table, {})
+        saved = []
+        for index, item in enumerate(self.params["p_rows"]):
+            values = {key: value for key, value in item.items() if key not in ("id", "user_id")}
+            if item.get("id") is None:
+                self.server.next_id += 1
+                row = rows[self.server.next_id] = {**values, "id": self.server.next_id, "user_id": user_id}
+            else:
+                row = rows.get(item["id"])
+                if row is None or row["user_id"] != user_id:
+                    continue
+                row.update(values)
+            saved.append({"item_index": index, "item": dict(row)})
+        return Result(saved)
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.rows = {}
+        self.requests = []
+        self.next_id = 100
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        assert name.startswith("upsert_") and name.endswith("_many")
+        return FakeUpsertRpc(self, name[len("upsert_"):-len("_many")], params)
+
+
+@pytest.fixture
+def db(local_db, monkeypatch):
+    monkeypatch.setattr(config, "SUPABASE_WRITE_BEHIND", False)
+    monkeypatch.setattr(supabase_db, "outbox", SupabaseOutbox(
+        flush_interval=60, batch_size=100, max_attempts=10, max_backoff=60,
+    ))
+    instance = SupabaseDB.__new__(SupabaseDB)
+    instance.supabase = FakeSupabase()
+    instance._executor = ThreadPoolExecutor(max_workers=2)
+    instance.cache = QueryCache(ttl=30, max_entries=100, max_bytes=10 ** 6)
+    instance._in_flight = {}
+    yield instance
+    instance._executor.shutdown(wait=True)
+
+
+def seed(db, row_id, user_id, subject):
+    db.supabase.rows.setdefault("homework", {})[row_id] = {
+        "id": row_id, **homework_row(user_id, subject, "task"),
+    }
+
+
+def test_upsert_updates_only_own_rows(db, run_db):
+    seed(db, 1, user_id=1, subject="mine")
+    seed(db, 2, user_id=2, subject="foreign")
+
+    results = run_db(db.upsert_homework_many(1, [
+        {"id": 1, "subject": "mine v2", "hw": "task"},
+        {"id": 2, "subject": "stolen", "hw": "task"},
+        {"id": 555, "subject": "missing", "hw": "task"},
+    ]))
+
+    assert results[0]["subject"] == "mine v2"
+    assert results[1] is None
+    assert results[2] is None
+    assert len(db.supabase.requests) == 1
+    rows = db.supabase.rows["homework"]
+    assert rows[2]["subject"] == "foreign"
+    assert rows[2]["user_id"] == 2
+    assert 555 not in rows
+
+
+def test_upsert_inserts_rows_without_id(db, run_db):
+    seed(db, 1, user_id=1, subject="mine")
+
+    results = run_db(db.upsert_homework_many(1, [
+        {"subject": "new", "hw": "task"},
+        {"id": 1, "subject": "mine v2", "hw": "task"},
+    ]))
+
+    assert results[0]["id"] == 101
+    assert results[0]["user_id"] == 1
+    assert results[1]["id"] == 1
+    # Вставка и обновление - один RPC-запрос
+    assert [kind for _, kind, _ in db.supabase.requests] == ["rpc"]
+
+
+def test_upsert_sends_one_rpc_per_batch(db, run_db, monkeypatch):
+    monkeypatch.setattr(config, "SUPABASE_BATCH_SIZE", 2)
+
+    results = run_db(db.upsert_homework_many(1, [
+        {"subject": f"new {n}", "hw": "task"} for n in range(5)
+    ]))
+
+    assert [row["subject"] for row in results] == [f"new {n}" for n in range(5)]
+    assert [len(rows) for _, _, rows in db.supabase.requests] == [2, 2, 1]
+
+
+def test_upsert_leaves_foreign_pending_rows_alone(db, run_db):
+    async def scenario():
+        pending = await supabase_db.outbox.add("homework", homework_row(1, "pending", "task"))
+        results = await db.upsert_homework_many(2, [
+            {"id": pending["id"], "subject": "stolen", "hw": "task"},
+        ])
+        return results, supabase_db.outbox.pending_rows("homework")
+
+    results, pending = run_db(scenario())
+    assert results == [None]
+    assert [row["subject"] for row in pending] == ["pending"]
+    assert db.supabase.requests == []
+
+
+def test_upsert_changes_own_pending_row_in_place(db, run_db):
+    async def scenario():
+        pending = await supabase_db.outbox.add("homework", homework_row(1, "pending", "task"))
+        results = await db.upsert_homework_many(1, [
+            {"id": pending["id"], "subject": "edited", "hw": "task"},
+        ])
+        return results, supabase_db.outbox.pending_rows("homework")
+
+    results, pending = run_db(scenario())
+    assert results[0]["subject"] == "edited"
+    assert [row["subject"] for row in pending] == ["edited"]
+    assert db.supabase.requests == []
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from aiogram.types import CallbackQuery, Chat, Message, User
+
+from bot.middlewares.throttling import THROTTLED_TEXT, ThrottlingMiddleware
+
+USER = User(id=5, is_bot=False, first_name="Test")
+
+
+@pytest.fixture
+def answers(monkeypatch):
+    sent = []
+
+    async def answer(self, text=None, **kwargs):
+        sent.append((type(self).__name__, text))
+
+    monkeypatch.setattr(Message, "answer", answer)
+    monkeypatch.setattr(CallbackQuery, "answer", answer)
+    return sent
+
+
+def message(text="hi"):
+    return Message(
+        message_id=1, date=datetime(2026, 1, 1), text=text,
+        chat=Chat(id=USER.id, type="private"), from_user=USER,
+    )
+
+
+def press(data="homework_today"):
+    return CallbackQuery(id="1", chat_instance="chat", data=data, from_user=USER)
+
+
+def deliver(middleware, events, state=None):
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event)
+
+    async def scenario():
+        for event in events:
+            await middleware(handler, event, {"event_from_user": USER, "raw_state": state})
+
+    asyncio.run(scenario())
+    return handled
+
+
+def make_middleware():
+    # Почти без пополнения: в тесте корзина наполняется только вручную
+    return ThrottlingMiddleware(rate=0.001, burst=2, concurrency=4, max_users=100)
+
+
+def test_messages_over_burst_are_dropped_with_one_warning(answers):
+    middleware = make_middleware()
+
+    handled = deliver(middleware, [message() for _ in range(5)])
+
+    assert len(handled) == 2
+    assert answers == [("Message", THROTTLED_TEXT)]
+    assert middleware.throttled == 3
+
+
+def test_warning_is_repeated_after_user_gets_through(answers):
+    middleware = make_middleware()
+    deliver(middleware, [message() for _ in range(3)])
+    middleware._buckets[USER.id].tokens = 1
+
+    handled = deliver(middleware, [message(), message()])
+
+    assert len(handled) == 1
+    assert answers == [("Message", THROTTLED_TEXT), ("Message", THROTTLED_TEXT)]
+
+
+def test_every_throttled_press_is_answered(answers):
+    middleware = make_middleware()
+
+    handled = deliver(middleware, [press() for _ in range(4)])
+
+    # Без ответа на нажатие у пользователя крутится индикатор загрузки
+    assert len(handled) == 2
+    assert answers == [("CallbackQuery", THROTTLED_TEXT)] * 2
+
+
+def test_fsm_dialog_replies_bypass_the_limit(answers):
+    middleware = make_middleware()
+    deliver(middleware, [message() for _ in range(3)])
+
+    handled = deliver(middleware, [message("answer") for _ in range(5)], state="HomeworkStates:subject")
+    assert len(handled) == 5
+    # Нажатия внутри диалога по-прежнему ограничены
+    assert deliver(middleware, [press()], state="HomeworkStates:subject") == []